@@ -1,4 +1,14 @@
-from beast2xml.beast2 import BEAST2XML
+# BEAST2XML is imported on first use, so modules that do not need it (and its
+# imports of pandas, ete3 and dark-matter), such as beast2xml.client, are quick
+# to import.
+
+
+def __getattr__(name):
+    if name == "BEAST2XML":
+        from beast2xml.beast2 import BEAST2XML
+
+        return BEAST2XML
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 
 __all__ = ["BEAST2XML"]
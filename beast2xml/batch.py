@@ -0,0 +1,330 @@
+from __future__ import print_function, division
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from copy import deepcopy
+from importlib.resources import files
+
+import pandas as pd
+from dark.fasta import FastaReads
+
+from beast2xml.beast2 import BEAST2XML, _parse_template
+from beast2xml.cache import RenderCache
+
+
+# The manifest keys that are passed to BEAST2XML.to_xml, with the types their
+# (CSV string) values are converted to.
+TO_XML_ARGUMENTS = {
+    "chain_length": int,
+    "default_age": float,
+    "date_direction": str,
+    "log_file_basename": str,
+    "trace_log_every": int,
+    "tree_log_every": int,
+    "screen_log_every": int,
+    "store_state_every": int,
+    "target_samples": int,
+    "max_tree_log_bytes": int,
+    "mimic_beauti": lambda value: str(value).lower() in ("1", "true", "yes"),
+}
+
+# The manifest keys describing the inputs of a job.
+INPUT_ARGUMENTS = (
+    "output",
+    "template",
+    "clock_model",
+    "sequences",
+    "ages",
+    "age_column",
+    "dates",
+    "date_column",
+    "sample_id_field",
+    "separator",
+    "initial_tree",
+)
+
+# The manifest keys that are paths to input files.
+INPUT_FILES = ("template", "sequences", "ages", "dates", "initial_tree")
+
+# Per-process caches of parsed templates, ingested alignments and age tables,
+# so jobs rendered by the same process share them. Jobs are sorted by template
+# and alignment (see render_many), so only the most recently used alignment and
+# age table are kept.
+_templates = {}
+_alignments = {}
+_age_tables = {}
+
+
+def read_manifest(path):
+    """
+    Read a manifest of jobs from a CSV or JSON file.
+
+    A CSV manifest has one job per row, with columns named as in
+    C{INPUT_ARGUMENTS} and C{TO_XML_ARGUMENTS}. Empty cells are ignored. A JSON
+    manifest is a list of objects with the same keys.
+
+    Parameters
+    ----------
+    path: str
+        Path to a .csv, .tsv or .json manifest file.
+
+    Returns
+    -------
+    jobs: list of dict
+    """
+    if path.endswith(".json"):
+        with open(path) as fp:
+            jobs = json.load(fp)
+        if not isinstance(jobs, list):
+            raise ValueError("A JSON manifest must contain a list of jobs.")
+    else:
+        with open(path, newline="") as fp:
+            delimiter = "\t" if path.endswith(".tsv") else ","
+            jobs = [
+                {key: value for key, value in row.items() if value not in (None, "")}
+                for row in csv.DictReader(fp, delimiter=delimiter)
+            ]
+    return [_check_job(job) for job in jobs]
+
+
+def _check_job(job):
+    """
+    Check the keys of a job and convert its to_xml arguments to their types.
+    """
+    unknown = set(job) - set(INPUT_ARGUMENTS) - set(TO_XML_ARGUMENTS)
+    if unknown:
+        raise ValueError(
+            "Unknown manifest key(s): %s." % ", ".join(sorted(unknown))
+        )
+    if "output" not in job:
+        raise ValueError("Every manifest job must give an output path.")
+    job = dict(job)
+    for key, type_ in TO_XML_ARGUMENTS.items():
+        if job.get(key) is not None:
+            job[key] = type_(job[key])
+    return job
+
+
+def _template_key(job):
+    if job.get("template"):
+        return ("template", job["template"])
+    return ("clock_model", job.get("clock_model", "strict"))
+
+
+def _load_template(job):
+    key = _template_key(job)
+    kind, name = key
+    if kind == "template":
+        # Check the modification time, so a long-lived process (see
+        # beast2xml.server) notices a changed template.
+        mtime = os.stat(name).st_mtime_ns
+        if key not in _templates or _templates[key][0] != mtime:
+            _templates[key] = (mtime, _parse_template(name))
+    elif key not in _templates:
+        _templates[key] = (
+            None,
+            _parse_template(files("beast2xml").joinpath(f"templates/{name}.xml")),
+        )
+    return deepcopy(_templates[key][1])
+
+
+def _load_alignment(path):
+    key = (path, os.stat(path).st_mtime_ns)
+    if key not in _alignments:
+        _alignments.clear()
+        _alignments[key] = list(FastaReads(path))
+    return _alignments[key]
+
+
+def _load_age_table(path, separator):
+    key = (path, separator, os.stat(path).st_mtime_ns)
+    if key not in _age_tables:
+        _age_tables.clear()
+        _age_tables[key] = pd.read_csv(path, sep=separator)
+    return _age_tables[key]
+
+
+def job_key(job, cache):
+    """
+    Get the cache key of a job: a hash of the content of its input files (see
+    C{RenderCache.file_digest}) and its other arguments.
+
+    Parameters
+    ----------
+    job: dict
+        A job, as returned by C{read_manifest}.
+    cache: beast2xml.cache.RenderCache
+
+    Returns
+    -------
+    key: str
+    """
+    if not job.get("template"):
+        job = dict(
+            job,
+            template=str(
+                files("beast2xml").joinpath(
+                    "templates/%s.xml" % job.get("clock_model", "strict")
+                )
+            ),
+        )
+    return cache.key(
+        {
+            key: cache.file_digest(value) if key in INPUT_FILES else value
+            for key, value in job.items()
+            if key not in ("output", "clock_model")
+        }
+    )
+
+
+def render_job(job, cache=None):
+    """
+    Render the XML for one manifest job, unless its output already exists.
+
+    The output is written to a temporary file that is renamed once complete,
+    so an interrupted run never leaves a partial output that would be skipped
+    on restart.
+
+    Parameters
+    ----------
+    job: dict
+        A job, as returned by C{read_manifest}.
+    cache: beast2xml.cache.RenderCache, default None
+        If given, the output is taken from the cache if a job with the same
+        inputs (see C{job_key}) has been rendered before, and stored in it
+        otherwise.
+
+    Returns
+    -------
+    result: dict
+        With keys "output", "status" ("rendered", "cached", "skipped" or
+        "failed") and "error" (an error message, or C{None}).
+    """
+    output = job["output"]
+    if os.path.exists(output) and os.path.getsize(output) > 0:
+        return {"output": output, "status": "skipped", "error": None}
+    tmp = "%s.tmp-%d" % (output, os.getpid())
+    try:
+        directory = os.path.dirname(output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if cache is not None:
+            key = job_key(job, cache)
+            if cache.fetch(key, output):
+                return {"output": output, "status": "cached", "error": None}
+        xml = BEAST2XML(template=_load_template(job))
+        if job.get("sequences"):
+            xml.add_sequences(_load_alignment(job["sequences"]))
+        separator = job.get("separator", "\t")
+        if job.get("ages"):
+            xml.add_ages(
+                _load_age_table(job["ages"], separator),
+                age_column=job.get("age_column", "year_decimal"),
+            )
+        if job.get("dates"):
+            date_column = job.get("date_column", "date")
+            dates = _load_age_table(job["dates"], separator)
+            dates = dates.assign(**{date_column: pd.to_datetime(dates[date_column])})
+            xml.add_dates(
+                dates,
+                sample_id_field=job.get("sample_id_field", "strain"),
+                collection_date_field=date_column,
+            )
+        if job.get("initial_tree"):
+            xml.add_initial_tree(job["initial_tree"])
+        xml.to_xml(
+            tmp,
+            **{
+                key: job[key]
+                for key in TO_XML_ARGUMENTS
+                if job.get(key) is not None
+            },
+        )
+        if cache is not None:
+            cache.store(key, tmp)
+        os.replace(tmp, output)
+    except Exception as e:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return {"output": output, "status": "failed", "error": str(e)}
+    return {"output": output, "status": "rendered", "error": None}
+
+
+def _render_chunk(jobs, cache=None):
+    """
+    Render the XML for a list of jobs (see C{render_job}) in one process.
+    """
+    return [render_job(job, cache=cache) for job in jobs]
+
+
+def render_many(jobs, workers=None, progress=None, cache=None):
+    """
+    Render the XML for many jobs in a pool of worker processes.
+
+    Jobs are ordered so that those sharing a template and alignment are
+    rendered by the same worker, which parses the template and reads the
+    alignment only once. Workers are given the ordered jobs in chunks, and
+    progress is reported as each chunk completes. Jobs whose output already
+    exists are skipped, so an interrupted batch can simply be run again.
+
+    Parameters
+    ----------
+    jobs: str or list of dict
+        The path to a manifest (see C{read_manifest}) or a list of jobs.
+    workers: int, default None
+        The number of worker processes. If C{None}, the number of CPUs is used.
+        If 1, jobs are rendered in the calling process.
+    progress: callable, default None
+        If not C{None}, called as C{progress(done, total, result)} after each
+        job completes, where C{result} is as returned by C{render_job}.
+    cache: str or beast2xml.cache.RenderCache, default None
+        A render cache (or the directory of one) to take the outputs of jobs
+        whose inputs have not changed from, and to store new outputs in (see
+        C{render_job}).
+
+    Returns
+    -------
+    results: list of dict
+        The C{render_job} results, in the order jobs were given.
+    """
+    if isinstance(jobs, str):
+        jobs = read_manifest(jobs)
+    else:
+        jobs = [_check_job(job) for job in jobs]
+    total = len(jobs)
+    order = sorted(
+        range(total),
+        key=lambda index: (_template_key(jobs[index]), jobs[index].get("sequences", "")),
+    )
+    workers = workers or os.cpu_count() or 1
+    results = [None] * total
+    if isinstance(cache, str):
+        cache = RenderCache(cache)
+    done = 0
+
+    def collect(indices, chunk_results):
+        nonlocal done
+        for index, result in zip(indices, chunk_results):
+            results[index] = result
+            done += 1
+            if progress:
+                progress(done, total, result)
+
+    if workers == 1:
+        for index in order:
+            collect([index], [render_job(jobs[index], cache=cache)])
+    else:
+        chunk_size = max(1, total // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for start in range(0, total, chunk_size):
+                indices = order[start : start + chunk_size]
+                future = executor.submit(
+                    _render_chunk, [jobs[index] for index in indices], cache
+                )
+                futures[future] = indices
+            for future in as_completed(futures):
+                collect(futures[future], future.result())
+
+    return results
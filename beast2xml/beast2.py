@@ -1,19 +1,43 @@
 from __future__ import print_function, division
+import asyncio
+import hashlib
 import os
 import re
 import six
 from datetime import date
-from beast2xml.date_utilities import date_to_decimal
+from beast2xml.date_utilities import (
+    date_to_decimal,
+    dates_to_decimals,
+    decimals_to_dates,
+)
 import xml.etree.ElementTree as ET
 import xml
+import xml.parsers.expat
+from xml.sax.saxutils import escape
 import ete3
 import warnings
 from importlib.resources import files
-from dark.reads import Reads
+from dark.reads import Read, Reads
 from dark.fasta import FastaReads
 import pandas as pd
 from copy import deepcopy
+from functools import lru_cache, partial
+import threading
 import numpy as np
+from beast2xml.cache import RenderCache
+from beast2xml.metrics import RenderMetrics, peak_rss
+from beast2xml.partitions import (
+    columns_filter,
+    filter_columns,
+    partition_filters,
+    read_bed,
+    read_gff,
+    site_classes,
+)
+from beast2xml.skeleton import TemplateSkeleton
+from beast2xml.storage import DiskReads, parse_size
+from beast2xml.trace import TraceLog
+from beast2xml.treelog import graft_tips, last_tree
 
 
 def delete_child_nodes(node):
@@ -25,9 +49,9 @@ def delete_child_nodes(node):
     node: xml.etree.ElementTree.Element
 
     """
-    # Delete any existing children of xml node.
-    for child in list(node):
-        node.remove(child)
+    # Delete any existing children of xml node (all at once, as removing them
+    # one by one takes quadratic time).
+    del node[:]
 
 def _two_df_cols_to_dict(df, key, value):
     return df[[key, value]].set_index(key).to_dict()[value]
@@ -55,16 +79,656 @@ def get_indexes_of_attribute(et_element, attribute, value):
     ]
     return indexes
 
+
+# The id of the <sequence> element standing in for the sequences of a streamed
+# alignment (see BEAST2XML.to_xml).
+_SEQUENCE_PLACEHOLDER = "beast2xml-streamed-sequences"
+
+
+def _sequence_ids(sequences):
+    """
+    Get the ids of sequences, without reading sequences kept on disk.
+
+    Parameters
+    ----------
+    sequences: dark.reads.Reads or beast2xml.storage.DiskReads
+
+    Returns
+    -------
+    list of str
+    """
+    if isinstance(sequences, DiskReads):
+        return sequences.ids()
+    return [sequence.id for sequence in sequences]
+
+
+class _RenderCancelled(Exception):
+    """
+    Raised in a rendering thread when the reader of its chunks has gone.
+    """
+
+
+class _ChunkWriter(object):
+    """
+    A text file-like object that passes what is written to it on as UTF-8
+    chunks of about C{chunk_size} characters.
+
+    Parameters
+    ----------
+    put: callable
+        Called with each chunk (bytes).
+    chunk_size: int
+    """
+
+    def __init__(self, put, chunk_size):
+        self._put = put
+        self._chunk_size = chunk_size
+        self._parts = []
+        self._size = 0
+
+    def write(self, text):
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self._chunk_size:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self._parts:
+            self._put("".join(self._parts).encode("utf-8"))
+            self._parts = []
+            self._size = 0
+
+
+def _escape_attribute(text):
+    """
+    Escape text for use as an XML attribute value, as ElementTree does.
+    """
+    for character, entity in (
+        ("&", "&amp;"),
+        ("<", "&lt;"),
+        (">", "&gt;"),
+        ('"', "&quot;"),
+        ("\r", "&#13;"),
+        ("\n", "&#10;"),
+        ("\t", "&#09;"),
+    ):
+        if character in text:
+            text = text.replace(character, entity)
+    return text
+
+
+def _age_dict(age_data, seperator="\t", age_column="year_decimal"):
+    """
+    Convert age data (see C{BEAST2XML.add_ages}) to a C{dict} of ages keyed by
+    sequence id.
+    """
+    if isinstance(age_data, str):
+        age_data = pd.read_csv(age_data, sep=seperator)
+    if isinstance(age_data, pd.DataFrame):
+        if "id" in age_data.columns:
+            age_data = age_data.set_index("id")
+        elif "strain" in age_data.columns:
+            age_data = age_data.set_index("strain")
+        else:
+            raise ValueError("An age_data column must be id or strain")
+        age_data = age_data[age_column]
+    if isinstance(age_data, pd.Series):
+        age_data = age_data.to_dict()
+    if not isinstance(age_data, dict):
+        raise ValueError(
+            "age_data must be a C{dict} a C{pd.DataFrame}, a C{pd.Series} or a path to tsv/csv."
+        )
+    return age_data
+
+
+def _round_interval(interval):
+    """
+    Round a logging interval up to two significant figures.
+
+    Parameters
+    ----------
+    interval: int
+
+    Returns
+    -------
+    int
+    """
+    scale = 10 ** max(len(str(interval)) - 2, 0)
+    return -(-interval // scale) * scale
+
+
+# A start tag, allowing for ">" in quoted attribute values.
+_START_TAG = re.compile(
+    rb"""<[^\s/>]+(?:\s+[^\s=]+\s*=\s*(?:"[^"]*"|'[^']*'))*\s*/?>"""
+)
+
+_TRAIT_PATH = ["run", "state", "tree", "trait"]
+_INIT_PATH = ["run", "init"]
+
+
+def _merge_in_order(existing, new, key):
+    """
+    Insert items into a sequence in sorted position: each new item goes before
+    the first existing item whose key is greater.
+
+    Parameters
+    ----------
+    existing: iterable
+    new: list
+        Sorted by C{key}.
+    key: callable
+
+    Returns
+    -------
+    list
+    """
+    merged = []
+    index = 0
+    for item in existing:
+        item_key = key(item)
+        while index < len(new) and key(new[index]) < item_key:
+            merged.append(new[index])
+            index += 1
+        merged.append(item)
+    merged.extend(new[index:])
+    return merged
+
+
+class _XMLUpdater(object):
+    """
+    Copy BEAST2 XML from one file to another, adding sequences and ages on the
+    way (see C{BEAST2XML.update_xml}).
+
+    The input is parsed incrementally with expat, and its byte offsets are used
+    to copy the input unchanged except where new sequences are inserted into the
+    first <data> element and where the dateTrait and (if there is a tree to
+    graft the new taxa onto) the <init> element are rewritten. Only the input
+    since the last place that may need changing is held in memory.
+
+    Parameters
+    ----------
+    sequences: list of dark.reads.Read
+        The new sequences, sorted by short id.
+    ages: dict
+        The ages of the new sequences, keyed by short id.
+    out: file
+        Open in binary mode.
+    tree: ete3.Tree, default None
+        A tree of the existing taxa to graft the new taxa onto and use as the
+        initial tree. If None and the <init> element holds a Newick tree, the
+        new taxa are grafted onto that.
+    """
+
+    def __init__(self, sequences, ages, out, tree=None):
+        self._sequences = sequences
+        self._next = 0
+        self._ages = ages
+        self._out = out
+        self._tree = tree
+        self._buffer = bytearray()
+        self._base = 0
+        self._hold = None
+        self._stack = []
+        self._data = None
+        self._sequence_indent = None
+        self._trait = None
+        self._init = None
+        self.existing = set()
+
+    def run(self, fp, chunk_size=1 << 20):
+        """
+        Copy the XML.
+
+        Parameters
+        ----------
+        fp: file
+            Open in binary mode.
+        chunk_size: int, default 1 << 20
+            The number of bytes to read at a time.
+        """
+        parser = xml.parsers.expat.ParserCreate()
+        parser.ordered_attributes = True
+        parser.buffer_text = True
+        parser.StartElementHandler = self._start
+        parser.EndElementHandler = self._end
+        parser.CharacterDataHandler = self._text
+        self._parser = parser
+        while True:
+            chunk = fp.read(chunk_size)
+            self._buffer += chunk
+            parser.Parse(chunk, not chunk)
+            if not chunk:
+                break
+            if self._hold is None and not (self._data and self._data["open"]):
+                # Keep any tag that has not been completely read yet.
+                tag = self._buffer.rfind(b"<")
+                self._flush(self._base + (len(self._buffer) if tag == -1 else tag))
+        self._flush(self._base + len(self._buffer))
+        if self._data is None:
+            raise ValueError("Could not find 'data' tag in XML.")
+        if self._trait is None:
+            raise ValueError("Could not find './run/state/tree/trait' tag in XML.")
+        if self._tree is not None and self._init is None:
+            raise ValueError("Could not find './run/init' tag in XML.")
+
+    def _flush(self, position):
+        self._out.write(self._buffer[: position - self._base])
+        self._skip(position)
+
+    def _skip(self, position):
+        del self._buffer[: position - self._base]
+        self._base = position
+
+    def _write(self, text):
+        self._out.write(text.encode("utf-8"))
+
+    def _element_end(self, start, end_index):
+        """
+        Get the position after an element, given the positions of its start and
+        end tags.
+        """
+        if end_index == start:
+            # expat reports the end of an empty element (<x ... />) at its start.
+            return self._base + _START_TAG.match(self._buffer, start - self._base).end()
+        return self._base + self._buffer.index(b">", end_index - self._base) + 1
+
+    @staticmethod
+    def _sequence_xml(sequence):
+        short_id = _escape_attribute(sequence.id.split()[0])
+        return (
+            '<sequence id="seq_%s" spec="Sequence" taxon="%s" '
+            'totalcount="4" value="%s" />'
+            % (short_id, short_id, _escape_attribute(sequence.sequence))
+        )
+
+    @staticmethod
+    def _start_tag(name, attributes, empty):
+        return "<%s%s%s" % (
+            name,
+            "".join(
+                ' %s="%s"' % (key, _escape_attribute(value))
+                for key, value in attributes
+            ),
+            " />" if empty else ">",
+        )
+
+    def _start(self, name, attributes):
+        index = self._parser.CurrentByteIndex
+        self._stack.append(name)
+        path = self._stack[1:]
+        attributes = list(zip(attributes[::2], attributes[1::2]))
+        if name == "data" and "constantSiteWeights" in dict(attributes):
+            raise ValueError(
+                "Sequences cannot be added to XML whose invariant sites have been "
+                "stripped."
+            )
+        if self._data is None and path == ["data"]:
+            self._data = {
+                "id": dict(attributes).get("id"),
+                "start": index,
+                "open": True,
+                "length": None,
+            }
+        elif self._data and self._data["open"] and path == ["data", "sequence"]:
+            # This flushes up to the sequence, after adding any new ones before it.
+            self._add_sequences_before(index, dict(attributes))
+            return
+        elif self._trait is None and path == _TRAIT_PATH:
+            self._trait = {"start": index, "attributes": attributes, "text": []}
+            self._hold = index
+        elif self._init is None and path == _INIT_PATH:
+            self._init = {"start": index, "attributes": attributes}
+            if self._tree is not None or "newick" in dict(attributes):
+                self._hold = index
+        if self._hold is None:
+            self._flush(index)
+
+    def _text(self, text):
+        if self._hold is not None and self._stack[1:] == _TRAIT_PATH:
+            self._trait["text"].append(text)
+
+    def _end(self, name):
+        index = self._parser.CurrentByteIndex
+        path = self._stack[1:]
+        self._stack.pop()
+        if self._hold is not None and path == _TRAIT_PATH:
+            self._update_trait(index)
+        elif self._hold is not None and path == _INIT_PATH:
+            self._update_init(index)
+        elif self._data and self._data["open"] and path == ["data"]:
+            self._add_remaining_sequences(index)
+            self._data["open"] = False
+
+    def _add_sequences_before(self, index, attributes):
+        taxon = attributes.get("taxon")
+        if taxon is None:
+            taxon = attributes.get("id", "").split("seq_", 1)[-1]
+        self.existing.add(taxon)
+        if self._data["length"] is None and "value" in attributes:
+            length = self._data["length"] = len(attributes["value"])
+            for sequence in self._sequences:
+                if len(sequence.sequence) != length:
+                    raise ValueError(
+                        "Sequence %r has length %d but the alignment has length "
+                        "%d." % (sequence.id, len(sequence.sequence), length)
+                    )
+        line_start = self._buffer.rfind(b"\n", 0, index - self._base) + 1
+        indent = self._buffer[line_start : index - self._base].decode("utf-8")
+        if self._sequence_indent is None:
+            self._sequence_indent = indent
+        self._flush(index)
+        while (
+            self._next < len(self._sequences)
+            and self._sequences[self._next].id.split()[0] < taxon
+        ):
+            self._write(self._sequence_xml(self._sequences[self._next]) + "\n" + indent)
+            self._next += 1
+
+    def _add_remaining_sequences(self, index):
+        if self._next == len(self._sequences):
+            return
+        if index == self._data["start"]:
+            raise ValueError("Sequences cannot be added to an empty <data /> element.")
+        # Add the sequences after the last child, before the whitespace
+        # preceding </data>.
+        end = len(self._buffer[: index - self._base].rstrip())
+        if self._sequence_indent is None:
+            line_start = self._buffer.rfind(b"\n", 0, index - self._base) + 1
+            self._sequence_indent = (
+                self._buffer[line_start : index - self._base].decode("utf-8") + "\t"
+            )
+        self._flush(self._base + end)
+        for sequence in self._sequences[self._next :]:
+            self._write("\n" + self._sequence_indent + self._sequence_xml(sequence))
+        self._next = len(self._sequences)
+
+    def _update_trait(self, index):
+        start = self._trait["start"]
+        attributes = self._trait["attributes"]
+        values = dict(attributes)
+        text = "".join(self._trait["text"])
+        in_value = bool(values.get("value", "").strip()) or not text.strip()
+        existing = values.get("value", "") if in_value else text
+        if "dateFormat" in values:
+            ids, ages = _parse_trait_text(existing)
+            entries = [
+                (id_, str(age)) for id_, age in zip(ids.tolist(), ages.tolist())
+            ]
+            attributes = [item for item in attributes if item[0] != "dateFormat"]
+        else:
+            entries = [
+                (id_.strip(), value.strip())
+                for id_, value in (
+                    item.rsplit("=", 1) for item in existing.split(",") if item.strip()
+                )
+            ]
+        duplicates = {id_ for id_, _ in entries} & set(self._ages)
+        if duplicates:
+            raise ValueError(
+                "The XML already has an age for: %s." % ", ".join(sorted(duplicates))
+            )
+        entries = _merge_in_order(
+            entries,
+            sorted((id_, str(age)) for id_, age in self._ages.items()),
+            key=lambda entry: entry[0],
+        )
+        trait_text = ",".join(id_ + "=" + value for id_, value in entries)
+        self._trait["merged"] = trait_text
+        empty = index == start
+        self._flush(start)
+        if in_value:
+            attributes = [
+                (key, trait_text if key == "value" else value)
+                for key, value in attributes
+            ]
+            if "value" not in values:
+                attributes.append(("value", trait_text))
+            self._write(self._start_tag("trait", attributes, empty))
+            self._skip(self._element_end(start, start))
+        else:
+            text = ",\n".join(id_ + "=" + value for id_, value in entries) + "\n"
+            self._write(self._start_tag("trait", attributes, False) + escape(text))
+            self._skip(index)
+        self._hold = None
+
+    def _update_init(self, index):
+        start = self._init["start"]
+        values = dict(self._init["attributes"])
+        if self._trait is None or "merged" not in self._trait:
+            raise ValueError(
+                "The dateTrait must come before the initial tree to graft new "
+                "taxa onto it."
+            )
+        tree = self._tree
+        if tree is None:
+            if values.get("IsLabelledNewick", "false").lower() != "true":
+                raise ValueError(
+                    "New taxa can only be grafted onto a labelled Newick initial tree."
+                )
+            tree = ete3.Tree(values["newick"], format=1)
+        extra = set(tree.get_leaf_names()) - self.existing
+        missing = self.existing - set(tree.get_leaf_names())
+        if extra or missing:
+            raise ValueError(
+                "The initial tree does not have the same taxa as the XML (%d "
+                "missing, %d extra)." % (len(missing), len(extra))
+            )
+        ids, ages = _parse_trait_text(self._trait["merged"])
+        if dict(self._trait["attributes"]).get("traitname") == "date-backward":
+            heights = ages - ages.min()
+        else:
+            heights = ages.max() - ages
+        tree = graft_tips(tree, dict(zip(ids.tolist(), heights.tolist())))
+        data_id = self._data["id"]
+        end = self._element_end(start, index)
+        self._flush(start)
+        self._write(
+            self._start_tag(
+                "init",
+                [
+                    ("id", "NewickTree.t:" + data_id),
+                    ("spec", "beast.util.TreeParser"),
+                    ("IsLabelledNewick", "true"),
+                    ("adjustTipHeights", "true"),
+                    ("initial", "@Tree.t:" + data_id),
+                    ("taxa", "@" + data_id),
+                    ("newick", tree.write(format=5, dist_formatter="%0.10g")),
+                ],
+                True,
+            )
+        )
+        self._skip(end)
+        self._hold = None
+
+
+class _TemplateTreeBuilder(ET.TreeBuilder):
+    """
+    Build an XML template without building the children of its <data> element
+    (the one found by C{BEAST2XML.find_elements}). Any alignment embedded in the
+    template is replaced when XML is generated, so it is skipped while parsing
+    instead of being built and then deleted.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._depth = 0
+        self._data_found = False
+        self._skip_depth = None
+
+    def start(self, tag, attrs):
+        self._depth += 1
+        if self._skip_depth is not None:
+            return None
+        element = super().start(tag, attrs)
+        if not self._data_found and self._depth == 2 and tag == "data":
+            self._data_found = True
+            self._skip_depth = self._depth
+        return element
+
+    def end(self, tag):
+        self._depth -= 1
+        if self._skip_depth is not None:
+            if self._depth >= self._skip_depth:
+                return None
+            self._skip_depth = None
+        return super().end(tag)
+
+    def data(self, data):
+        if self._skip_depth is None:
+            super().data(data)
+
+    @property
+    def data_found(self):
+        return self._data_found
+
+    @property
+    def skipping(self):
+        return self._skip_depth is not None
+
+
+def _parse_template(source, chunk_size=1 << 20):
+    """
+    Incrementally parse an XML template, skipping the children of its <data>
+    element. Once the <data> start tag has been parsed, the input is scanned for
+    the matching end tag without being parsed, so the time and memory taken do
+    not depend on the size of any alignment embedded in the template.
+
+    Parameters
+    ----------
+    source: str, pathlib.Path or file
+        A filename or an open file pointer to read the XML template from.
+    chunk_size: int, default 1 << 20
+        The number of bytes (or characters) to read at a time.
+
+    Returns
+    -------
+    xml.etree.ElementTree.ElementTree
+    """
+    builder = _TemplateTreeBuilder()
+    parser = ET.XMLParser(target=builder)
+    # Expat may defer parsing a tag until more input arrives (expat >= 2.6),
+    # so parsing is flushed whenever the builder must see a tag at once.
+    flush = getattr(parser, "flush", lambda: None)
+    if hasattr(source, "read"):
+        fp = source
+    else:
+        fp = open(source, "rb")
+    try:
+        buffer = fp.read(chunk_size)
+        at_end = not buffer
+        if isinstance(buffer, bytes):
+            start_tag = re.compile(rb"<data[\s/>]")
+            data_tag = re.compile(rb"<(/?)data[\s/>]")
+            tag_close, empty_close = b">", b"/>"
+        else:
+            start_tag = re.compile(r"<data[\s/>]")
+            data_tag = re.compile(r"<(/?)data[\s/>]")
+            tag_close, empty_close = ">", "/>"
+        # The length of the longest unmatched prefix of a data tag.
+        keep = len("</data")
+        # The number of skipped <data> elements still open inside the <data>
+        # element whose children are being skipped.
+        nesting = 0
+        while True:
+            if builder.skipping:
+                match = data_tag.search(buffer)
+                if match is None:
+                    # Keep enough to match a tag split across reads.
+                    buffer = buffer[-keep:]
+                else:
+                    index = buffer.find(tag_close, match.start())
+                    if index == -1:
+                        buffer = buffer[match.start():]
+                    elif not match.group(1):
+                        if not buffer.endswith(empty_close, 0, index + 1):
+                            nesting += 1
+                        buffer = buffer[index + 1:]
+                        continue
+                    elif nesting:
+                        nesting -= 1
+                        buffer = buffer[index + 1:]
+                        continue
+                    else:
+                        parser.feed(buffer[match.start(): index + 1])
+                        flush()
+                        buffer = buffer[index + 1:]
+                        continue
+            elif not builder.data_found:
+                match = start_tag.search(buffer)
+                if match:
+                    index = buffer.find(tag_close, match.start())
+                    if index != -1:
+                        parser.feed(buffer[: index + 1])
+                        flush()
+                        buffer = buffer[index + 1:]
+                        continue
+                    parser.feed(buffer[: match.start()])
+                    buffer = buffer[match.start():]
+                elif len(buffer) > keep:
+                    parser.feed(buffer[:-keep])
+                    buffer = buffer[-keep:]
+            else:
+                parser.feed(buffer)
+                buffer = buffer[:0]
+            if at_end:
+                if not builder.skipping:
+                    parser.feed(buffer)
+                break
+            chunk = fp.read(chunk_size)
+            at_end = not chunk
+            buffer += chunk
+    finally:
+        if fp is not source:
+            fp.close()
+    return ET.ElementTree(parser.close())
+
+
+@lru_cache(maxsize=32)
+def _parse_trait_text(text):
+    """
+    Parse the id=value items of a trait into ids and float64 ages (year decimals
+    for dates). Results are cached against the text, so the arrays returned are
+    read-only.
+
+    Parameters
+    ----------
+    text: str
+        Trait text, as found in the value attribute or text of a trait element.
+
+    Returns
+    -------
+    ids: numpy.ndarray of str
+    ages: numpy.ndarray of float64
+    """
+    pairs = [item.rsplit("=", 1) for item in text.split(",") if item.strip()]
+    if not pairs or any(len(pair) != 2 for pair in pairs):
+        raise ValueError('Could not convert age/date information in xml into a date or float')
+    ids, values = zip(*pairs)
+    ids = np.array([id_.strip() for id_ in ids])
+    values = [value.strip() for value in values]
+    try:
+        ages = np.array(values, dtype=np.float64)
+    except ValueError:
+        try:
+            ages = dates_to_decimals(pd.to_datetime(values, format="mixed"))
+        except (ValueError, TypeError):
+            raise ValueError('Could not convert age/date information in xml into a date or float') from None
+    ids.flags.writeable = False
+    ages.flags.writeable = False
+    return ids, ages
+
+
 class BEAST2XML(object):
     """
     Create BEAST2 XML instance.
 
     Parameters
     ----------
-    template: str, default=None
+    template: str, file or xml.etree.ElementTree.ElementTree, default=None
         A filename or an open file pointer to read the
-        XML template from. If C{None}, a template based on C{clockModel}
-        will be used.
+        XML template from, or an already parsed template. If C{None}, a template
+        based on C{clockModel} will be used.
     clock_model: str, default="strict"
         Clock model to be used. Possible values
         are 'random-local', 'relaxed-exponential', 'relaxed-lognormal',
@@ -84,11 +748,32 @@ class BEAST2XML(object):
     date_unit: str, default="year"
         A C{str}, either 'day', 'month', or 'year' indicating the
         date time unit.
+    metrics: beast2xml.metrics.RenderMetrics, default=None
+        Where to record the duration and size of each stage of building and
+        rendering the XML (available as the C{metrics} attribute). If C{None},
+        a new C{RenderMetrics} is made. Pass one instance to several builders to
+        record them together.
+    memory_limit: int or str, default=None
+        A memory budget in bytes, or with a K, M, G or T suffix (e.g. "8G"). If
+        given, the peak memory use of each stage is recorded in C{metrics}, and
+        once the added sequences would take more than their share of the budget
+        (see C{SEQUENCE_MEMORY_FRACTION}) they are moved to a temporary file and
+        C{to_xml} streams them into its output instead of building them into the
+        XML tree. See C{memory_report}.
 
     """
 
     TRACELOG_SUFFIX = ".log"
     TREELOG_SUFFIX = ".trees"
+    # Approximate numbers of bytes BEAST writes for a logged number (or branch
+    # length) and for the rate metadata of a tree node, used to estimate the
+    # sizes of logs (see plan_logging).
+    LOG_VALUE_BYTES = 20
+    TREE_METADATA_BYTES = 26
+    # The fraction of the memory limit (above the memory in use when a builder
+    # is made) that sequences may take before they are moved to disk. The rest
+    # is left for the element tree and serialisation.
+    SEQUENCE_MEMORY_FRACTION = 0.5
     _rate_change_to_param_dict = {
         "birthRateChangeTimes": "reproductiveNumber",
         "deathRateChangeTimes": "becomeUninfectiousRate",
@@ -115,13 +800,27 @@ class BEAST2XML(object):
         sequence_id_age_regex=None,
         sequence_id_regex_must_match=True,
         date_unit="year",
+        metrics=None,
+        memory_limit=None,
     ):
+        self.metrics = RenderMetrics() if metrics is None else metrics
+        self._memory_limit = None if memory_limit is None else parse_size(memory_limit)
+        if self._memory_limit is not None:
+            self.metrics.track_memory = True
+            self._memory_baseline = peak_rss() or 0
+        self._sequence_bytes = 0
+        self._streamed_sequences = None
+        stopwatch = self.metrics.start()
         if template is None:
-            self._tree = ET.parse(
+            self._tree = _parse_template(
                 files("beast2xml").joinpath(f"templates/{clock_model}.xml")
             )
+        elif isinstance(template, ET.ElementTree):
+            self._tree = template
         else:
-            self._tree = ET.parse(template)
+            self._tree = _parse_template(template)
+        self._skeleton = None
+        stopwatch.lap("template")
         if sequence_id_date_regex is None:
             self._sequence_id_date_regex = None
         else:
@@ -134,14 +833,170 @@ class BEAST2XML(object):
 
         self._sequence_id_regex_must_match = sequence_id_regex_must_match
         self._sequences = Reads()
+        # A digest of the added sequences, updated as they are added, for
+        # render_key.
+        self._sequence_digest = hashlib.sha256()
+        # The short ids of the added sequences, in the order they were added, and
+        # the order of their indexes when sorted by short id. The sorted order
+        # covers the first _sorted_count sequences and is extended when needed
+        # (see _taxon_order).
+        self._short_ids = []
+        self._sorted_order = []
+        self._sorted_count = 0
         self._age_by_full_id = {}
         self._age_by_short_id = {}
         self._date_unit = date_unit
         self._initial_phylo_tree = None
+        self._partitions = []
         self.a_birth_rate_has_been_fixed = False
         self.a_death_rate_has_been_fixed = False
         self.a_sampling_rate_has_been_fixed = False
+        # What auto_rate_change_grid changed when it fixed empty sampling
+        # intervals to 0, so that a later call can undo it and re-grid.
+        self._zeroed_sampling_intervals = None
+
+
+    @classmethod
+    def from_beast_xml(cls, path, **kwargs):
+        """
+        Create a BEAST2XML instance from an existing BEAST2 XML file (e.g. one
+        produced by BEAUti or by C{to_xml}).
+
+        The file is read incrementally. The sequences of its <data> element are
+        added (see C{add_sequence}) and removed from the tree as they are parsed,
+        the ages in its dateTrait are added (see C{add_ages}) and the remaining
+        model becomes the template.
+
+        Parameters
+        ----------
+        path: str or file
+            A filename or an open file pointer to read the XML from.
+        kwargs: dict
+            Keyword arguments passed to the BEAST2XML constructor (other than
+            C{template}).
+
+        Returns
+        -------
+        BEAST2XML
+        """
+        sequences = []
+        data = None
+        depth = 0
+        parser = ET.iterparse(path, events=("start", "end"))
+        for event, element in parser:
+            if event == "start":
+                depth += 1
+                if data is None and depth == 2 and element.tag == "data":
+                    data = element
+                continue
+            depth -= 1
+            if data is not None and depth == 2 and element.tag == "sequence":
+                taxon = element.get("taxon")
+                if taxon is None:
+                    taxon = element.get("id", "").split("seq_", 1)[-1]
+                value = element.get("value")
+                if value is None:
+                    value = "".join((element.text or "").split())
+                sequences.append(Read(taxon, value))
+                element.clear()
+                data.remove(element)
+
+        xml = cls(template=ET.ElementTree(parser.root), **kwargs)
+        for sequence in sequences:
+            xml.add_sequence(sequence)
+        trait = parser.root.find("./run/state/tree/trait")
+        if trait is not None and (trait.get("value") or trait.text or "").strip():
+            ids, ages = xml.extract_ages()
+            xml.add_ages(dict(zip(ids.tolist(), ages.tolist())))
+        return xml
+
+    @classmethod
+    def update_xml(
+        cls,
+        existing_path,
+        new_sequences,
+        new_ages,
+        output_path=None,
+        previous_tree_log=None,
+        seperator="\t",
+        age_column="year_decimal",
+        chunk_size=1 << 20,
+    ):
+        """
+        Add sequences and their ages to an existing BEAST2 XML file (e.g. one
+        made by C{to_xml}) without rebuilding it.
+
+        The file is streamed: the new sequences are inserted into its <data>
+        element in sorted position (before the first sequence with a greater
+        short id), their ages are merged into the dateTrait in the same way and
+        everything else is copied unchanged, so the time taken depends mostly on
+        the new data. If the <init> element holds a Newick tree, or
+        C{previous_tree_log} is given, the new taxa are grafted onto the tree
+        (see C{beast2xml.treelog.graft_tips}), which becomes the initial tree.
+
+        Parameters
+        ----------
+        existing_path: str
+            The XML file to update.
+        new_sequences: iterable of dark.reads.Read or str
+            The sequences to add, or the path to a FASTA file of them. Their short
+            ids must not already be in the XML.
+        new_ages: dict, pandas.DataFrame, pandas.Series or str
+            The ages of the new sequences (see C{add_ages}). Every new sequence
+            must have one.
+        output_path: str, default None
+            Where to write the updated XML. If None, C{existing_path} is replaced.
+        previous_tree_log: str, default None
+            The tree log (.trees file) of a previous run of the XML, whose last
+            tree (with the new taxa grafted on) is used as the initial tree.
+        seperator: str, default="\t"
+            Seperator of C{new_ages}, if it is a path.
+        age_column: str, default="year_decimal"
+            Column of C{new_ages} to use, if it is a path or a DataFrame.
+        chunk_size: int, default 1 << 20
+            The number of bytes to read at a time.
+
+        Returns
+        -------
+        int
+            The number of sequences added.
+        """
+        if isinstance(new_sequences, str):
+            new_sequences = FastaReads(new_sequences)
+        new_ages = _age_dict(new_ages, seperator, age_column)
+        new_ages_by_short_id = {key.split()[0]: value for key, value in new_ages.items()}
+        sequences = sorted(new_sequences, key=lambda sequence: sequence.id.split()[0])
+        ages = {}
+        for sequence in sequences:
+            short_id = sequence.id.split()[0]
+            if short_id in ages:
+                raise ValueError("Sequence id %r was given more than once." % short_id)
+            if sequence.id in new_ages:
+                ages[short_id] = new_ages[sequence.id]
+            elif short_id in new_ages_by_short_id:
+                ages[short_id] = new_ages_by_short_id[short_id]
+            else:
+                raise ValueError("No age was given for sequence %r." % sequence.id)
 
+        tree = None if previous_tree_log is None else last_tree(previous_tree_log)
+        if output_path is None:
+            output_path = existing_path
+        tmp = "%s.tmp-%d" % (output_path, os.getpid())
+        try:
+            with open(existing_path, "rb") as fp, open(tmp, "wb") as out:
+                updater = _XMLUpdater(sequences, ages, out, tree)
+                updater.run(fp, chunk_size)
+            duplicates = updater.existing.intersection(ages)
+            if duplicates:
+                raise ValueError(
+                    "The XML already has sequence(s): %s."
+                    % ", ".join(sorted(duplicates))
+                )
+            os.replace(tmp, output_path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return len(sequences)
 
     @staticmethod
     def find_elements(tree):
@@ -161,26 +1016,20 @@ class BEAST2XML(object):
             are the corresponding elements.
 
         """
-        result = {}
-        root = tree.getroot()
-        for tag in (
-            "data",
-            "run",
-            "./run/state/tree/trait",
-            "./run/logger[@id='tracelog']",
-            "./run/logger[@id='treelog.t:",
-            "./run/logger[@id='screenlog']",
-        ):
-            if tag == "./run/logger[@id='treelog.t:":
-                tag = tag + data_id + "']"
-            element = root.find(tag)
-            if element is None:
-                raise ValueError("Could not find %r tag in XML template" % tag)
-            if tag == "data":
-                data_id = element.get("id")
-            result[tag] = element
+        return TemplateSkeleton(tree).elements()
 
-        return result
+    @property
+    def skeleton(self):
+        """
+        Get the skeleton of the template, made (and checked) on first use.
+
+        Returns
+        -------
+        skeleton: beast2xml.skeleton.TemplateSkeleton
+        """
+        if self._skeleton is None:
+            self._skeleton = TemplateSkeleton(self._tree)
+        return self._skeleton
 
     def add_dates(self, date_data, seperator="\t", sample_id_field='strain', collection_date_field='date'):
         """
@@ -201,6 +1050,7 @@ class BEAST2XML(object):
         -------
         None
         """
+        stopwatch = self.metrics.start()
         if isinstance(date_data, str):
             date_data = pd.read_csv(date_data, sep=seperator, parse_dates=[collection_date_field])
         if isinstance(date_data, pd.DataFrame):
@@ -208,6 +1058,7 @@ class BEAST2XML(object):
         else:
             raise ValueError("date_data must be a string or pandas.DataFrame")
         year_decimal_data = {id: date_to_decimal(date) for id, date in date_data.items()}
+        stopwatch.lap("add_dates", taxa=len(year_decimal_data))
         self.add_ages(year_decimal_data)
 
     def add_ages(self, age_data, seperator="\t", age_column="year_decimal"):
@@ -224,25 +1075,12 @@ class BEAST2XML(object):
            Column name to use for age data.
 
         """
-        if isinstance(age_data, str):
-            age_data = pd.read_csv(age_data, sep=seperator)
-        if isinstance(age_data, pd.DataFrame):
-            if "id" in age_data.columns:
-                age_data = age_data.set_index("id")
-            elif "strain" in age_data.columns:
-                age_data = age_data.set_index("strain")
-            else:
-                raise ValueError("An age_data column must be id or strain")
-            age_data = age_data[age_column]
-        if isinstance(age_data, pd.Series):
-            age_data = age_data.to_dict()
-        if not isinstance(age_data, dict):
-            raise ValueError(
-                "age_data must be a C{dict} a C{pd.DataFrame}, a C{pd.Series} or a path to tsv/csv."
-            )
+        stopwatch = self.metrics.start()
+        age_data = _age_dict(age_data, seperator, age_column)
         self._age_by_full_id.update(age_data)
         age_data = {key.split()[0]: value for key, value in age_data.items()}
         self._age_by_short_id.update(age_data)
+        stopwatch.lap("add_ages", taxa=len(age_data))
 
     def add_age(self, sequence_id, age):
         """
@@ -279,6 +1117,21 @@ class BEAST2XML(object):
 
         """
         self._sequences.add(sequence)
+        self._short_ids.append(sequence.id.split()[0])
+        self._sequence_digest.update(sequence.id.encode("utf-8"))
+        self._sequence_digest.update(b"\0")
+        self._sequence_digest.update(sequence.sequence.encode("utf-8"))
+        self._sequence_digest.update(b"\n")
+        if self._memory_limit is not None and not isinstance(
+            self._sequences, DiskReads
+        ):
+            self._sequence_bytes += len(sequence.id) + len(sequence.sequence)
+            if self._sequence_bytes > self.SEQUENCE_MEMORY_FRACTION * (
+                self._memory_limit - self._memory_baseline
+            ):
+                stopwatch = self.metrics.start()
+                self._sequences = DiskReads(self._sequences)
+                stopwatch.lap("spill_sequences", bytes=self._sequence_bytes)
 
         if age is not None:
             self.add_age(sequence.id, age)
@@ -348,8 +1201,209 @@ class BEAST2XML(object):
                     "If a string sequences must be a path to a fasta file or a dark.Reads object."
                 )
             sequences = FastaReads(sequences)
-        for sequence in sequences:
+        stopwatch = self.metrics.start()
+        count = 0
+        for count, sequence in enumerate(sequences, start=1):
             self.add_sequence(sequence)
+        stopwatch.lap("add_sequences", taxa=count)
+
+    def _taxon_order(self):
+        """
+        Get the indexes of the added sequences, sorted by short id.
+
+        The order is kept between calls. Sequences added since the last call are
+        sorted on their own and merged in (which Python's sort does in linear
+        time, as the two parts are already sorted), so the sequences are not all
+        sorted again on every render.
+
+        Returns
+        -------
+        list of int
+            Indexes (in the order sequences were added), ordered by short id.
+            Sequences with the same short id are in the order they were added.
+        """
+        if self._sorted_count < len(self._short_ids):
+            key = self._short_ids.__getitem__
+            added = sorted(range(self._sorted_count, len(self._short_ids)), key=key)
+            self._sorted_order = sorted(self._sorted_order + added, key=key)
+            self._sorted_count = len(self._short_ids)
+        return self._sorted_order
+
+    def _select_sequences(self, sequence_mask, taxon_order="insertion"):
+        """
+        Select added sequences using a boolean mask or an array of indexes.
+
+        Parameters
+        ----------
+        sequence_mask: array-like of bool or int, or None
+            If None, all sequences are selected.
+        taxon_order: str, default="insertion"
+            Either "insertion", to keep the sequences in the order of the mask (or
+            the order they were added) or "sorted", to sort them by short id (see
+            C{_taxon_order}).
+
+        Returns
+        -------
+        dark.reads.Reads or beast2xml.storage.DiskReads
+        """
+        if taxon_order not in ("sorted", "insertion"):
+            raise ValueError('taxon_order must be either "sorted" or "insertion".')
+        if isinstance(self._sequences, DiskReads):
+            sequences = self._sequences
+        else:
+            sequences = list(self._sequences)
+        if sequence_mask is None:
+            if taxon_order == "sorted":
+                indexes = self._taxon_order()
+            else:
+                indexes = range(len(sequences))
+        else:
+            sequence_mask = np.asarray(sequence_mask)
+            if sequence_mask.dtype == bool:
+                if len(sequence_mask) != len(sequences):
+                    raise ValueError(
+                        "A boolean sequence_mask must have one value per added "
+                        "sequence."
+                    )
+                selected = sequence_mask
+            else:
+                selected = np.zeros(len(sequences), dtype=bool)
+                selected[sequence_mask] = True
+            if taxon_order == "sorted":
+                order = np.array(self._taxon_order(), dtype=int)
+                indexes = order[selected[order]].tolist()
+            elif sequence_mask.dtype == bool:
+                indexes = np.flatnonzero(selected).tolist()
+            else:
+                indexes = sequence_mask.tolist()
+        if isinstance(sequences, DiskReads):
+            return sequences.subset(indexes)
+        return Reads([sequences[index] for index in indexes])
+
+    def subsample(self, n, by=None, replicates=1, seed=None, metadata=None):
+        """
+        Draw random subsamples of the added sequences, optionally stratified.
+
+        When stratifying, sequences are split into groups by the C{by} fields and
+        the same maximum number of sequences is taken from each group, chosen so
+        that (up to) C{n} sequences are taken in total. Subsamples are returned as
+        boolean masks, to be passed as the C{sequence_mask} argument of
+        C{to_string} or C{to_xml}, e.g.
+
+            for index, mask in enumerate(xml.subsample(5000, by=["month", "region"],
+                                                       replicates=100, seed=1)):
+                xml.to_xml("replicate-%d.xml" % index, sequence_mask=mask)
+
+        Parameters
+        ----------
+        n: int
+            The number of sequences in each subsample.
+        by: list of str, default None
+            The fields to stratify by. "year", "month" and "week" are taken from the
+            ages of the sequences (which must be year decimals, see C{add_dates}).
+            Other fields are columns of C{metadata}. If None, sequences are sampled
+            without stratification.
+        replicates: int, default 1
+            The number of subsamples to draw.
+        seed: int, default None
+            Seed for the random number generator.
+        metadata: pandas.DataFrame, default None
+            Table with an id or strain column matching sequence ids (as for
+            C{add_ages}), holding any C{by} fields that are not derived from ages.
+
+        Returns
+        -------
+        masks: list of numpy.ndarray of bool
+            One mask per replicate, with one value per added sequence in the order
+            the sequences were added.
+        """
+        short_ids = self._short_ids
+        total = len(short_ids)
+        rng = np.random.default_rng(seed)
+        masks = [np.zeros(total, dtype=bool) for _ in range(replicates)]
+        if n >= total:
+            for mask in masks:
+                mask[:] = True
+            return masks
+        if not by:
+            for mask in masks:
+                mask[rng.choice(total, n, replace=False)] = True
+            return masks
+
+        strata = self._strata(short_ids, by, metadata)
+        counts = np.bincount(strata)
+        # Find the largest per-group maximum that takes no more than n in total.
+        low, high = 0, int(counts.max())
+        while low < high:
+            middle = (low + high + 1) // 2
+            if np.minimum(counts, middle).sum() <= n:
+                low = middle
+            else:
+                high = middle - 1
+        # Groups no bigger than that are taken whole. The remaining sequences
+        # are taken from the larger groups, giving one extra to randomly chosen
+        # groups to reach n.
+        whole = np.flatnonzero(counts <= low)
+        partial = np.flatnonzero(counts > low)
+        remainder = n - int(counts[whole].sum()) - low * len(partial)
+        whole_mask = np.isin(strata, whole)
+        members = np.argsort(strata, kind="stable")
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+        for mask in masks:
+            mask |= whole_mask
+            quotas = np.full(len(partial), low)
+            quotas[rng.choice(len(partial), remainder, replace=False)] += 1
+            chosen = [
+                members[starts[group] + rng.choice(counts[group], quota, replace=False)]
+                for group, quota in zip(partial.tolist(), quotas.tolist())
+            ]
+            if chosen:
+                mask[np.concatenate(chosen)] = True
+        return masks
+
+    def _strata(self, short_ids, by, metadata):
+        """
+        Get the stratum of each sequence for C{subsample}.
+
+        Returns
+        -------
+        numpy.ndarray of int
+            Stratum numbers, from 0.
+        """
+        age_fields = {"year": "datetime64[Y]", "month": "datetime64[M]", "week": "datetime64[W]"}
+        if metadata is not None:
+            if "id" in metadata.columns:
+                metadata = metadata.set_index("id")
+            elif "strain" in metadata.columns:
+                metadata = metadata.set_index("strain")
+            else:
+                raise ValueError("A metadata column must be id or strain")
+            metadata = metadata.reindex(short_ids)
+        codes = []
+        for field in by:
+            if field in age_fields:
+                ages = np.array(
+                    [self._age_by_short_id.get(short_id, np.nan) for short_id in short_ids],
+                    dtype=np.float64,
+                )
+                known = ~np.isnan(ages)
+                values = np.full(len(short_ids), -1, dtype=np.int64)
+                values[known] = (
+                    decimals_to_dates(ages[known]).astype(age_fields[field]).astype(np.int64)
+                )
+                codes.append(pd.factorize(values)[0])
+            elif metadata is not None and field in metadata.columns:
+                codes.append(pd.factorize(metadata[field], use_na_sentinel=False)[0])
+            else:
+                raise ValueError(
+                    "Cannot stratify by %r: it is not year, month or week and is not "
+                    "a metadata column." % field
+                )
+        strata = np.zeros(len(short_ids), dtype=np.int64)
+        for code in codes:
+            strata = strata * (int(code.max()) + 1) + code
+        return pd.factorize(strata)[0]
 
     def _to_xml_tree(
         self,
@@ -363,6 +1417,15 @@ class BEAST2XML(object):
         store_state_every=None,
         transform_func=None,
         mimic_beauti=False,
+        sequence_mask=None,
+        threads=None,
+        partition_threads=None,
+        use_ambiguities=None,
+        strip_invariant_sites=False,
+        target_samples=None,
+        max_tree_log_bytes=None,
+        stream_sequences=False,
+        taxon_order="sorted",
     ):
         """
         Generate xml.etree.ElementTree for running on BEAST.
@@ -402,24 +1465,61 @@ class BEAST2XML(object):
         mimic_beauti : bool, default=False
             If True, add attributes to the <beast> tag in the way that BEAUti does, to
             allow BEAUti to load the XML we produce.
+        sequence_mask : array-like of bool or int, default=None
+            If not None, a boolean mask (with one value per added sequence, in the
+            order they were added) or an array of indexes selecting the sequences to
+            write (see C{subsample}). If None, all sequences are written.
+        threads : int, default=None
+            The number of threads BEAST uses to compute the tree likelihoods of the
+            partitions in parallel (the C{threads} input of the likelihood
+            C{CompoundDistribution}). If 1, threading is turned off. If None, the
+            value in the template will be retained.
+        partition_threads : int or dict, default=None
+            The number of threads each C{ThreadedTreeLikelihood} uses, either one
+            C{int} for all of them or a C{dict} keyed by partition (data) id, e.g.
+            C{{'alignment.gag': 2}}. If None, the value in the template will be
+            retained.
+        use_ambiguities : bool, default=None
+            Whether the tree likelihoods treat ambiguous nucleotide codes as
+            partially known rather than as gaps. If None, the value in the template
+            will be retained.
+        strip_invariant_sites : bool, default=False
+            If True, write only the variable columns of the alignment. Constant and
+            all-missing columns are left out and the number of constant columns of
+            each base is given to BEAST (as the C{constantSiteWeights} of a
+            C{FilteredAlignment}) so the likelihood is unchanged.
+        target_samples : int, default=None
+            If given, log intervals not given explicitly are chosen from the chain
+            length so that about this many samples are logged (see
+            C{plan_logging}).
+        max_tree_log_bytes : int, default=None
+            If given and C{tree_log_every} is not, the tree logging interval is
+            chosen so the tree log is not expected to be larger than this many
+            bytes (see C{plan_logging}).
+        stream_sequences : bool, default=False
+            If True, the sequences are not added to the tree. A placeholder
+            <sequence> element is added instead, to be replaced by the sequences
+            when the tree is written by C{_write_streaming}.
+        taxon_order : str, default="sorted"
+            The order the sequences and their ages are written in: "sorted" (by
+            short id, as BEAUti does, with sequences sharing a short id kept in the
+            order they were added) or "insertion" (the order they were added).
 
         Returns
         -------
         file_path: xml.etree.ElementTree
             ElementTree for running on BEAST
         """
+        stopwatch = self.metrics.start()
         if mimic_beauti:
             root = self._tree.getroot()
             root.set("beautitemplate", "Standard")
             root.set("beautistatus", "")
 
-        elements = self.find_elements(self._tree)
-
-        # Get data element_path
-        data = elements["data"]
-        data_id = data.get("id")
-        tree_logger_key = "./run/logger[@id='treelog.t:" + data_id + "']"
-        trait = elements["./run/state/tree/trait"]
+        skeleton = self.skeleton
+        data = skeleton.data
+        data_id = skeleton.data_id
+        trait = skeleton.trait
 
         # Delete any existing children of the data node.
         delete_child_nodes(data)
@@ -427,10 +1527,14 @@ class BEAST2XML(object):
         if not isinstance(default_age, (float, int)):
             raise TypeError("The default age must be an integer or float.")
 
-        sequences = self._sequences
+        if sequence_mask is None and taxon_order == "insertion":
+            sequences = self._sequences
+        else:
+            sequences = self._select_sequences(sequence_mask, taxon_order)
+        stopwatch.lap("find_elements")
         age_by_short_id = deepcopy(self._age_by_short_id)
         if self._initial_phylo_tree is not None:
-            tip_set_diffs = self.set_diffs_initial_tree_and_sequences()
+            tip_set_diffs = self.set_diffs_initial_tree_and_sequences(sequences)
             if tip_set_diffs["in initial tree"]:
                 raise ValueError(
                     "Initial tree has additional sequences to the ones you have added."
@@ -446,20 +1550,25 @@ class BEAST2XML(object):
                         ]
                     )
                 )
-                sequences = Reads(
-                    [
-                        sequence
-                        for sequence in self._sequences
-                        if sequence.id not in tip_set_diffs["in sequences"]
-                    ]
-                )
+                if isinstance(sequences, DiskReads):
+                    sequences = sequences.filter_ids(
+                        lambda id_: id_ not in tip_set_diffs["in sequences"]
+                    )
+                else:
+                    sequences = Reads(
+                        [
+                            sequence
+                            for sequence in sequences
+                            if sequence.id not in tip_set_diffs["in sequences"]
+                        ]
+                    )
                 age_by_short_id = {
                     key: age
                     for key, age in self._age_by_short_id.items()
                     if key not in tip_set_diffs["in sequences"]
                 }
 
-            initial_tree_nodes = self._tree.findall("./run/init")
+            initial_tree_nodes = skeleton.inits
             if len(initial_tree_nodes) == 0:
                 raise ValueError("Template has no initial tree.")
             if len(initial_tree_nodes) > 1:
@@ -468,7 +1577,7 @@ class BEAST2XML(object):
                 )
             initial_tree_node = initial_tree_nodes[0]
             delete_child_nodes(initial_tree_node)
-            del initial_tree_node.attrib["estimate"]
+            initial_tree_node.attrib.pop("estimate", None)
             initial_tree_node.attrib["id"] = "NewickTree.t:" + data_id
             initial_tree_node.attrib["spec"] = "beast.util.TreeParser"
             initial_tree_node.attrib["IsLabelledNewick"] = self._IsLabelledNewick
@@ -479,28 +1588,47 @@ class BEAST2XML(object):
                 format=self._initial_phylo_tree_format
             )
 
-        # Add in all sequences.
-        for sequence in sorted(
-            sequences
-        ):  # Sorting adds the sequences alphabetically like in BEAUti.
-            seq_id = sequence.id
-            short_id = seq_id.split()[0]
-            if seq_id not in age_by_short_id:
-                age_by_short_id[short_id] = default_age
+        stopwatch.lap("initial_tree")
+        sequences = self._set_site_filters(sequences, strip_invariant_sites)
+        if strip_invariant_sites:
+            stopwatch.lap("site_filters")
+
+        if stream_sequences:
+            # The sequences are written by _write_streaming, in place of this
+            # placeholder.
+            ids = _sequence_ids(sequences)
+            for seq_id in ids:
+                if seq_id not in age_by_short_id:
+                    age_by_short_id[seq_id.split()[0]] = default_age
+            ET.SubElement(data, "sequence", id=_SEQUENCE_PLACEHOLDER)
+            self._streamed_sequences = sequences
+            stopwatch.lap("sequences", taxa=len(ids))
+        else:
+            # Add in all sequences (in short id order by default, as BEAUti does).
+            for sequence in sequences:
+                seq_id = sequence.id
+                short_id = seq_id.split()[0]
+                if seq_id not in age_by_short_id:
+                    age_by_short_id[short_id] = default_age
+
+                ET.SubElement(
+                    data,
+                    "sequence",
+                    id="seq_" + short_id,
+                    spec="Sequence",
+                    taxon=short_id,
+                    totalcount="4",
+                    value=sequence.sequence,
+                )
 
-            ET.SubElement(
-                data,
-                "sequence",
-                id="seq_" + short_id,
-                spec="Sequence",
-                taxon=short_id,
-                totalcount="4",
-                value=sequence.sequence,
+            stopwatch.lap(
+                "sequences",
+                taxa=len(data),
+                sites=max((len(sequence.get("value")) for sequence in data), default=0),
             )
 
-        trait_order = [
-            sequence.id.split()[0] for sequence in sequences
-        ]  # ensures order is the same as BEAUti's.
+        # The ages are written in the same order as the sequences.
+        trait_order = [id_.split()[0] for id_ in _sequence_ids(sequences)]
         trait_text = [
             short_id + "=" + str(age_by_short_id[short_id]) for short_id in trait_order
         ]
@@ -533,35 +1661,64 @@ class BEAST2XML(object):
         # Set the date unit (if not 'year').
         if self._date_unit != "year":
             trait.set("units", self._date_unit)
+        stopwatch.lap("trait", taxa=len(trait_text))
+
+        if target_samples is not None or max_tree_log_bytes is not None:
+            plan = self._plan_logging(
+                sequences,
+                chain_length,
+                target_samples,
+                max_tree_log_bytes,
+                trace_log_every=trace_log_every,
+                tree_log_every=tree_log_every,
+                screen_log_every=screen_log_every,
+                store_state_every=store_state_every,
+            )
+            trace_log_every = plan["trace_log_every"]
+            tree_log_every = plan["tree_log_every"]
+            screen_log_every = plan["screen_log_every"]
+            store_state_every = plan["store_state_every"]
 
         if chain_length is not None:
-            elements["run"].set("chainLength", str(chain_length))
+            skeleton.run.set("chainLength", str(chain_length))
 
         if store_state_every is not None:
-            elements["run"].set("storeEvery", str(store_state_every))
+            skeleton.run.set("storeEvery", str(store_state_every))
 
         if log_file_basename is not None:
             # Trace log.
-            logger = elements["./run/logger[@id='tracelog']"]
+            logger = skeleton.trace_logger
             logger.set("fileName", log_file_basename + self.TRACELOG_SUFFIX)
             # Tree log.
-            logger = elements[tree_logger_key]
+            logger = skeleton.tree_logger
             logger.set("fileName", log_file_basename + self.TREELOG_SUFFIX)
 
         if trace_log_every is not None:
-            logger = elements["./run/logger[@id='tracelog']"]
+            logger = skeleton.trace_logger
             logger.set("logEvery", str(trace_log_every))
 
         if tree_log_every is not None:
-            logger = elements[tree_logger_key]
+            logger = skeleton.tree_logger
             logger.set("logEvery", str(tree_log_every))
 
         if screen_log_every is not None:
-            logger = elements["./run/logger[@id='screenlog']"]
+            logger = skeleton.screen_logger
             logger.set("logEvery", str(screen_log_every))
 
+        if (
+            threads is not None
+            or partition_threads is not None
+            or use_ambiguities is not None
+        ):
+            self._set_likelihood_options(threads, partition_threads, use_ambiguities)
+
+        stopwatch.lap("settings")
+
         tree = self._tree if transform_func is None else transform_func(self._tree)
+        if transform_func is not None:
+            stopwatch.lap("transform")
         ET.indent(tree, "\t")
+        stopwatch.lap("indent")
         return tree
 
     def to_string(
@@ -576,6 +1733,14 @@ class BEAST2XML(object):
         store_state_every=None,
         transform_func=None,
         mimic_beauti=False,
+        sequence_mask=None,
+        threads=None,
+        partition_threads=None,
+        use_ambiguities=None,
+        strip_invariant_sites=False,
+        target_samples=None,
+        max_tree_log_bytes=None,
+        taxon_order="sorted",
     ):
         """Generate str version of xml.etree.ElementTree for running on BEAST.
 
@@ -614,6 +1779,41 @@ class BEAST2XML(object):
         mimic_beauti: bool, default=False
             If True, add attributes to the <beast> tag in the way that BEAUti does, to
             allow BEAUti to load the XML we produce.
+        sequence_mask: array-like of bool or int, default=None
+            If not None, a boolean mask (with one value per added sequence, in the
+            order they were added) or an array of indexes selecting the sequences to
+            write (see C{subsample}). If None, all sequences are written.
+        threads: int, default=None
+            The number of threads BEAST uses to compute the tree likelihoods of the
+            partitions in parallel (the C{threads} input of the likelihood
+            C{CompoundDistribution}). If 1, threading is turned off. If None, the
+            value in the template will be retained.
+        partition_threads: int or dict, default=None
+            The number of threads each C{ThreadedTreeLikelihood} uses, either one
+            C{int} for all of them or a C{dict} keyed by partition (data) id, e.g.
+            C{{'alignment.gag': 2}}. If None, the value in the template will be
+            retained.
+        use_ambiguities: bool, default=None
+            Whether the tree likelihoods treat ambiguous nucleotide codes as
+            partially known rather than as gaps. If None, the value in the template
+            will be retained.
+        strip_invariant_sites: bool, default=False
+            If True, write only the variable columns of the alignment. Constant and
+            all-missing columns are left out and the number of constant columns of
+            each base is given to BEAST (as the C{constantSiteWeights} of a
+            C{FilteredAlignment}) so the likelihood is unchanged.
+        target_samples: int, default=None
+            If given, log intervals not given explicitly are chosen from the chain
+            length so that about this many samples are logged (see
+            C{plan_logging}).
+        max_tree_log_bytes: int, default=None
+            If given and C{tree_log_every} is not, the tree logging interval is
+            chosen so the tree log is not expected to be larger than this many
+            bytes (see C{plan_logging}).
+        taxon_order: str, default="sorted"
+            The order the sequences and their ages are written in: "sorted" (by
+            short id, as BEAUti does, with sequences sharing a short id kept in the
+            order they were added) or "insertion" (the order they were added).
 
         Returns
         -------
@@ -631,11 +1831,22 @@ class BEAST2XML(object):
             store_state_every=store_state_every,
             transform_func=transform_func,
             mimic_beauti=mimic_beauti,
+            sequence_mask=sequence_mask,
+            threads=threads,
+            partition_threads=partition_threads,
+            use_ambiguities=use_ambiguities,
+            strip_invariant_sites=strip_invariant_sites,
+            target_samples=target_samples,
+            max_tree_log_bytes=max_tree_log_bytes,
+            taxon_order=taxon_order,
         )
 
+        stopwatch = self.metrics.start()
         stream = six.StringIO()
         tree.write(stream, "unicode" if six.PY3 else "utf-8", xml_declaration=True)
-        return stream.getvalue()
+        result = stream.getvalue()
+        stopwatch.lap("serialise", bytes=len(result))
+        return result
 
     def to_xml(
         self,
@@ -650,6 +1861,15 @@ class BEAST2XML(object):
         store_state_every=None,
         transform_func=None,
         mimic_beauti=False,
+        sequence_mask=None,
+        threads=None,
+        partition_threads=None,
+        use_ambiguities=None,
+        strip_invariant_sites=False,
+        target_samples=None,
+        max_tree_log_bytes=None,
+        taxon_order="sorted",
+        cache=None,
     ):
         """
         Generate xml.etree.ElementTree for running on BEAST and write to xml file.
@@ -691,6 +1911,46 @@ class BEAST2XML(object):
         mimic_beauti: bool, default=False
             If True, add attributes to the <beast> tag in the way that BEAUti does, to
             allow BEAUti to load the XML we produce.
+        sequence_mask: array-like of bool or int, default=None
+            If not None, a boolean mask (with one value per added sequence, in the
+            order they were added) or an array of indexes selecting the sequences to
+            write (see C{subsample}). If None, all sequences are written.
+        threads: int, default=None
+            The number of threads BEAST uses to compute the tree likelihoods of the
+            partitions in parallel (the C{threads} input of the likelihood
+            C{CompoundDistribution}). If 1, threading is turned off. If None, the
+            value in the template will be retained.
+        partition_threads: int or dict, default=None
+            The number of threads each C{ThreadedTreeLikelihood} uses, either one
+            C{int} for all of them or a C{dict} keyed by partition (data) id, e.g.
+            C{{'alignment.gag': 2}}. If None, the value in the template will be
+            retained.
+        use_ambiguities: bool, default=None
+            Whether the tree likelihoods treat ambiguous nucleotide codes as
+            partially known rather than as gaps. If None, the value in the template
+            will be retained.
+        strip_invariant_sites: bool, default=False
+            If True, write only the variable columns of the alignment. Constant and
+            all-missing columns are left out and the number of constant columns of
+            each base is given to BEAST (as the C{constantSiteWeights} of a
+            C{FilteredAlignment}) so the likelihood is unchanged.
+        target_samples: int, default=None
+            If given, log intervals not given explicitly are chosen from the chain
+            length so that about this many samples are logged (see
+            C{plan_logging}).
+        max_tree_log_bytes: int, default=None
+            If given and C{tree_log_every} is not, the tree logging interval is
+            chosen so the tree log is not expected to be larger than this many
+            bytes (see C{plan_logging}).
+        taxon_order: str, default="sorted"
+            The order the sequences and their ages are written in: "sorted" (by
+            short id, as BEAUti does, with sequences sharing a short id kept in the
+            order they were added) or "insertion" (the order they were added).
+        cache: beast2xml.cache.RenderCache, default=None
+            If given, the XML is taken from the cache if it has been rendered
+            before from the same template, sequences, ages, initial tree and
+            arguments (see C{render_key}), and stored in it otherwise. The cache
+            is not used if C{transform_func} is given.
 
         Returns
         -------
@@ -699,7 +1959,7 @@ class BEAST2XML(object):
         """
         if not isinstance(path, str):
             raise TypeError("filename must be a string.")
-        tree = self._to_xml_tree(
+        arguments = dict(
             chain_length=chain_length,
             default_age=default_age,
             date_direction=date_direction,
@@ -708,24 +1968,332 @@ class BEAST2XML(object):
             tree_log_every=tree_log_every,
             screen_log_every=screen_log_every,
             store_state_every=store_state_every,
-            transform_func=transform_func,
             mimic_beauti=mimic_beauti,
+            sequence_mask=sequence_mask,
+            threads=threads,
+            partition_threads=partition_threads,
+            use_ambiguities=use_ambiguities,
+            strip_invariant_sites=strip_invariant_sites,
+            target_samples=target_samples,
+            max_tree_log_bytes=max_tree_log_bytes,
+            taxon_order=taxon_order,
+        )
+        if transform_func is not None:
+            cache = None
+        if cache is not None:
+            stopwatch = self.metrics.start()
+            key = self.render_key(**arguments)
+            if cache.fetch(key, path):
+                stopwatch.lap("cache_hit", bytes=os.path.getsize(path))
+                return
+            stopwatch.lap("cache_miss")
+        stream_sequences = isinstance(self._sequences, DiskReads)
+        tree = self._to_xml_tree(
+            transform_func=transform_func,
+            stream_sequences=stream_sequences,
+            **arguments,
         )
-        tree.write(path, "unicode" if six.PY3 else "utf-8", xml_declaration=True)
+        stopwatch = self.metrics.start()
+        # The XML is written to a temporary file that then replaces the path,
+        # so a path that is a (hard) link to a cached file is never written
+        # through.
+        tmp = "%s.tmp-%d-%d" % (path, os.getpid(), threading.get_ident())
+        try:
+            if stream_sequences:
+                with open(tmp, "w", encoding="utf-8") as fp:
+                    self._write_streaming(tree, fp)
+            else:
+                tree.write(
+                    tmp, "unicode" if six.PY3 else "utf-8", xml_declaration=True
+                )
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        stopwatch.lap("write", bytes=os.path.getsize(path))
+        if cache is not None:
+            cache.store(key, path)
+
+    def render_key(self, **kwargs):
+        """
+        Get a key identifying the XML that would be rendered, for use with a
+        C{beast2xml.cache.RenderCache}.
 
-    def _search_for_id_in_element(
-        self, element_path, parameter, wild_card_ending
-    ):
-        if wild_card_ending:
-            parameter_nodes = [
-                potential_parameter_node
-                for potential_parameter_node in self._tree.findall(element_path)
-                if potential_parameter_node.attrib["id"].startswith(parameter)
-            ]
-        else:
-            parameter_nodes = self._tree.findall(
-                f"{element_path}[@id='%s']" % parameter
+        The key is a hash of the template (including any changes made to it,
+        e.g. by C{change_prior}), a digest of the sequences (kept up to date as
+        they are added, so it costs nothing to get), the ages, the initial tree
+        and the rendering arguments. Sequences are not read again, so getting
+        the key of a large alignment is much faster than rendering it.
+
+        Parameters
+        ----------
+        kwargs: dict
+            The keyword arguments that would be passed to C{to_xml} (other than
+            C{transform_func}, whose effect cannot be hashed).
+
+        Returns
+        -------
+        key: str
+        """
+        template = hashlib.sha256()
+        data = self.skeleton.data
+        trait = self.skeleton.trait
+
+        # The children of the data element and the ages in the trait are
+        # replaced when rendering, so are left out.
+        def update(element):
+            template.update(element.tag.encode("utf-8"))
+            for name, value in sorted(element.attrib.items()):
+                if element is trait and name == "value":
+                    continue
+                template.update(("\0%s=%s" % (name, value)).encode("utf-8"))
+            if element is not trait:
+                template.update(("\0%s" % (element.text or "").strip()).encode("utf-8"))
+            template.update(b"\0(")
+            if element is not data:
+                for child in element:
+                    update(child)
+            template.update(b")")
+
+        update(self._tree.getroot())
+        if self._initial_phylo_tree is None:
+            initial_tree = None
+        else:
+            initial_tree = [
+                self._initial_phylo_tree.write(format=self._initial_phylo_tree_format),
+                self._IsLabelledNewick,
+                self._adjustTipHeights,
+            ]
+        return RenderCache.key(
+            template.hexdigest(),
+            self._sequence_digest.hexdigest(),
+            len(self._short_ids),
+            sorted(self._age_by_short_id.items()),
+            initial_tree,
+            self._date_unit,
+            self._partitions,
+            {
+                key: (None if value is None else np.asarray(value).tolist())
+                if key == "sequence_mask"
+                else value
+                for key, value in sorted(kwargs.items())
+            },
+        )
+
+    def _write_streaming(self, tree, fp):
+        """
+        Write a tree made with C{stream_sequences=True}, reading the sequences
+        from disk one at a time (in the order they were rendered) as they are
+        written in place of the placeholder.
+
+        Parameters
+        ----------
+        tree: xml.etree.ElementTree
+        fp: file
+            Open for writing text.
+        """
+        sequences, self._streamed_sequences = self._streamed_sequences, None
+        stream = six.StringIO()
+        tree.write(stream, "unicode", xml_declaration=True)
+        text = stream.getvalue()
+        placeholder = '<sequence id="%s" />' % _SEQUENCE_PLACEHOLDER
+        start = text.index(placeholder)
+        indent = text[text.rindex("\n", 0, start) + 1 : start]
+        fp.write(text[:start])
+        for count, sequence in enumerate(sequences):
+            if count:
+                fp.write("\n" + indent)
+            short_id = _escape_attribute(sequence.id.split()[0])
+            fp.write(
+                '<sequence id="seq_%s" spec="Sequence" taxon="%s" '
+                'totalcount="4" value="%s" />'
+                % (short_id, short_id, _escape_attribute(sequence.sequence))
             )
+        fp.write(text[start + len(placeholder) :])
+
+    async def add_sequences_async(self, sequences, executor=None):
+        """
+        Add a set of sequences (see C{add_sequences}) without blocking the event
+        loop, by reading and adding them in an executor.
+
+        Parameters
+        ----------
+        sequences : iterable of dark.read instances or str
+            The sequences to be added, or the path to a fasta file.
+        executor: concurrent.futures.Executor, default=None
+            The executor to run in. This must be a thread pool, as the sequences
+            are added to this instance. If None, the event loop's default
+            executor is used.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(executor, self.add_sequences, sequences)
+
+    async def to_string_async(self, executor=None, **kwargs):
+        """
+        Generate the XML as a string (see C{to_string}) in an executor, without
+        blocking the event loop.
+
+        Only one rendering of an instance may run at a time, as rendering
+        changes its tree.
+
+        Parameters
+        ----------
+        executor: concurrent.futures.Executor, default=None
+            The executor to run in. If None, the event loop's default executor
+            is used.
+        kwargs: dict
+            Keyword arguments for C{to_string}.
+
+        Returns
+        -------
+        str
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, partial(self.to_string, **kwargs))
+
+    async def to_xml_async(self, path, executor=None, **kwargs):
+        """
+        Generate the XML and write it to a file (see C{to_xml}) in an executor,
+        without blocking the event loop.
+
+        Only one rendering of an instance may run at a time, as rendering
+        changes its tree.
+
+        Parameters
+        ----------
+        path: str
+            Path to write xml file to.
+        executor: concurrent.futures.Executor, default=None
+            The executor to run in. If None, the event loop's default executor
+            is used.
+        kwargs: dict
+            Keyword arguments for C{to_xml}.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(executor, partial(self.to_xml, path, **kwargs))
+
+    async def iter_chunks_async(
+        self, chunk_size=1 << 16, executor=None, max_pending=8, **kwargs
+    ):
+        """
+        Generate the XML in an executor, yielding it in chunks as it is
+        serialised, e.g. for a streamed HTTP response.
+
+        The executor waits while C{max_pending} chunks have not been read, so a
+        slow reader does not make the whole document be held in memory. If the
+        iteration is stopped early (e.g. because the client went away), the
+        rendering is abandoned.
+
+        Only one rendering of an instance may run at a time, as rendering
+        changes its tree.
+
+        Parameters
+        ----------
+        chunk_size: int, default=1 << 16
+            The approximate number of characters in each chunk.
+        executor: concurrent.futures.ThreadPoolExecutor, default=None
+            The executor to run in. This must be a thread pool, as the chunks
+            are passed back to the event loop as they are made. If None, the
+            event loop's default executor is used.
+        max_pending: int, default=8
+            The number of chunks that may be waiting to be read.
+        kwargs: dict
+            Keyword arguments for C{to_string} (other than C{transform_func}
+            which, if given, is also used).
+
+        Yields
+        ------
+        bytes
+            UTF-8 encoded XML.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=max_pending)
+        cancelled = threading.Event()
+
+        def put(item):
+            if cancelled.is_set():
+                raise _RenderCancelled()
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        def render():
+            try:
+                stream_sequences = isinstance(self._sequences, DiskReads)
+                tree = self._to_xml_tree(stream_sequences=stream_sequences, **kwargs)
+                stopwatch = self.metrics.start()
+                writer = _ChunkWriter(put, chunk_size)
+                if stream_sequences:
+                    self._write_streaming(tree, writer)
+                else:
+                    tree.write(writer, "unicode", xml_declaration=True)
+                writer.flush()
+                stopwatch.lap("serialise")
+            except _RenderCancelled:
+                return
+            except BaseException as e:
+                put(e)
+                return
+            put(None)
+
+        future = loop.run_in_executor(executor, render)
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            cancelled.set()
+            # Unblock a put that is waiting for room in the queue.
+            while not queue.empty():
+                queue.get_nowait()
+            try:
+                await future
+            except _RenderCancelled:
+                pass
+
+    def memory_report(self):
+        """
+        Report how a builder made with a C{memory_limit} has kept to it.
+
+        Returns
+        -------
+        report: dict
+            With keys "memory_limit" (in bytes), "sequence_storage" ("memory" or
+            "disk"), "output" ("tree" or, when C{to_xml} streams the sequences,
+            "streaming"), "peak_rss_bytes" (the peak of the process so far) and
+            "stages" (a list of (stage, peak_rss_bytes, peak_rss_growth_bytes)
+            triples, in the order the stages were recorded). The peak is a
+            high-water mark for the whole process (see C{peak_rss}), so a
+            stage's growth, not its peak, shows the memory it took.
+        """
+        on_disk = isinstance(self._sequences, DiskReads)
+        return {
+            "memory_limit": self._memory_limit,
+            "sequence_storage": "disk" if on_disk else "memory",
+            "output": "streaming" if on_disk else "tree",
+            "peak_rss_bytes": peak_rss(),
+            "stages": [
+                (
+                    record["stage"],
+                    record["peak_rss_bytes"],
+                    record["peak_rss_growth_bytes"],
+                )
+                for record in self.metrics.stages
+                if "peak_rss_bytes" in record
+            ],
+        }
+
+    def _search_for_id_in_element(self, element, tag, parameter, wild_card_ending):
+        if wild_card_ending:
+            parameter_nodes = [
+                potential_parameter_node
+                for potential_parameter_node in element.findall(tag)
+                if potential_parameter_node.attrib["id"].startswith(parameter)
+            ]
+        else:
+            parameter_nodes = element.findall(f"{tag}[@id='%s']" % parameter)
         if len(parameter_nodes) == 0:
             raise ValueError(
                 "No parameter with id %s (or starting with) was found." % parameter
@@ -737,6 +2305,23 @@ class BEAST2XML(object):
             )
         return parameter_nodes[0]
 
+    def _search_for_prior(self, parameter, wild_card_ending):
+        """
+        Find the prior of a parameter in the compound distribution with id
+        "prior", or in any compound distribution of the posterior if the
+        template has none with that id.
+        """
+        if self.skeleton.prior is None:
+            return self._search_for_id_in_element(
+                self.skeleton.run,
+                "distribution/distribution/prior",
+                parameter,
+                wild_card_ending,
+            )
+        return self._search_for_id_in_element(
+            self.skeleton.prior, "prior", parameter, wild_card_ending
+        )
+
     def change_parameter_state_node(
         self,
         parameter,
@@ -771,7 +2356,7 @@ class BEAST2XML(object):
             )
 
         parameter_node = self._search_for_id_in_element(
-            "./run/state/parameter", parameter, wild_card_ending
+            self.skeleton.state, "parameter", parameter, wild_card_ending
         )
         if value is not None:
             parameter_node.text = str(value)
@@ -808,9 +2393,7 @@ class BEAST2XML(object):
             Keyword arguments parameterising the distribution.
 
         """
-        parameter_prior_node = self._search_for_id_in_element(
-            "./run/distribution/distribution/prior", parameter, wild_card_ending
-        )
+        parameter_prior_node = self._search_for_prior(parameter, wild_card_ending)
 
         if distribution in [
             "lognorm",
@@ -913,7 +2496,7 @@ class BEAST2XML(object):
         ----------
         parameter : str
             The name of the parameter.
-        dates : list, tuple, pd.Series or pd.DatetimeIndex of dates
+        dates : list, tuple, numpy.ndarray, pd.Series or pd.DatetimeIndex of dates
         offset_earliest: float (default 0)
             Year decimal ammount to subtract from the earliest date, after conversion
             to year decimal. This ensures the first value of a sampling proportion
@@ -921,16 +2504,57 @@ class BEAST2XML(object):
             negative infinity error when the first sample occurs in a period expecting 0
             sampling. Suggested value would be 1e-6.
         """
-        if not isinstance(dates, (list, tuple, pd.Series, pd.DatetimeIndex)):
-            raise TypeError(
-                "dates must be a list, tuple pandas.Series or pandas.DatetimeIndex."
-            )
-        year_decimals = [date_to_decimal(item) for item in dates]
-        index_of_min = year_decimals .index(min(year_decimals))
-        year_decimals[index_of_min] -= offset_earliest
-        youngest_tip = max(self._age_by_short_id.values())
-        times = [youngest_tip - year_decimal for year_decimal in year_decimals]
-        self.add_rate_change_times(parameter, times)
+        argument = self._rate_change_argument(parameter).replace("_times", "_dates")
+        self.set_rate_change_dates(offset_earliest=offset_earliest, **{argument: dates})
+
+    def set_rate_change_dates(
+        self,
+        birth_rate_change_dates=None,
+        death_rate_change_dates=None,
+        sampling_rate_change_dates=None,
+        offset_earliest=0,
+    ):
+        """
+        Set the dates of parameter changes for any of the three skyline change-time
+        arrays in one call.
+
+        Parameters
+        ----------
+        birth_rate_change_dates : list, tuple, numpy.ndarray, pd.Series or
+            pd.DatetimeIndex of dates, default None
+            Dates of changes in reproductive number.
+        death_rate_change_dates : list, tuple, numpy.ndarray, pd.Series or
+            pd.DatetimeIndex of dates, default None
+            Dates of changes in uninfectious rate.
+        sampling_rate_change_dates : list, tuple, numpy.ndarray, pd.Series or
+            pd.DatetimeIndex of dates, default None
+            Dates of changes in sampling proportion.
+        offset_earliest: float (default 0)
+            Year decimal ammount to subtract from the earliest date of each array,
+            after conversion to year decimal (see C{add_rate_change_dates}).
+        """
+        times_by_argument = {}
+        youngest_tip = None
+        for argument, dates in (
+            ("birth_rate_change_times", birth_rate_change_dates),
+            ("death_rate_change_times", death_rate_change_dates),
+            ("sampling_rate_change_times", sampling_rate_change_dates),
+        ):
+            if dates is None:
+                continue
+            if not isinstance(
+                dates, (list, tuple, np.ndarray, pd.Series, pd.DatetimeIndex)
+            ):
+                raise TypeError(
+                    "dates must be a list, tuple, numpy.ndarray, pandas.Series or "
+                    "pandas.DatetimeIndex."
+                )
+            year_decimals = dates_to_decimals(dates)
+            year_decimals[np.argmin(year_decimals)] -= offset_earliest
+            if youngest_tip is None:
+                youngest_tip = self._ages().max()
+            times_by_argument[argument] = youngest_tip - year_decimals
+        self.set_rate_change_times(**times_by_argument)
 
     def add_rate_change_times(self, parameter, times):
         """
@@ -950,49 +2574,83 @@ class BEAST2XML(object):
          *  https://github.com/BEAST2-Dev/bdsky/issues/35
 
         """
-        skyline_element = self._tree.find(
-            "./run/distribution/distribution/distribution[@spec='beast.evolution.speciation.BirthDeathSkylineModel']"
-        )
-        if skyline_element is None:
+        self.set_rate_change_times(**{self._rate_change_argument(parameter): times})
+
+    def set_rate_change_times(
+        self,
+        birth_rate_change_times=None,
+        death_rate_change_times=None,
+        sampling_rate_change_times=None,
+    ):
+        """
+        Set the times (from the youngest sample) of parameter changes for any of the
+        three skyline change-time arrays in one call.
+
+        Existing change-time elements are updated in place, so repeated calls
+        do not accumulate elements. The C{times} given are not modified.
+
+        Parameters
+        ----------
+        birth_rate_change_times : iterable of floats, default None
+            Times of changes in reproductive number going backwards from the youngest
+            sample.
+        death_rate_change_times : iterable of floats, default None
+            Times of changes in uninfectious rate going backwards from the youngest
+            sample.
+        sampling_rate_change_times : iterable of floats, default None
+            Times of changes in sampling proportion going backwards from the youngest
+            sample.
+
+        Notes
+        -------
+        If modifying see:
+         *  https://github.com/BEAST2-Dev/bdsky/blob/master/doc/how_to.pdf
+         *  https://github.com/BEAST2-Dev/bdsky/issues/35
+
+        """
+        times_by_parameter = {
+            parameter: times
+            for parameter, times in zip(
+                self._rate_change_to_param_dict,
+                (
+                    birth_rate_change_times,
+                    death_rate_change_times,
+                    sampling_rate_change_times,
+                ),
+            )
+            if times is not None
+        }
+        if not times_by_parameter:
             raise ValueError(
-                "No distribution of spec BirthDeathSkylineModel was found."
-                + "Currently this method only supports Birth Death Skyline Models."
+                "At least one of birth_rate_change_times, death_rate_change_times or "
+                "sampling_rate_change_times must be provided."
             )
-        rev_time_element = skyline_element.find("reverseTimeArrays")
-        if rev_time_element is None:
-            rev_time_array = [False, False, False, False, False]
-        else:
-            if rev_time_element.text is not None:
-                if 'value' in rev_time_element.attrib:
-                    raise AttributeError('XMLs reverse time element has both text and attrib["value"].')
-                rev_time_array = rev_time_element.text
-            elif 'value' in rev_time_element.attrib:
-                rev_time_array = rev_time_element.attrib['value']
+        for parameter in times_by_parameter:
+            self._check_rate_change_not_fixed(parameter)
+
+        skyline_element = self._find_skyline_element()
+        rev_time_element, rev_time_array = self._get_reverse_time_array(
+            skyline_element
+        )
+        for parameter, times in times_by_parameter.items():
+            rev_time_array[self._rate_change_index(parameter)] = True
+            times = np.asarray(times, dtype=np.float64).ravel()
+            if not (times == 0.0).any():
+                times = np.append(times, 0.0)
+            times = np.sort(times)
+            parameter_element = skyline_element.find(parameter)
+            if parameter_element is None:
+                parameter_element = ET.SubElement(
+                    skyline_element, parameter, spec="parameter.RealParameter"
+                )
             else:
-                raise AttributeError('XMLs reverse time element needs text or attrib["value"].')
-            rev_time_array = rev_time_array.split(" ")
-            rev_time_array = [val in ["true", "True", "TRUE"] for val in rev_time_array]
-        if parameter == "birthRateChangeTimes":
-            if self.a_birth_rate_has_been_fixed:
-                raise AssertionError('A birth rate value has been fixed. Any changes to dimensions should be performed before any values are fixed.')
-            rev_time_array[0] = True
-        elif parameter == "deathRateChangeTimes":
-            if self.a_death_rate_has_been_fixed:
-                raise AssertionError('A death rate value has been fixed. Any changes to dimensions should be performed before any values are fixed.')
-            rev_time_array[1] = True
-        elif parameter == "samplingRateChangeTimes":
-            if self.a_sampling_rate_has_been_fixed:
-                raise AssertionError('A sampling rate value has been fixed. Any changes to dimensions should be performed before any values are fixed.')
-            rev_time_array[2] = True
-        else:
-            raise ValueError(
-                "Currently this method only supports parameter being: "
-                + "birthRateChangeTimes (for changes in reproductive number), "
-                "deathRateChangeTimes (for changes in uninfectious rate) and "
-                + "samplingRateChangeTimes (for sampling proportion)."
+                parameter_element.text = None  # Replace the old times in place.
+            parameter_element.set("value", " ".join(map(str, times.tolist())))
+            self.change_parameter_state_node(
+                self._rate_change_to_param_dict[parameter], dimension=len(times)
             )
-        rev_time_array = [str(val).lower() for val in rev_time_array]
-        rev_time_array = " ".join(rev_time_array)
+
+        rev_time_array = " ".join(str(val).lower() for val in rev_time_array)
         if rev_time_element is None:
             ET.SubElement(
                 skyline_element,
@@ -1001,23 +2659,200 @@ class BEAST2XML(object):
                 value=rev_time_array,
             )
         else:
+            rev_time_element.text = None
             rev_time_element.attrib["value"] = rev_time_array
-        parameter_element = skyline_element.find(parameter)
-        if parameter_element is not None:
-            del parameter_element  # delete old parameter element_path if it exists.
-        if not any(time == 0.0 for time in times):
-            times.append(0.0)
-        times = sorted(times)
-        dimensions = len(times)
-        ET.SubElement(
-            skyline_element,
-            parameter,
-            spec="parameter.RealParameter",
-            value=" ".join([str(time) for time in times]),
-        )
-        self.change_parameter_state_node(
-            self._rate_change_to_param_dict[parameter], dimension=dimensions
-        )
+
+    def auto_rate_change_grid(
+        self,
+        parameter,
+        n_intervals,
+        strategy="quantile",
+        offset_earliest=1e-6,
+        zero_empty_intervals=True,
+    ):
+        """
+        Generate change times for a skyline parameter from the distribution of the
+        added ages (which must be year decimals, see C{add_dates}), or of the ages in
+        the xml if none have been added.
+
+        The grid covers the sampling period (from the earliest to the youngest
+        sample) and is applied as in C{add_rate_change_dates}, so the interval
+        before the earliest sample becomes the first dimension of the parameter.
+
+        Parameters
+        ----------
+        parameter : str
+            The name of the parameter, one of birthRateChangeTimes,
+            deathRateChangeTimes or samplingRateChangeTimes.
+        n_intervals : int
+            The number of intervals to divide the sampling period into.
+        strategy : str, default "quantile"
+            How to place the interval boundaries:
+                "quantile"  each interval holds (roughly) the same number of samples.
+                "equal"     intervals are of equal length.
+                "epi-week"  boundaries fall on the start (Sunday) of epidemiological
+                            weeks, with each interval spanning the same number of
+                            whole weeks.
+        offset_earliest: float (default 1e-6)
+            Year decimal ammount to subtract from the earliest boundary (see
+            C{add_rate_change_dates}).
+        zero_empty_intervals : bool, default True
+            If True and parameter is samplingRateChangeTimes, intervals containing no
+            samples have their samplingProportion fixed to 0 via
+            C{set_dimension_values_to_0}. Intervals fixed this way by an earlier
+            call are freed again, so the grid can be made again (e.g. after more
+            sequences are added). Values fixed in any other way still prevent the
+            dimension from being changed.
+
+        Returns
+        -------
+        numpy.array
+            The change times (from the youngest sample) that were set.
+        """
+        if not isinstance(n_intervals, int) or n_intervals < 1:
+            raise ValueError("n_intervals must be a positive integer.")
+        argument = self._rate_change_argument(parameter)
+        ages = self._ages()
+        earliest = ages.min()
+        youngest = ages.max()
+
+        if strategy == "equal":
+            boundaries = np.linspace(earliest, youngest, n_intervals + 1)[:-1]
+        elif strategy == "quantile":
+            boundaries = np.unique(
+                np.quantile(ages, np.linspace(0.0, 1.0, n_intervals + 1)[:-1])
+            )
+        elif strategy == "epi-week":
+            first_day, last_day = decimals_to_dates([earliest, youngest]).astype(
+                "datetime64[D]"
+            )
+            # Epidemiological weeks start on a Sunday, as did 1970-01-04.
+            week = np.timedelta64(7, "D")
+            first_sunday = first_day - (first_day - np.datetime64("1970-01-04")) % week
+            n_weeks = (last_day - first_sunday) // week + 1
+            weeks_per_interval = -(-n_weeks // n_intervals)
+            boundaries = dates_to_decimals(
+                first_sunday
+                + np.arange(0, n_weeks, weeks_per_interval) * week
+            )
+        else:
+            raise ValueError(
+                'strategy must be either "quantile", "equal" or "epi-week".'
+            )
+
+        boundaries = boundaries[boundaries < youngest]
+        if boundaries.size:
+            boundaries[np.argmin(boundaries)] -= offset_earliest
+        times = youngest - boundaries
+        if parameter == "samplingRateChangeTimes":
+            self._free_zeroed_sampling_intervals()
+        self.set_rate_change_times(**{argument: times})
+        change_times = self.extract_rate_change_reverse_times(parameter)
+
+        if zero_empty_intervals and parameter == "samplingRateChangeTimes":
+            intervals = np.searchsorted(change_times, youngest - ages, side="right") - 1
+            # The change times run back from the youngest sample, but the
+            # dimensions of the sampling proportion run forward in time.
+            counts = np.bincount(
+                len(change_times) - 1 - intervals, minlength=len(change_times)
+            )
+            empty = np.flatnonzero(counts == 0)
+            if empty.size:
+                state = self._search_for_id_in_element(
+                    self.skeleton.state, "parameter", "samplingProportion", True
+                )
+                prior = self._search_for_prior("samplingProportion", True)
+                saved = [
+                    (state, state.tag, dict(state.attrib), state.text),
+                    (prior, prior.tag, dict(prior.attrib), prior.text),
+                ]
+                self.set_dimension_values_to_0(
+                    "samplingProportion", indexes=empty.tolist()
+                )
+                self._zeroed_sampling_intervals = saved
+
+        return change_times
+
+    def _free_zeroed_sampling_intervals(self):
+        """
+        Undo the fixing of empty sampling intervals to 0 done by an earlier call
+        of C{auto_rate_change_grid}.
+        """
+        saved, self._zeroed_sampling_intervals = self._zeroed_sampling_intervals, None
+        if saved is None:
+            return
+        for element, tag, attributes, text in saved:
+            element.tag = tag
+            element.attrib.clear()
+            element.attrib.update(attributes)
+            element.text = text
+        self.a_sampling_rate_has_been_fixed = False
+
+    def _rate_change_index(self, parameter):
+        """
+        Get the index of a change-time parameter in the reverseTimeArrays flags,
+        raising a ValueError for unsupported parameters.
+        """
+        try:
+            return list(self._rate_change_to_param_dict).index(parameter)
+        except ValueError:
+            raise ValueError(
+                "Currently this method only supports parameter being: "
+                + "birthRateChangeTimes (for changes in reproductive number), "
+                "deathRateChangeTimes (for changes in uninfectious rate) and "
+                + "samplingRateChangeTimes (for sampling proportion)."
+            ) from None
+
+    def _rate_change_argument(self, parameter):
+        """
+        Convert a change-time parameter name (e.g. birthRateChangeTimes) to the
+        corresponding C{set_rate_change_times} argument name.
+        """
+        return (
+            "birth_rate_change_times",
+            "death_rate_change_times",
+            "sampling_rate_change_times",
+        )[self._rate_change_index(parameter)]
+
+    def _check_rate_change_not_fixed(self, parameter):
+        index = self._rate_change_index(parameter)
+        if index == 0 and self.a_birth_rate_has_been_fixed:
+            raise AssertionError('A birth rate value has been fixed. Any changes to dimensions should be performed before any values are fixed.')
+        if index == 1 and self.a_death_rate_has_been_fixed:
+            raise AssertionError('A death rate value has been fixed. Any changes to dimensions should be performed before any values are fixed.')
+        if index == 2 and self.a_sampling_rate_has_been_fixed:
+            raise AssertionError('A sampling rate value has been fixed. Any changes to dimensions should be performed before any values are fixed.')
+
+    def _find_skyline_element(self):
+        skyline_element = self.skeleton.skyline
+        if skyline_element is None:
+            raise ValueError(
+                "No distribution of spec BirthDeathSkylineModel was found."
+                + "Currently this method only supports Birth Death Skyline Models."
+            )
+        return skyline_element
+
+    @staticmethod
+    def _get_reverse_time_array(skyline_element):
+        """
+        Get the reverseTimeArrays element of a skyline model (or C{None}) and its
+        flags as a list of bools.
+        """
+        rev_time_element = skyline_element.find("reverseTimeArrays")
+        if rev_time_element is None:
+            return None, [False, False, False, False, False]
+        if rev_time_element.text is not None and rev_time_element.text.strip():
+            if 'value' in rev_time_element.attrib:
+                raise AttributeError('XMLs reverse time element has both text and attrib["value"].')
+            rev_time_array = rev_time_element.text
+        elif 'value' in rev_time_element.attrib:
+            rev_time_array = rev_time_element.attrib['value']
+        else:
+            raise AttributeError('XMLs reverse time element needs text or attrib["value"].')
+        rev_time_array = rev_time_array.split()
+        return rev_time_element, [
+            val in ["true", "True", "TRUE"] for val in rev_time_array
+        ]
 
     def _begin_fix_dimension_values(self, parameter, wild_card_ending=True):
         if parameter.startswith("reproductiveNumber"):
@@ -1038,14 +2873,12 @@ class BEAST2XML(object):
             )
 
         parameter_state_node = self._search_for_id_in_element(
-            "./run/state/parameter", parameter, wild_card_ending
+            self.skeleton.state, "parameter", parameter, wild_card_ending
         )
         dims = int(parameter_state_node.get("dimension"))
         start_value = parameter_state_node.text
         start_values = [start_value] * dims
-        parameter_prior_node = self._search_for_id_in_element(
-                "./run/distribution/distribution/prior", parameter, wild_card_ending
-            )
+        parameter_prior_node = self._search_for_prior(parameter, wild_card_ending)
         return parameter_prior_node, parameter_state_node, dims, start_values
 
     def set_dimension_values_to_0(self, parameter, wild_card_ending=True, indexes=[0]):
@@ -1075,6 +2908,434 @@ class BEAST2XML(object):
         parameter_prior_node.attrib['spec'] = "beast.math.distributions.ExcludablePrior"
         parameter_prior_node.attrib['xInclude'] = " ".join(include_list)
 
+    def plan_logging(
+        self,
+        chain_length=None,
+        target_samples=None,
+        max_tree_log_bytes=None,
+        trace_log_every=None,
+        tree_log_every=None,
+        screen_log_every=None,
+        store_state_every=None,
+    ):
+        """
+        Choose logging intervals and estimate the sizes of the trace and tree logs.
+
+        The estimates use the number of taxa, the number of values in the trace
+        log and the approximate size of the Newick trees BEAST writes, so they are
+        good to within a few tens of percent.
+
+        Parameters
+        ----------
+        chain_length: int, default=None
+            The length of the MCMC chain. If C{None}, the value in the template is
+            used.
+        target_samples: int, default=None
+            The number of samples to log. If given, the trace, tree and screen logs
+            and the state file are all written every C{chain_length /
+            target_samples} states (rounded up to two significant figures). If
+            C{None}, the intervals in the template are used.
+        max_tree_log_bytes: int, default=None
+            If given, and C{tree_log_every} is not, the tree logging interval is
+            increased (if necessary) so that the tree log is not expected to be
+            larger than this.
+        trace_log_every: int, default=None
+            If given, the trace log is written this often, whatever
+            C{target_samples} is. The same goes for C{tree_log_every},
+            C{screen_log_every} and C{store_state_every}. The sizes of the logs
+            are estimated from the intervals that will be used.
+        tree_log_every: int, default=None
+        screen_log_every: int, default=None
+        store_state_every: int, default=None
+
+        Returns
+        -------
+        plan: dict
+            With keys "chain_length", "taxa", "trace_log_every", "tree_log_every",
+            "screen_log_every", "store_state_every", "trace_samples",
+            "tree_samples", "trace_log_bytes" and "tree_log_bytes".
+        """
+        return self._plan_logging(
+            self._sequences,
+            chain_length,
+            target_samples,
+            max_tree_log_bytes,
+            trace_log_every=trace_log_every,
+            tree_log_every=tree_log_every,
+            screen_log_every=screen_log_every,
+            store_state_every=store_state_every,
+        )
+
+    def _plan_logging(
+        self,
+        sequences,
+        chain_length,
+        target_samples,
+        max_tree_log_bytes,
+        trace_log_every=None,
+        tree_log_every=None,
+        screen_log_every=None,
+        store_state_every=None,
+    ):
+        """
+        Choose logging intervals for the given sequences (see C{plan_logging}).
+        """
+        skeleton = self.skeleton
+        run = skeleton.run
+        trace_logger = skeleton.trace_logger
+        tree_logger = skeleton.tree_logger
+        screen_logger = skeleton.screen_logger
+
+        if chain_length is None:
+            if run.get("chainLength") is None:
+                raise ValueError("No chain length was given or found in the template.")
+            chain_length = int(float(run.get("chainLength")))
+        if chain_length < 1:
+            raise ValueError("The chain length must be positive.")
+
+        # The intervals given explicitly, which override those planned.
+        explicit = {
+            "trace_log_every": trace_log_every,
+            "tree_log_every": tree_log_every,
+            "screen_log_every": screen_log_every,
+            "store_state_every": store_state_every,
+        }
+        trace_log_every = int(trace_logger.get("logEvery", 1))
+        tree_log_every = int(tree_logger.get("logEvery", 1))
+        screen_log_every = int(screen_logger.get("logEvery", 1))
+        store_state_every = (
+            None if run.get("storeEvery") is None else int(run.get("storeEvery"))
+        )
+        if target_samples is not None:
+            if target_samples < 1:
+                raise ValueError("target_samples must be positive.")
+            trace_log_every = _round_interval(-(-chain_length // target_samples))
+            tree_log_every = screen_log_every = trace_log_every
+        if explicit["tree_log_every"] is not None:
+            tree_log_every = explicit["tree_log_every"]
+
+        short_ids = [id_.split()[0] for id_ in _sequence_ids(sequences)]
+        taxa = len(short_ids)
+        label_bytes = len(str(taxa))
+        state_bytes = len(str(chain_length))
+        nodes = max(2 * taxa - 1, 0)
+        # The translate block maps each taxon number to its id.
+        translate_bytes = sum(len(short_id) + label_bytes + 4 for short_id in short_ids)
+        tree_bytes = (
+            len("tree STATE_ = \n;") + state_bytes
+            + taxa * (label_bytes + 2)  # labels, parentheses and commas
+            + max(nodes - 1, 0) * (self.LOG_VALUE_BYTES + 1)  # branch lengths
+        )
+        if any(log.get("branchratemodel") for log in tree_logger):
+            tree_bytes += nodes * self.TREE_METADATA_BYTES
+
+        if max_tree_log_bytes is not None and explicit["tree_log_every"] is None:
+            max_tree_samples = (max_tree_log_bytes - translate_bytes) // tree_bytes
+            if max_tree_samples < 1:
+                raise ValueError(
+                    "max_tree_log_bytes is too small to log one tree of %d taxa "
+                    "(about %d bytes)." % (taxa, translate_bytes + tree_bytes)
+                )
+            # BEAST also logs the initial state, so one sample is taken at 0.
+            tree_log_every = max(
+                tree_log_every,
+                chain_length + 1
+                if max_tree_samples == 1
+                else _round_interval(-(-chain_length // (max_tree_samples - 1))),
+            )
+        if target_samples is not None or max_tree_log_bytes is not None:
+            store_state_every = tree_log_every
+        if explicit["trace_log_every"] is not None:
+            trace_log_every = explicit["trace_log_every"]
+        if explicit["screen_log_every"] is not None:
+            screen_log_every = explicit["screen_log_every"]
+        if explicit["store_state_every"] is not None:
+            store_state_every = explicit["store_state_every"]
+
+        trace_values = 0
+        for log in trace_logger:
+            target = (
+                self._tree.find(".//*[@id='%s']" % log.get("idref"))
+                if log.get("idref")
+                else log
+            )
+            dimension = None if target is None else target.get("dimension")
+            trace_values += int(dimension) if dimension and dimension.isdigit() else 1
+        trace_samples = chain_length // trace_log_every + 1
+        tree_samples = chain_length // tree_log_every + 1
+
+        return {
+            "chain_length": chain_length,
+            "taxa": taxa,
+            "trace_log_every": trace_log_every,
+            "tree_log_every": tree_log_every,
+            "screen_log_every": screen_log_every,
+            "store_state_every": store_state_every,
+            "trace_samples": trace_samples,
+            "tree_samples": tree_samples,
+            "trace_log_bytes": trace_samples
+            * (state_bytes + 1 + trace_values * (self.LOG_VALUE_BYTES + 1)),
+            "tree_log_bytes": translate_bytes + tree_samples * tree_bytes,
+        }
+
+    def _set_site_filters(self, sequences, strip_invariant_sites):
+        """
+        Set the alignment filters of the tree likelihoods, stripping invariant
+        sites if asked to.
+
+        The filters are reset on every render, so a template can be rendered
+        with and without stripping.
+
+        Parameters
+        ----------
+        sequences: dark.reads.Reads or beast2xml.storage.DiskReads
+            The sequences being written.
+        strip_invariant_sites: bool
+            If True, only the variable sites of C{sequences} are kept and the
+            constant ones are given as C{constantSiteWeights}.
+
+        Returns
+        -------
+        dark.reads.Reads or beast2xml.storage.DiskReads
+            The sequences to write. Sequences kept on disk are stripped into a
+            new C{DiskReads}, so they are never all in memory at once.
+        """
+        root = self._tree.getroot()
+        data_id = self.skeleton.data_id
+        variable_id = data_id + ".variable"
+        if self._partitions:
+            filtered = [
+                (root.find("data[@id='%s']" % partition_id), filter_)
+                for partition_id, filter_ in self._partitions
+            ]
+            for element, filter_ in filtered:
+                element.set("filter", filter_)
+                element.attrib.pop("constantSiteWeights", None)
+        else:
+            element = root.find("data[@id='%s']" % variable_id)
+            if element is not None:
+                root.remove(element)
+                for tree_likelihood in root.iter("distribution"):
+                    if tree_likelihood.get("data") == "@" + variable_id:
+                        tree_likelihood.set("data", "@" + data_id)
+
+        if not strip_invariant_sites:
+            return sequences
+
+        if isinstance(sequences, DiskReads):
+            if not len(sequences):
+                return sequences
+        else:
+            sequences = list(sequences)
+            if not sequences:
+                return Reads()
+        variable, constant = site_classes(sequence.sequence for sequence in sequences)
+        if not variable.any():
+            raise ValueError("The alignment has no variable sites.")
+        # The index of each original column among the variable columns.
+        new_column = np.cumsum(variable) - 1
+
+        if self._partitions:
+            length = len(variable)
+            for element, filter_ in filtered:
+                columns = filter_columns(filter_, length)
+                kept = np.sort(columns[variable[columns]])
+                if not len(kept):
+                    raise ValueError(
+                        "Partition %r has no variable sites." % element.get("id")
+                    )
+                element.set("filter", columns_filter(new_column[kept]))
+                element.set(
+                    "constantSiteWeights",
+                    " ".join(
+                        map(str, np.bincount(constant[columns] + 1, minlength=5)[1:])
+                    ),
+                )
+        else:
+            data_index = list(root).index(self.skeleton.data)
+            root.insert(
+                data_index + 1,
+                ET.Element(
+                    "data",
+                    id=variable_id,
+                    spec="FilteredAlignment",
+                    filter="-",
+                    data="@" + data_id,
+                    constantSiteWeights=" ".join(
+                        map(str, np.bincount(constant + 1, minlength=5)[1:])
+                    ),
+                ),
+            )
+            for tree_likelihood in root.iter("distribution"):
+                if tree_likelihood.get("data") == "@" + data_id:
+                    tree_likelihood.set("data", "@" + variable_id)
+
+        stripped = (
+            Read(
+                sequence.id,
+                np.frombuffer(sequence.sequence.encode("ascii"), dtype=np.uint8)[
+                    variable
+                ]
+                .tobytes()
+                .decode("ascii"),
+            )
+            for sequence in sequences
+        )
+        if isinstance(sequences, DiskReads):
+            return DiskReads(stripped)
+        return Reads(list(stripped))
+
+    def _set_likelihood_options(self, threads, partition_threads, use_ambiguities):
+        """
+        Set the threading and ambiguity options of the tree likelihoods.
+
+        Parameters
+        ----------
+        threads: int or None
+            The number of threads of the likelihood C{CompoundDistribution}.
+        partition_threads: int, dict or None
+            The number of threads of each tree likelihood, or a C{dict} of them
+            keyed by partition (data) id.
+        use_ambiguities: bool or None
+            The C{useAmbiguities} value of each tree likelihood.
+        """
+        likelihood = self.skeleton.likelihood
+        if likelihood is None:
+            raise ValueError(
+                "Could not find a distribution with id 'likelihood' in XML template."
+            )
+        tree_likelihoods = {
+            element.get("data").lstrip("@"): element
+            for element in likelihood.findall("distribution[@data]")
+        }
+
+        if threads is not None:
+            if not isinstance(threads, int) or threads < 1:
+                raise ValueError("threads must be a positive integer.")
+            likelihood.set("useThreads", "true" if threads > 1 else "false")
+            likelihood.set("threads", str(threads))
+
+        if partition_threads is not None:
+            if not isinstance(partition_threads, dict):
+                partition_threads = dict.fromkeys(tree_likelihoods, partition_threads)
+            unknown = set(partition_threads) - set(tree_likelihoods)
+            if unknown:
+                raise ValueError(
+                    "Unknown partition(s) in partition_threads: %s."
+                    % ", ".join(sorted(unknown))
+                )
+            for data_id, count in partition_threads.items():
+                if not isinstance(count, int) or count < 1:
+                    raise ValueError(
+                        "The number of threads for partition %r must be a "
+                        "positive integer." % data_id
+                    )
+                tree_likelihoods[data_id].set("threads", str(count))
+
+        if use_ambiguities is not None:
+            for element in tree_likelihoods.values():
+                element.set("useAmbiguities", "true" if use_ambiguities else "false")
+
+    def partition_alignment(
+        self, coordinates=None, codon_positions=False, feature_type="CDS"
+    ):
+        """
+        Split the alignment into partitions, each with its own tree likelihood so
+        that BEAST can compute them in parallel.
+
+        Each partition is a BEAST2 FilteredAlignment over the columns of the added
+        alignment, so no sequence data is duplicated. The partition likelihoods
+        are copies of the template's tree likelihood that share its tree, site
+        model and clock model, and each is logged in place of the original.
+
+        Parameters
+        ----------
+        coordinates: str or list of (str, int, int), default None
+            A path to a BED file (ending in .bed) or a GFF3/GTF file, or a list of
+            region names with 1-based inclusive start and end coordinates (see
+            C{beast2xml.partitions.partition_filters}). A GFF feature split over
+            several lines becomes one partition. If None, C{codon_positions} must
+            be True and the whole alignment is split by codon position.
+        codon_positions: bool, default False
+            If True, split each region (or the whole alignment) into three
+            partitions, one per codon position.
+        feature_type: str or None, default "CDS"
+            The type of GFF features to read regions from. If None, all features
+            are used.
+        """
+        if self._partitions:
+            raise ValueError("The alignment has already been partitioned.")
+        if isinstance(coordinates, str):
+            if coordinates.endswith(".bed"):
+                regions = read_bed(coordinates)
+            else:
+                regions = read_gff(coordinates, feature_type)
+        else:
+            regions = coordinates
+
+        # Undo any invariant site stripping done by an earlier render.
+        self._set_site_filters(Reads(), False)
+        data = self.skeleton.data
+        data_id = self.skeleton.data_id
+        partitions = partition_filters(data_id, regions, codon_positions)
+        if not partitions:
+            raise ValueError("No partitions were found in %r." % coordinates)
+
+        likelihood = self.skeleton.likelihood
+        tree_likelihood = (
+            None
+            if likelihood is None
+            else likelihood.find("distribution[@data='@%s']" % data_id)
+        )
+        if tree_likelihood is None:
+            raise ValueError(
+                "Could not find a tree likelihood for %r in XML template" % data_id
+            )
+        shared = [
+            (child.tag, child.get("id"))
+            for child in tree_likelihood
+            if child.tag in ("siteModel", "branchRateModel")
+        ]
+        root = self._tree.getroot()
+        data_index = list(root).index(data)
+        likelihood_index = list(likelihood).index(tree_likelihood)
+        likelihood.remove(tree_likelihood)
+
+        likelihood_ids = []
+        for number, (partition_id, filter_) in enumerate(partitions):
+            root.insert(
+                data_index + 1 + number,
+                ET.Element(
+                    "data",
+                    id=partition_id,
+                    spec="FilteredAlignment",
+                    filter=filter_,
+                    data="@" + data_id,
+                ),
+            )
+            if number == 0:
+                partition_likelihood = deepcopy(tree_likelihood)
+            else:
+                # Later partitions refer to the site and clock models of the first.
+                partition_likelihood = ET.Element(
+                    tree_likelihood.tag, dict(tree_likelihood.attrib)
+                )
+                for tag, id_ in shared:
+                    partition_likelihood.set(tag, "@" + id_)
+            partition_likelihood.set("id", "treeLikelihood." + partition_id)
+            partition_likelihood.set("data", "@" + partition_id)
+            likelihood.insert(likelihood_index + number, partition_likelihood)
+            likelihood_ids.append(partition_likelihood.get("id"))
+
+        for logger in root.iter("logger"):
+            for index, log in reversed(list(enumerate(logger))):
+                if log.tag == "log" and log.get("idref") == tree_likelihood.get("id"):
+                    logger.remove(log)
+                    for number, id_ in enumerate(likelihood_ids):
+                        logger.insert(index + number, ET.Element("log", idref=id_))
+
+        self._partitions = partitions
+
     def add_initial_tree(
         self,
         file_path,
@@ -1125,6 +3386,7 @@ class BEAST2XML(object):
         -------
         None
         """
+        stopwatch = self.metrics.start()
         initial_phylo_tree = ete3.Tree(file_path, format=format)
         if replacement_for_zero_lengths != 0:
             for node in initial_phylo_tree.iter_descendants():
@@ -1134,15 +3396,173 @@ class BEAST2XML(object):
         self._initial_phylo_tree_format = format
         self._IsLabelledNewick = str(is_labelled_newick).lower()
         self._adjustTipHeights = str(adjust_tip_heights).lower()
+        stopwatch.lap("add_initial_tree", taxa=len(initial_phylo_tree))
+
+    def warm_start_from(
+        self,
+        previous_basename,
+        graft=True,
+        parameters=True,
+        date_direction=None,
+        default_age=0.0,
+    ):
+        """
+        Start the chain from where a previous run (e.g. of this analysis before
+        sequences were added or priors changed) finished, instead of from a
+        random tree.
+
+        The last tree of the previous run's tree log becomes the initial tree
+        (see C{add_initial_tree}). Taxa that are no longer among the added
+        sequences are pruned from it, and the taxa of new sequences are
+        grafted onto it (see C{beast2xml.treelog.graft_tips}) at the heights
+        given by their ages. The last values of the state parameters in the
+        previous run's trace log become their starting values (see
+        C{change_parameter_state_node}), so call this after any changes to the
+        dimensions of parameters.
+
+        Parameters
+        ----------
+        previous_basename: str
+            The log basename of the previous run (as given to C{to_xml} as
+            C{log_file_basename}). Its tree log is C{previous_basename +
+            ".trees"} and its trace log C{previous_basename + ".log"}.
+        graft: bool, default True
+            If True, new taxa are grafted onto the tree. Otherwise they are
+            only warned about (and C{to_xml} will leave them out).
+        parameters: bool, default True
+            If True, and the trace log exists, the starting values of the state
+            parameters are taken from its last sample. Values outside a
+            parameter's bounds, or with the wrong dimension, are skipped.
+        date_direction: str, default None
+            As given to C{to_xml}, to say how ages become tip heights. If None,
+            the traitname of the template's trait is used.
+        default_age: float or int, default 0.0
+            The age of sequences without one (as given to C{to_xml}).
+
+        Returns
+        -------
+        result: dict
+            With keys "pruned" and "new" (sorted lists of the taxa removed from
+            and new to the tree), "grafted" (C{True} if the new taxa were
+            grafted on) and "parameters" (the starting values set, keyed by
+            parameter id).
+
+        Raises
+        ------
+        ValueError
+            If the tree log does not exist or has no trees, fewer than two of
+            its taxa are among the added sequences, or new taxa are grafted on
+            and an age is not a number.
+        """
+        stopwatch = self.metrics.start()
+        tree = last_tree(previous_basename + self.TREELOG_SUFFIX)
+        taxa = [id_.split()[0] for id_ in _sequence_ids(self._sequences)]
+        present = set(tree.get_leaf_names())
+        keep = [name for name in taxa if name in present]
+        if len(keep) < 2:
+            raise ValueError(
+                "Fewer than two of the taxa in the tree log of %r are among the "
+                "added sequences." % previous_basename
+            )
+        pruned = sorted(present.difference(taxa))
+        new = sorted(set(taxa).difference(present))
+        if pruned:
+            tree.prune(keep, preserve_branch_length=True)
+        if new and graft:
+            if date_direction is None:
+                traitname = self.skeleton.trait.get("traitname")
+            elif date_direction == "date":
+                traitname = "date"
+            else:
+                traitname = "date-" + date_direction
+            ages = {}
+            for name in taxa:
+                age = self._age_by_short_id.get(name, default_age)
+                if not isinstance(age, (float, int)):
+                    raise ValueError(
+                        "New taxa can only be grafted on with numeric ages, "
+                        "not %r (for %r)." % (age, name)
+                    )
+                ages[name] = float(age)
+            if traitname == "date-backward":
+                youngest = min(ages.values())
+                heights = {name: age - youngest for name, age in ages.items()}
+            else:
+                youngest = max(ages.values())
+                heights = {name: youngest - age for name, age in ages.items()}
+            tree = graft_tips(tree, heights)
+        elif new:
+            warnings.warn(
+                "%d added sequence(s) are not in the tree log of %r and will not "
+                "be added to the xml being generated: %s."
+                % (len(new), previous_basename, ", ".join(new))
+            )
+        self.add_initial_tree(
+            tree.write(format=5, dist_formatter="%0.10g"),
+            format=5,
+            adjust_tip_heights=True,
+        )
 
-    def set_diffs_initial_tree_and_sequences(self):
+        values = {}
+        trace_path = previous_basename + self.TRACELOG_SUFFIX
+        if parameters and os.path.exists(trace_path):
+            trace = TraceLog(trace_path)
+            if len(trace):
+                last = {name: trace[name][-1] for name in trace.columns[1:]}
+                for node in self.skeleton.state.findall("parameter"):
+                    id_ = node.get("id")
+                    dimension = int(node.get("dimension", "1"))
+                    if dimension == 1:
+                        names = [id_]
+                    else:
+                        names = [
+                            "%s.%d" % (id_, index + 1) for index in range(dimension)
+                        ]
+                    if not all(name in last for name in names):
+                        continue
+                    parameter = [float(last[name]) for name in names]
+                    lower = float(node.get("lower", "-Infinity"))
+                    upper = float(node.get("upper", "Infinity"))
+                    if all(lower <= value <= upper for value in parameter):
+                        values[id_] = " ".join(map(repr, parameter))
+                        self.change_parameter_state_node(
+                            id_, value=values[id_], wild_card_ending=False
+                        )
+        stopwatch.lap("warm_start_from", taxa=len(keep) + len(new))
+        return {
+            "pruned": pruned,
+            "new": new,
+            "grafted": bool(new and graft),
+            "parameters": values,
+        }
+
+    def set_diffs_initial_tree_and_sequences(self, sequences=None):
+        if sequences is None:
+            sequences = self._sequences
         tree_tips = set(self._initial_phylo_tree.get_leaf_names())
-        sequence_tips = set([sequence.id for sequence in self._sequences])
+        sequence_tips = set(_sequence_ids(sequences))
         return {
             "in initial tree": tree_tips - sequence_tips,
             "in sequences": sequence_tips - tree_tips,
         }
 
+    def extract_ages(self):
+        """
+        Extract the ids and ages (year decimals if the xml holds dates) from the
+        dateTrait of the xml.
+
+        Returns
+        -------
+        ids: numpy.ndarray of str
+        ages: numpy.ndarray of float64
+        """
+        date_node = self.skeleton.trait
+        if 'value' in date_node.attrib and date_node.attrib['value'].strip():
+            age_text = date_node.attrib['value']
+        else:
+            age_text = date_node.text or ''
+        return _parse_trait_text(age_text)
+
     def extract_youngest_year_decimal(self):
         """
         Extract the youngest year decimal from xml.
@@ -1151,26 +3571,24 @@ class BEAST2XML(object):
         -------
         float
         """
-        elements = self.find_elements(self._tree)
-        date_node = elements['./run/state/tree/trait']
-        if 'value' in date_node.attrib:
-            age_text = date_node.attrib['value']
-        else:
-            age_text = date_node.text
-        ages_df = pd.DataFrame.from_records(
-            [{'ID': age_text_unit.split('=')[0], 'age': age_text_unit.split('=')[1]} for age_text_unit in
-             age_text.split(',')],
-        )
-        try:
-            ages_df['age'] = pd.to_numeric(ages_df['age'], errors='raise')
-        except:
-            try:
-                ages_df['age'] = pd.to_datetime(ages_df['age'],format='mixed', errors='raise')
-                ages_df['age'] = ages_df['age'].map(date_to_decimal)
-            except:
-                raise ValueError('Could not convert age/date information in xml into a date or float')
-        return max(ages_df['age'])
+        return float(self.extract_ages()[1].max())
 
+    def _ages(self):
+        """
+        Get the added ages as an array, falling back to the ages in the xml if
+        none have been added.
+
+        Returns
+        -------
+        numpy.ndarray of float64
+        """
+        if self._age_by_short_id:
+            return np.fromiter(
+                self._age_by_short_id.values(),
+                dtype=np.float64,
+                count=len(self._age_by_short_id),
+            )
+        return self.extract_ages()[1]
 
     def extract_rate_change_reverse_times(self, parameter):
         """
@@ -1185,14 +3603,7 @@ class BEAST2XML(object):
         ---------
         numpy.array
         """
-        skyline_element = self._tree.find(
-            "./run/distribution/distribution/distribution[@spec='beast.evolution.speciation.BirthDeathSkylineModel']"
-        )
-        if skyline_element is None:
-            raise ValueError(
-                "No distribution of spec BirthDeathSkylineModel was found."
-                + "Currently this method only supports Birth Death Skyline Models."
-            )
+        skyline_element = self._find_skyline_element()
         rev_time_element = skyline_element.find("reverseTimeArrays")
         if rev_time_element is None:
             raise ValueError('No reverseTimeArrays was found.')
@@ -1203,4 +3614,4 @@ class BEAST2XML(object):
             text = parameter_element.attrib['value']
         else:
             text = parameter_element.text
-        return np.array([float(item) for item in text.split(' ')])
\ No newline at end of file
+        return np.array(text.split(), dtype=np.float64)
\ No newline at end of file
@@ -0,0 +1,225 @@
+from __future__ import print_function, division
+import hashlib
+import json
+import os
+import shutil
+
+from beast2xml.storage import parse_size
+
+# Part of every key. Increase it when a change to rendering changes the XML
+# made from the same inputs, so outputs cached by older versions are not used.
+CACHE_VERSION = 1
+
+
+def _json_default(value):
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return str(value)
+
+
+class RenderCache(object):
+    """
+    An on-disk cache of rendered XML files, keyed by a hash of everything the
+    XML is made from.
+
+    Cached files are hard linked (or copied, if that is not possible) to and
+    from the cache, so an output must be replaced rather than modified in
+    place once it has been stored or fetched. C{BEAST2XML.to_xml} (with or
+    without a cache) and C{beast2xml.batch.render_job} always write to a
+    temporary file that replaces their output.
+
+    Parameters
+    ----------
+    directory: str
+        The directory to keep cached files in. It is made if it does not exist.
+    max_bytes: int or str, default=None
+        If given, the least recently used files are removed once the cache is
+        larger than this (a number of bytes or a size such as "20G", see
+        C{beast2xml.storage.parse_size}).
+    max_entries: int, default=None
+        If given, the least recently used files are removed once the cache holds
+        more than this many.
+    """
+
+    SUFFIX = ".xml"
+    DIGESTS = "digests.json"
+
+    def __init__(self, directory, max_bytes=None, max_entries=None):
+        self.directory = directory
+        self.max_bytes = None if max_bytes is None else parse_size(max_bytes)
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+        self._digests = None
+
+    @staticmethod
+    def key(*parts):
+        """
+        Make a cache key.
+
+        Parameters
+        ----------
+        parts: tuple
+            Anything that can be converted to JSON (numpy arrays and sets are
+            converted to lists, and other values to strings).
+
+        Returns
+        -------
+        key: str
+            A hex SHA-256 digest.
+        """
+        return hashlib.sha256(
+            json.dumps(
+                [CACHE_VERSION, parts], sort_keys=True, default=_json_default
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def file_digest(self, path, chunk_size=1 << 20):
+        """
+        Get the SHA-256 digest of a file's content.
+
+        The file is read in chunks, and digests are remembered (in the cache
+        directory) against the file's path, size and modification time, so an
+        unchanged file is only read once.
+
+        Parameters
+        ----------
+        path: str
+        chunk_size: int, default 1 << 20
+            The number of bytes to read at a time.
+
+        Returns
+        -------
+        str
+            A hex digest.
+        """
+        stat = os.stat(path)
+        signature = "%s:%d:%d" % (os.path.realpath(path), stat.st_size, stat.st_mtime_ns)
+        digests = self._load_digests()
+        if signature not in digests:
+            digest = hashlib.sha256()
+            with open(path, "rb") as fp:
+                for chunk in iter(lambda: fp.read(chunk_size), b""):
+                    digest.update(chunk)
+            digests[signature] = digest.hexdigest()
+            self._save_digests()
+        return digests[signature]
+
+    def _load_digests(self):
+        if self._digests is None:
+            try:
+                with open(os.path.join(self.directory, self.DIGESTS)) as fp:
+                    self._digests = json.load(fp)
+            except (OSError, ValueError):
+                self._digests = {}
+        return self._digests
+
+    def _save_digests(self):
+        path = os.path.join(self.directory, self.DIGESTS)
+        tmp = "%s.tmp-%d" % (path, os.getpid())
+        with open(tmp, "w") as fp:
+            json.dump(self._digests, fp)
+        os.replace(tmp, path)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    @staticmethod
+    def _link(source, destination):
+        """
+        Hard link (or copy) a file, replacing the destination.
+        """
+        tmp = "%s.tmp-%d" % (destination, os.getpid())
+        try:
+            os.link(source, tmp)
+        except OSError:
+            shutil.copyfile(source, tmp)
+        os.replace(tmp, destination)
+
+    def fetch(self, key, path):
+        """
+        Put a cached file at a path, if there is one for a key.
+
+        Parameters
+        ----------
+        key: str
+        path: str
+
+        Returns
+        -------
+        bool
+            True if the file was cached.
+        """
+        cached = self._path(key)
+        try:
+            # Mark the file as recently used.
+            os.utime(cached)
+        except FileNotFoundError:
+            return False
+        self._link(cached, path)
+        return True
+
+    def store(self, key, path):
+        """
+        Cache a file, then remove the least recently used files if the cache
+        is over its limits.
+
+        Parameters
+        ----------
+        key: str
+        path: str
+        """
+        self._link(path, self._path(key))
+        self.evict()
+
+    def entries(self):
+        """
+        Get the cached files.
+
+        Returns
+        -------
+        entries: list of (str, int, float)
+            The key, size and last use time of each cached file, least recently
+            used first.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(self.SUFFIX):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append(
+                    (entry.name[: -len(self.SUFFIX)], stat.st_size, stat.st_mtime)
+                )
+        entries.sort(key=lambda entry: entry[2])
+        return entries
+
+    def evict(self):
+        """
+        Remove the least recently used files until the cache is within its
+        limits.
+
+        Returns
+        -------
+        int
+            The number of files removed.
+        """
+        if self.max_bytes is None and self.max_entries is None:
+            return 0
+        entries = self.entries()
+        size = sum(entry[1] for entry in entries)
+        removed = 0
+        for key, entry_size, _ in entries:
+            if (self.max_bytes is None or size <= self.max_bytes) and (
+                self.max_entries is None or len(entries) - removed <= self.max_entries
+            ):
+                break
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+            removed += 1
+        return removed
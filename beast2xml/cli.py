@@ -0,0 +1,402 @@
+from __future__ import print_function, division
+import sys
+from itertools import chain
+
+# This module only uses the standard library, so that command line clients
+# (see bin/beast2-xml-client.py) start quickly.
+
+# The to_xml arguments given by the command line options of add_arguments.
+TO_XML_OPTIONS = (
+    "chain_length",
+    "default_age",
+    "date_direction",
+    "log_file_basename",
+    "trace_log_every",
+    "tree_log_every",
+    "screen_log_every",
+    "mimic_beauti",
+    "threads",
+    "partition_threads",
+    "use_ambiguities",
+    "target_samples",
+    "max_tree_log_bytes",
+)
+
+# The interval used for the logs whose interval is not given or planned.
+DEFAULT_LOG_EVERY = 2000
+
+
+def add_arguments(parser):
+    """
+    Add the command line options of bin/beast2-xml.py (other than those for
+    reading FASTA) to a parser.
+
+    Parameters
+    ----------
+    parser: argparse.ArgumentParser
+    """
+    # A mutually exclusive group for either --clock_model or --template_file.
+    group = parser.add_mutually_exclusive_group()
+
+    group.add_argument(
+        "--clock_model",
+        metavar="MODEL",
+        default="strict",
+        choices=("random-local", "relaxed-exponential", "relaxed-lognormal", "strict"),
+        help=(
+            "Specify the clock model. Possible values are "
+            "'random-local', 'relaxed-exponential', 'relaxed-lognormal', "
+            "or 'strict'"
+        ),
+    )
+
+    group.add_argument(
+        "--template_file", metavar="FILENAME", help="The XML template file to use."
+    )
+
+    parser.add_argument(
+        "--chain_length", type=int, metavar="LENGTH", help="The MCMC chain length."
+    )
+
+    parser.add_argument(
+        "--age",
+        metavar="ID=N",
+        nargs="+",
+        action="append",
+        help=(
+            "The age of a sequence. The format is a sequence id, an equals "
+            "sign, then the age. For convenience, just the first part "
+            "of a full sequence id (i.e., up to the first space) may be given. "
+            "May be specified multiple times."
+        ),
+    )
+
+    parser.add_argument(
+        "--default_age",
+        type=float,
+        default=0.0,
+        metavar="N",
+        help=(
+            "The age to use for sequences that are not explicitly given an "
+            "age via --age."
+        ),
+    )
+
+    parser.add_argument(
+        "--date_unit",
+        metavar="UNIT",
+        choices=("day", "month", "year"),
+        default="year",
+        help=("Specify the date unit. Possible values are " "'day', 'month', or 'year'."),
+    )
+
+    parser.add_argument(
+        "--date_direction",
+        metavar="DIRECTION",
+        choices=("backward", "forward"),
+        default="backward",
+        help=(
+            "Specify whether dates are back in time from the present or "
+            "forward in time from some point in the past. Possible values are "
+            "'forward' or 'backward'."
+        ),
+    )
+
+    parser.add_argument(
+        "--log_file_basename",
+        default="beast-output",
+        metavar="BASE-FILENAME",
+        help=(
+            'The base filename to write logs to. A ".log" or ".trees" suffix '
+            "will be appended to this to make complete log file names."
+        ),
+    )
+
+    parser.add_argument(
+        "--trace_log_every",
+        type=int,
+        metavar="N",
+        help=(
+            "How often to write to the trace log file. If not given, this is chosen by "
+            "--target_samples or --max_tree_log_bytes, or is 2000."
+        ),
+    )
+
+    parser.add_argument(
+        "--tree_log_every",
+        type=int,
+        metavar="N",
+        help=(
+            "How often to write to the tree log file. If not given, this is chosen by "
+            "--target_samples or --max_tree_log_bytes, or is 2000."
+        ),
+    )
+
+    parser.add_argument(
+        "--screen_log_every",
+        type=int,
+        metavar="N",
+        help=(
+            "How often to write logging to the screen (i.e., terminal). If not given, this is chosen by "
+            "--target_samples or --max_tree_log_bytes, or is 2000."
+        ),
+    )
+
+    parser.add_argument(
+        "--target_samples",
+        type=int,
+        metavar="N",
+        help=(
+            "Choose the log intervals not given explicitly so that about this many "
+            "samples are logged over the chain length. The logging plan and "
+            "estimated log sizes are printed to standard error."
+        ),
+    )
+
+    parser.add_argument(
+        "--max_tree_log_bytes",
+        metavar="SIZE",
+        help=(
+            "Choose the tree log interval (if --tree_log_every is not given) so the "
+            "tree log is not expected to be larger than this. A K, M, G or T suffix "
+            "may be used (e.g., 20G). The logging plan and estimated log sizes are "
+            "printed to standard error."
+        ),
+    )
+
+    parser.add_argument(
+        "--mimic_beauti",
+        action="store_true",
+        help=(
+            "If specified, add attributes to the <beast> tag that mimic what "
+            "BEAUti uses so that BEAUti will be able to load the XML."
+        ),
+    )
+
+    parser.add_argument(
+        "--threads",
+        type=int,
+        metavar="N",
+        help=(
+            "The number of threads BEAST should use to compute the likelihoods of "
+            "the alignment partitions in parallel. If 1, threading is turned off. "
+            "If not given, the value in the template is used."
+        ),
+    )
+
+    parser.add_argument(
+        "--partition_threads",
+        type=int,
+        metavar="N",
+        help=(
+            "The number of threads each tree likelihood should use. If not given, "
+            "the value in the template is used."
+        ),
+    )
+
+    parser.add_argument(
+        "--use_ambiguities",
+        action="store_true",
+        default=None,
+        help=(
+            "If specified, the tree likelihoods will treat ambiguous nucleotide "
+            "codes as partially known, instead of as gaps."
+        ),
+    )
+
+    parser.add_argument(
+        "--metrics_json",
+        "--metrics-json",
+        metavar="FILE",
+        help=(
+            "A file to write (as JSON) the duration of each stage of building and "
+            "rendering the XML, with taxon, site and byte counts."
+        ),
+    )
+
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=(
+            "If specified, print the duration of each stage of building and "
+            "rendering the XML and the functions taking the most time (according "
+            "to cProfile) to standard error."
+        ),
+    )
+
+    parser.add_argument(
+        "--sequence_id_date_regex",
+        metavar="REGEX",
+        help=(
+            "A regular expression that will be used to capture sequence dates "
+            "from their ids. The regular expression must have three named "
+            'capture regions ("year", "month", and "day"). Regular expression '
+            "matching is anchored to the start of the id string (i.e., "
+            "Python's re.match function is used, not the re.search function), "
+            "so you must explicitly match the id from its beginning. For "
+            "example, you might use --sequence_id_date_regex "
+            r"'^.*_(?P<year>\d\d\d\d)-(?P<month>\d\d)-(?P<day>\d\d)'."
+        ),
+    )
+
+    parser.add_argument(
+        "--sequence_id_age_regex",
+        metavar="REGEX",
+        help=(
+            "A regular expression that will be used to capture sequence ages "
+            "from their ids. The regular expression must have a single "
+            "capture region. Regular expression matching is anchored to the "
+            "start of the id string (i.e., Python's re.match function is used, "
+            "not the re.search function), so you must explicitly match the id "
+            "from its beginning. For example, you might use "
+            r"--sequence_id_age_regex '^.*_(\d+)$' to capture an age preceded by "
+            "an underscore at the very end of the sequence id. If "
+            "--sequence_id_date_regex is also given, it takes precedence when "
+            "matching sequence ids."
+        ),
+    )
+
+    parser.add_argument(
+        # Note that --sequence_id_date_regexMayNotMatch is maintained here for
+        # backwards compatibility.
+        "--sequenceIdRegexMayNotMatch",
+        "--sequence_id_date_regexMayNotMatch",
+        action="store_false",
+        dest="sequence_id_regex_must_match",
+        help=(
+            "If specified (and --sequence_id_date_regex or --sequence_id_age_regex is "
+            "given) it will not be considered an error if a sequence id does "
+            "not match the given regular expression. In that case, sequences "
+            "will be assigned an age of zero unless one is given via --age."
+        ),
+    )
+
+
+def add_fasta_arguments(parser):
+    """
+    Add options for giving FASTA input, matching those added by
+    C{dark.reads.addFASTACommandLineOptions}, but taking the input file as a
+    path.
+
+    Parameters
+    ----------
+    parser: argparse.ArgumentParser
+    """
+    parser.add_argument(
+        "--fastaFile",
+        metavar="FILENAME",
+        help=(
+            "The name of the FASTA input file. Standard input will be read "
+            "if '-' is used or if no file name is given."
+        ),
+    )
+
+    parser.add_argument(
+        "--readClass",
+        default="DNARead",
+        metavar="CLASSNAME",
+        help="If specified, give the type of the reads in the input.",
+    )
+
+    group = parser.add_mutually_exclusive_group()
+
+    group.add_argument(
+        "--fasta",
+        action="store_true",
+        help="If specified, input will be treated as FASTA. This is the default.",
+    )
+
+    group.add_argument(
+        "--fastq",
+        action="store_true",
+        help="If specified, input will be treated as FASTQ.",
+    )
+
+    group.add_argument(
+        "--fasta-ss",
+        dest="fasta_ss",
+        action="store_true",
+        help=(
+            "If specified, input will be treated as PDB FASTA "
+            "(i.e., regular FASTA with each sequence followed by its "
+            "structure)."
+        ),
+    )
+
+
+def request_from_args(args):
+    """
+    Make a render request (see C{beast2xml.server.render_request}) from parsed
+    command line options.
+
+    The FASTA input options are not included.
+
+    Parameters
+    ----------
+    args: argparse.Namespace
+        As returned by a parser given the options of C{add_arguments}.
+
+    Returns
+    -------
+    request: dict
+    """
+    to_xml = {name: getattr(args, name) for name in TO_XML_OPTIONS}
+    if to_xml["target_samples"] is None and to_xml["max_tree_log_bytes"] is None:
+        for name in "trace_log_every", "tree_log_every", "screen_log_every":
+            if to_xml[name] is None:
+                to_xml[name] = DEFAULT_LOG_EVERY
+
+    ages = {}
+    if args.age:
+        # Flatten lists of lists that we get from using both nargs='+' and
+        # action='append'. We use both because it allows people to use --age on
+        # the command line either via "--age id1=33 --age id2=21" or "--age
+        # id1=33 id2=21", or a combination of these. That way it's not necessary
+        # to remember which way you're supposed to use it and you also can't be
+        # hit by the subtle problem encountered in
+        # https://github.com/acorg/dark-matter/issues/453
+        for age_info in chain.from_iterable(args.age):
+            id_, age = age_info.rsplit(sep="=", maxsplit=1)
+            ages[id_.strip()] = float(age.strip())
+
+    return {
+        "template": args.template_file,
+        "clock_model": args.clock_model,
+        "sequence_id_date_regex": args.sequence_id_date_regex,
+        "sequence_id_age_regex": args.sequence_id_age_regex,
+        "sequence_id_regex_must_match": args.sequence_id_regex_must_match,
+        "date_unit": args.date_unit,
+        "ages": ages,
+        "to_xml": to_xml,
+    }
+
+
+def print_logging_plan(plan, file=sys.stderr):
+    """
+    Print a logging plan (see C{BEAST2XML.plan_logging}).
+
+    Parameters
+    ----------
+    plan: dict
+    file: file, default=sys.stderr
+    """
+    print(
+        "Logging plan for %(taxa)d taxa and a chain length of %(chain_length)d:\n"
+        "  trace log every %(trace_log_every)d (about %(trace_log_bytes)d bytes)\n"
+        "  tree log every %(tree_log_every)d (about %(tree_log_bytes)d bytes)\n"
+        "  screen log every %(screen_log_every)d\n"
+        "  store state every %(store_state_every)s" % plan,
+        file=file,
+    )
+
+
+def print_xml(text, file=sys.stdout):
+    """
+    Print rendered XML.
+
+    Parameters
+    ----------
+    text: str
+    file: file, default=sys.stdout
+    """
+    print(text.replace('" /><sequence', '" />\n    <sequence'), file=file)
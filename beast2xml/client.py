@@ -0,0 +1,55 @@
+from __future__ import print_function, division
+import json
+import socket
+from urllib.request import Request, urlopen
+
+# This module only uses the standard library, so that command line clients
+# (see bin/beast2-xml-client.py) start quickly.
+
+
+def send_request(request, socket_path=None, url=None, timeout=None):
+    """
+    Send a render request to a server (see C{beast2xml.server}).
+
+    Parameters
+    ----------
+    request: dict
+        A request, as described in C{beast2xml.server.render_request}.
+    socket_path: str, default None
+        The path of the server's Unix socket.
+    url: str, default None
+        The server's URL (e.g. "http://127.0.0.1:8765"), if it serves HTTP.
+    timeout: float, default None
+        The number of seconds to wait for the server. If C{None}, wait forever.
+
+    Returns
+    -------
+    response: dict
+        As described in C{beast2xml.server.RenderService.handle}.
+
+    Raises
+    ------
+    ValueError
+        If neither or both of C{socket_path} and C{url} are given, or the
+        server closes the connection without responding.
+    """
+    if (socket_path is None) == (url is None):
+        raise ValueError("Exactly one of socket_path and url must be given.")
+    body = json.dumps(request).encode("utf-8")
+    if url is not None:
+        http_request = Request(
+            url.rstrip("/") + "/render",
+            data=body,
+            headers={"Content-Type": "application/json"},
+        )
+        with urlopen(http_request, timeout=timeout) as response:
+            return json.load(response)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(body + b"\n")
+        with sock.makefile("rb") as fp:
+            line = fp.readline()
+    if not line:
+        raise ValueError("The server closed the connection without responding.")
+    return json.loads(line)
@@ -0,0 +1,244 @@
+from __future__ import print_function, division
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from beast2xml.beast2 import BEAST2XML
+from beast2xml.treelog import _is_tree_line, _last_line
+
+# The state and the rest of a tree line, e.g. "tree STATE_1000 = (...);".
+_TREE_LINE = re.compile(rb"^\s*tree\s+STATE_(\d+)(.*)$", re.DOTALL | re.IGNORECASE)
+
+# The kinds of log that are combined: the suffix added to a run's basename and
+# whether it is a tree log.
+LOGS = ((BEAST2XML.TRACELOG_SUFFIX, False), (BEAST2XML.TREELOG_SUFFIX, True))
+
+
+def _is_trace_line(line):
+    return line[:1].isdigit()
+
+
+def _split_line(line, trees):
+    """
+    Split a sample line into its state and the rest of the line.
+    """
+    if trees:
+        match = _TREE_LINE.match(line)
+        if match is None:
+            raise ValueError("Could not understand the tree line %r." % line[:80])
+        return int(match.group(1)), match.group(2)
+    state, tab, rest = line.partition(b"\t")
+    return int(state), tab + rest
+
+
+def _burnin_state(burnin, last_state):
+    """
+    Get the first state kept after a burn-in.
+    """
+    if isinstance(burnin, float) and 0.0 <= burnin < 1.0:
+        return burnin * last_state
+    if isinstance(burnin, int) and burnin >= 0:
+        return burnin
+    raise ValueError(
+        "A burn-in must be a proportion in [0, 1) or a number of states, not %r."
+        % (burnin,)
+    )
+
+
+def filter_log(path, part, trees, burnin=0.1, resample=None):
+    """
+    Apply a burn-in and thinning to a trace or tree log, writing the samples
+    kept to a part file without their states.
+
+    Parameters
+    ----------
+    path: str
+        The trace (".log") or tree (".trees") log.
+    part: str
+        The file to write the kept samples to, each without its state (i.e.,
+        the rest of the line after the state).
+    trees: bool
+        If True, the log is a (NEXUS) tree log.
+    burnin: float or int, default 0.1
+        The proportion of the states of the run (if a float) or the number of
+        states (if an int) to discard.
+    resample: int, default None
+        If given, only samples whose state is a multiple of this are kept.
+
+    Returns
+    -------
+    result: dict
+        With keys "path", "part", "header" (the lines before the first sample,
+        as C{bytes}), "samples" (the number kept) and "interval" (the number
+        of states between the first two samples, or C{None}).
+    """
+    match = _is_tree_line if trees else _is_trace_line
+    with open(path, "rb") as fp:
+        last = _last_line(fp, match)
+    if last is None:
+        raise ValueError("No samples found in %r." % path)
+    first_state = _burnin_state(burnin, _split_line(last.encode("utf-8"), trees)[0])
+
+    header = []
+    samples = 0
+    states = []
+    with open(path, "rb") as fp, open(part, "wb") as out:
+        for line in fp:
+            if not match(line):
+                if not states:
+                    header.append(line)
+                continue
+            state, rest = _split_line(line, trees)
+            if len(states) < 2:
+                states.append(state)
+            if state >= first_state and (resample is None or state % resample == 0):
+                out.write(rest if rest.endswith(b"\n") else rest + b"\n")
+                samples += 1
+    return {
+        "path": path,
+        "part": part,
+        "header": b"".join(header),
+        "samples": samples,
+        "interval": states[1] - states[0] if len(states) == 2 else None,
+    }
+
+
+def _column_names(header):
+    lines = [line for line in header.split(b"\n") if line.strip()]
+    return lines[-1].split() if lines else []
+
+
+def _check_headers(results, trees):
+    """
+    Check that the logs of different runs have the same columns or taxa.
+    """
+    first = results[0]
+    for result in results[1:]:
+        if trees:
+            same = result["header"] == first["header"]
+            what = "taxa"
+        else:
+            same = _column_names(result["header"]) == _column_names(first["header"])
+            what = "columns"
+        if not same:
+            raise ValueError(
+                "The logs %r and %r do not have the same %s."
+                % (first["path"], result["path"], what)
+            )
+
+
+def combine_logs(basenames, output_basename, burnin=0.1, resample=None, workers=None):
+    """
+    Combine the trace and tree logs of replicate runs, as BEAST's LogCombiner
+    does.
+
+    Each log is read in one streaming pass (in parallel, one log per worker
+    process), with its burn-in removed and thinned. The samples kept
+    are then written to the combined logs, with their states renumbered so
+    that they follow on from one another. Memory use does not depend on the
+    size of the logs.
+
+    Parameters
+    ----------
+    basenames: list of str
+        The log basenames of the runs (as given to C{BEAST2XML.to_xml} as
+        C{log_file_basename}). Each run's trace log is C{basename + ".log"} and
+        its tree log C{basename + ".trees"}. Logs of a kind that no run has are
+        skipped.
+    output_basename: str
+        The basename of the combined logs.
+    burnin: float, int or list, default 0.1
+        The proportion of the states of each run (if a float) or the number of
+        states (if an int) to discard, or a list with one of these per run.
+    resample: int, default None
+        If given, only samples whose state is a multiple of this are kept, and
+        the combined samples are this many states apart. Otherwise they are as
+        far apart as the first two samples of the first run.
+    workers: int, default None
+        The number of worker processes. If C{None}, one per log (up to the
+        number of CPUs). If 1, logs are read in the calling process.
+
+    Returns
+    -------
+    results: dict
+        Keyed by the path of each combined log, with values giving the number
+        of samples kept from each run.
+
+    Raises
+    ------
+    ValueError
+        If no basenames are given, some (but not all) runs are missing a log,
+        no logs are found, or the logs of the runs have different columns or
+        taxa.
+    """
+    if not basenames:
+        raise ValueError("No runs were given.")
+    if isinstance(burnin, (list, tuple)):
+        if len(burnin) != len(basenames):
+            raise ValueError(
+                "%d burn-ins were given for %d runs." % (len(burnin), len(basenames))
+            )
+        burnins = list(burnin)
+    else:
+        burnins = [burnin] * len(basenames)
+    if resample is not None and resample < 1:
+        raise ValueError("resample must be a positive integer.")
+
+    jobs = []
+    for suffix, trees in LOGS:
+        paths = [basename + suffix for basename in basenames]
+        exist = [os.path.exists(path) for path in paths]
+        if any(exist) and not all(exist):
+            raise ValueError(
+                "Missing log(s): %s."
+                % ", ".join(path for path, found in zip(paths, exist) if not found)
+            )
+        if all(exist):
+            jobs.append((output_basename + suffix, paths, trees))
+    if not jobs:
+        raise ValueError("No logs were found for %s." % ", ".join(basenames))
+
+    directory = os.path.dirname(output_basename) or "."
+    os.makedirs(directory, exist_ok=True)
+    parts = tempfile.mkdtemp(dir=directory, prefix=".combine-")
+    tasks = [
+        (path, os.path.join(parts, "%d-%d" % (job, run)), trees, burnins[run], resample)
+        for job, (_, paths, trees) in enumerate(jobs)
+        for run, path in enumerate(paths)
+    ]
+
+    try:
+        if workers == 1:
+            filtered = [filter_log(*task) for task in tasks]
+        else:
+            workers = min(len(tasks), workers or os.cpu_count() or 1)
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(filter_log, *task) for task in tasks]
+                filtered = [future.result() for future in futures]
+
+        results = {}
+        for output, paths, trees in jobs:
+            runs, filtered = filtered[: len(paths)], filtered[len(paths) :]
+            _check_headers(runs, trees)
+            step = resample or next(
+                (run["interval"] for run in runs if run["interval"]), 1
+            )
+            prefix = b"tree STATE_%d" if trees else b"%d"
+            tmp = os.path.join(parts, os.path.basename(output))
+            with open(tmp, "wb") as out:
+                out.write(runs[0]["header"])
+                state = 0
+                for run in runs:
+                    with open(run["part"], "rb") as fp:
+                        for rest in fp:
+                            out.write(prefix % state + rest)
+                            state += step
+                if trees:
+                    out.write(b"End;\n")
+            os.replace(tmp, output)
+            results[output] = [run["samples"] for run in runs]
+    finally:
+        shutil.rmtree(parts)
+    return results
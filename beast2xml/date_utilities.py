@@ -2,6 +2,8 @@ from datetime import timedelta, datetime
 from datetime import datetime as dt
 import calendar
 import time
+import numpy as np
+import pandas as pd
 
 
 def _since_epoch(date):  #
@@ -64,3 +66,50 @@ def date_to_decimal(date):
     fraction = year_elapsed / year_duration
 
     return date.year + fraction
+
+
+def dates_to_decimals(dates):
+    """ Convert many dates to year decimals (year fractions) in one vectorised pass.
+
+    Parameters
+    ----------
+    dates: iterable of datetime.date, datetime.datetime, numpy.datetime64 or strings
+        of format YYYY-MM-DD, numpy.ndarray, pandas.Series or pandas.DatetimeIndex
+        Dates to be converted.
+
+    Returns
+    -------
+    year_decimals : numpy.ndarray of float64
+    """
+    dates = pd.DatetimeIndex(pd.to_datetime(dates))
+    if dates.tz is not None:
+        dates = dates.tz_localize(None)
+    values = dates.values.astype("datetime64[s]")
+    years = values.astype("datetime64[Y]")
+    start_of_this_year = years.astype("datetime64[s]")
+    start_of_next_year = (years + 1).astype("datetime64[s]")
+    year_elapsed = (values - start_of_this_year).astype(np.float64)
+    year_duration = (start_of_next_year - start_of_this_year).astype(np.float64)
+    return years.astype(np.int64) + 1970 + year_elapsed / year_duration
+
+
+def decimals_to_dates(decimals):
+    """
+    Convert many year decimals to dates in one vectorised pass.
+
+    Parameters
+    ----------
+    decimals: iterable of floats
+        The decimal values to convert.
+
+    Returns
+    -------
+    dates: numpy.ndarray of numpy.datetime64[s]
+    """
+    decimals = np.asarray(decimals, dtype=np.float64)
+    years = np.floor(decimals).astype(np.int64)
+    start_of_this_year = (years - 1970).astype("datetime64[Y]").astype("datetime64[s]")
+    start_of_next_year = (years - 1969).astype("datetime64[Y]").astype("datetime64[s]")
+    year_duration = (start_of_next_year - start_of_this_year).astype(np.float64)
+    seconds = np.round((decimals - years) * year_duration).astype(np.int64)
+    return start_of_this_year + seconds.astype("timedelta64[s]")
@@ -0,0 +1,271 @@
+from __future__ import print_function, division
+import hashlib
+import xml.etree.ElementTree as ET
+
+# The attributes that identify an element without an id among its siblings.
+_QUALIFIERS = ("name", "idref", "spec")
+
+
+def _trait_values(text):
+    """
+    Parse the value of a trait, e.g. "id1=2020.5,id2=2021.0".
+    """
+    values = {}
+    for item in text.split(","):
+        item = item.strip()
+        if item:
+            taxon, value = item.rsplit("=", 1)
+            value = value.strip()
+            try:
+                value = float(value)
+            except ValueError:
+                pass
+            values[taxon.strip()] = value
+    return values
+
+
+class XMLSummary(object):
+    """
+    A summary of a BEAST2 XML file, small enough to keep in memory however long
+    its sequences are.
+
+    The file is read with C{iterparse} and each element is discarded once it
+    has been summarised. Sequences are summarised by a SHA-256 digest of their
+    value. Trait (e.g. date) values are parsed into a C{dict} keyed by taxon.
+    Every other element is summarised by its tag, attributes and text, keyed by
+    its id or, if it has none, by the key of its parent and its own tag and
+    name (or idref or spec) attribute.
+
+    Parameters
+    ----------
+    path: str
+        The XML file.
+
+    Attributes
+    ----------
+    sequences: dict
+        Keyed by taxon, with values (digest, attributes), where the attributes
+        are those of the sequence other than its value, taxon and id.
+    traits: dict
+        Keyed by the key of each trait element, with C{dict} values mapping
+        taxa to values (as C{float}s when possible).
+    elements: dict
+        Keyed by element key, with values (tag, attributes, text).
+    """
+
+    def __init__(self, path):
+        self.sequences = {}
+        self.traits = {}
+        self.elements = {}
+        # For each open element: its key and a count of the keys of its
+        # children so far, to tell apart siblings with the same key.
+        stack = []
+        for event, element in ET.iterparse(path, events=("start", "end")):
+            if event == "start":
+                stack.append((self._key(element, stack), {}))
+            else:
+                key, _ = stack.pop()
+                self._summarise(key, element)
+                # The children have been summarised.
+                del element[:]
+
+    @staticmethod
+    def _key(element, stack):
+        if element.get("id"):
+            return element.get("id")
+        key = element.tag
+        for name in _QUALIFIERS:
+            if element.get(name):
+                key += "[%s=%s]" % (name, element.get(name))
+                break
+        if stack:
+            parent, counts = stack[-1]
+            key = "%s/%s" % (parent, key)
+            counts[key] = counts.get(key, 0) + 1
+            if counts[key] > 1:
+                key += "#%d" % counts[key]
+        return key
+
+    def _summarise(self, key, element):
+        if element.tag == "sequence" and "taxon" in element.attrib:
+            # Remove the value (given as an attribute or as text) from the
+            # element itself, so it is freed now rather than when the whole
+            # alignment has been read. Whitespace in text is not significant.
+            value = element.attrib.pop("value", "") or "".join(
+                (element.text or "").split()
+            )
+            element.text = None
+            attributes = dict(element.attrib)
+            taxon = attributes.pop("taxon")
+            attributes.pop("id", None)
+            digest = hashlib.sha256(value.encode("utf-8")).hexdigest()
+            self.sequences[taxon] = (digest, attributes)
+            return
+        attributes = dict(element.attrib)
+        text = (element.text or "").strip()
+        if "traitname" in attributes:
+            value = attributes.pop("value", "")
+            self.traits[key] = _trait_values(value or text)
+            text = ""
+        self.elements[key] = (element.tag, attributes, text)
+
+
+class XMLDiff(object):
+    """
+    The differences between two BEAST2 XML files.
+
+    Parameters
+    ----------
+    path1: str
+        The first (old) XML file.
+    path2: str
+        The second (new) XML file.
+
+    Attributes
+    ----------
+    taxa_added: list of str
+        Taxa with a sequence only in the second file.
+    taxa_removed: list of str
+        Taxa with a sequence only in the first file.
+    sequences_changed: list of str
+        Taxa whose sequence (or its other attributes) differs.
+    ages_changed: list of (str, str, object, object)
+        The trait key, taxon and old and new values of each trait value that
+        differs, for taxa in both files' traits.
+    elements_added: list of str
+        The keys of elements only in the second file.
+    elements_removed: list of str
+        The keys of elements only in the first file.
+    elements_changed: dict
+        Keyed by element key, with C{dict} values mapping "tag", "text" or an
+        attribute name to a tuple of the old and new values (C{None} for a
+        missing attribute).
+    """
+
+    def __init__(self, path1, path2):
+        old = XMLSummary(path1)
+        new = XMLSummary(path2)
+
+        self.taxa_added = sorted(set(new.sequences) - set(old.sequences))
+        self.taxa_removed = sorted(set(old.sequences) - set(new.sequences))
+        self.sequences_changed = sorted(
+            taxon
+            for taxon in set(old.sequences) & set(new.sequences)
+            if old.sequences[taxon] != new.sequences[taxon]
+        )
+
+        self.ages_changed = []
+        for key in sorted(set(old.traits) & set(new.traits)):
+            old_values, new_values = old.traits[key], new.traits[key]
+            for taxon in sorted(set(old_values) & set(new_values)):
+                if old_values[taxon] != new_values[taxon]:
+                    self.ages_changed.append(
+                        (key, taxon, old_values[taxon], new_values[taxon])
+                    )
+
+        self.elements_added = sorted(set(new.elements) - set(old.elements))
+        self.elements_removed = sorted(set(old.elements) - set(new.elements))
+        self.elements_changed = {}
+        for key in sorted(set(old.elements) & set(new.elements)):
+            (old_tag, old_attributes, old_text) = old.elements[key]
+            (new_tag, new_attributes, new_text) = new.elements[key]
+            changes = {}
+            if old_tag != new_tag:
+                changes["tag"] = (old_tag, new_tag)
+            if old_text != new_text:
+                changes["text"] = (old_text, new_text)
+            for name in sorted(set(old_attributes) | set(new_attributes)):
+                if old_attributes.get(name) != new_attributes.get(name):
+                    changes[name] = (old_attributes.get(name), new_attributes.get(name))
+            if changes:
+                self.elements_changed[key] = changes
+
+    def __bool__(self):
+        return any(
+            (
+                self.taxa_added,
+                self.taxa_removed,
+                self.sequences_changed,
+                self.ages_changed,
+                self.elements_added,
+                self.elements_removed,
+                self.elements_changed,
+            )
+        )
+
+    def as_dict(self):
+        """
+        Get the differences.
+
+        Returns
+        -------
+        differences: dict
+            Keyed by the names of the attributes of this class, with lists in
+            place of tuples (so it can be written as JSON).
+        """
+        return {
+            "taxa_added": self.taxa_added,
+            "taxa_removed": self.taxa_removed,
+            "sequences_changed": self.sequences_changed,
+            "ages_changed": [list(change) for change in self.ages_changed],
+            "elements_added": self.elements_added,
+            "elements_removed": self.elements_removed,
+            "elements_changed": {
+                key: {name: list(values) for name, values in changes.items()}
+                for key, changes in self.elements_changed.items()
+            },
+        }
+
+    def report(self):
+        """
+        Summarise the differences.
+
+        Returns
+        -------
+        report: str
+            A section for each kind of difference found, or "No differences."
+        """
+        lines = []
+        for title, taxa in (
+            ("Taxa added", self.taxa_added),
+            ("Taxa removed", self.taxa_removed),
+            ("Sequences changed", self.sequences_changed),
+        ):
+            if taxa:
+                lines.append("%s (%d): %s" % (title, len(taxa), ", ".join(taxa)))
+        if self.ages_changed:
+            lines.append("Ages changed (%d):" % len(self.ages_changed))
+            for key, taxon, old, new in self.ages_changed:
+                lines.append("  %s: %s -> %s (%s)" % (taxon, old, new, key))
+        for title, keys in (
+            ("Elements added", self.elements_added),
+            ("Elements removed", self.elements_removed),
+        ):
+            if keys:
+                lines.append("%s (%d):" % (title, len(keys)))
+                lines.extend("  " + key for key in keys)
+        if self.elements_changed:
+            lines.append("Elements changed (%d):" % len(self.elements_changed))
+            for key, changes in self.elements_changed.items():
+                lines.append("  %s:" % key)
+                for name, (old, new) in changes.items():
+                    lines.append("    %s: %r -> %r" % (name, old, new))
+        return "\n".join(lines) if lines else "No differences."
+
+
+def diff(path1, path2):
+    """
+    Compare two BEAST2 XML files.
+
+    Parameters
+    ----------
+    path1: str
+        The first (old) XML file.
+    path2: str
+        The second (new) XML file.
+
+    Returns
+    -------
+    differences: XMLDiff
+    """
+    return XMLDiff(path1, path2)
@@ -0,0 +1,202 @@
+from __future__ import print_function, division
+import json
+import sys
+from time import perf_counter
+
+try:
+    import resource
+except ImportError:
+    # The resource module is not available on Windows.
+    resource = None
+
+
+def peak_rss():
+    """
+    Get the peak resident set size of this process so far.
+
+    This is a high-water mark over the life of the process, so it never falls.
+    The memory used by a stage shows as the increase in the peak during it,
+    and only if the stage took the peak higher than any earlier one.
+
+    Returns
+    -------
+    int or None
+        The peak in bytes, or C{None} if it cannot be found on this platform.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RenderMetrics(object):
+    """
+    Record the durations and sizes of the stages of building and rendering
+    BEAST2 XML.
+
+    Each stage is recorded as a C{dict} with "stage" and "seconds" keys and any
+    counts given for it (e.g. "taxa", "sites" or "bytes").
+
+    Parameters
+    ----------
+    callback: callable, default=None
+        If not C{None}, called with each stage record as it is made, e.g. to
+        send it to a pipeline's own metrics system.
+    track_memory: bool, default=False
+        If True, each record also has a "peak_rss_bytes" key giving the peak
+        resident set size of the process at the end of the stage (see
+        C{peak_rss}), and a "peak_rss_growth_bytes" key giving how much the
+        stage raised that peak. The peak is cumulative, so use the growth to
+        see which stages took the memory.
+    """
+
+    def __init__(self, callback=None, track_memory=False):
+        self.callback = callback
+        self.track_memory = track_memory
+        self.stages = []
+        self._last_peak = None
+
+    def start(self):
+        """
+        Start timing a run of stages.
+
+        Returns
+        -------
+        stopwatch: Stopwatch
+            Whose C{lap} method records the stage just finished.
+        """
+        if self.track_memory:
+            self._last_peak = peak_rss()
+        return Stopwatch(self)
+
+    def record(self, stage, seconds, **counts):
+        """
+        Record a stage.
+
+        Parameters
+        ----------
+        stage: str
+            The stage name.
+        seconds: float
+            How long the stage took.
+        counts: dict
+            Counts for the stage, such as the number of taxa or bytes.
+        """
+        record = {"stage": stage, "seconds": seconds}
+        record.update(counts)
+        if self.track_memory:
+            peak = peak_rss()
+            record["peak_rss_bytes"] = peak
+            if peak is None:
+                record["peak_rss_growth_bytes"] = None
+            else:
+                last_peak = peak if self._last_peak is None else self._last_peak
+                record["peak_rss_growth_bytes"] = peak - last_peak
+            self._last_peak = peak
+        self.stages.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def reset(self):
+        """
+        Forget all recorded stages.
+        """
+        self.stages = []
+
+    def totals(self):
+        """
+        Get the total time spent in each stage.
+
+        Returns
+        -------
+        totals: dict
+            Total seconds keyed by stage name, in the order stages were first
+            recorded.
+        """
+        totals = {}
+        for record in self.stages:
+            totals[record["stage"]] = totals.get(record["stage"], 0.0) + record["seconds"]
+        return totals
+
+    def as_dict(self):
+        """
+        Get the recorded stages and their totals.
+
+        Returns
+        -------
+        metrics: dict
+            With "stages" (the list of stage records) and "totals" keys.
+        """
+        return {"stages": list(self.stages), "totals": self.totals()}
+
+    def to_json(self, path):
+        """
+        Write the recorded stages and their totals (see C{as_dict}) as JSON.
+
+        Parameters
+        ----------
+        path: str
+        """
+        with open(path, "w") as fp:
+            json.dump(self.as_dict(), fp, indent=2)
+            fp.write("\n")
+
+    def report(self):
+        """
+        Summarise the recorded stages.
+
+        Returns
+        -------
+        report: str
+            One line per stage, with its duration, share of the total time and
+            counts.
+        """
+        total = sum(record["seconds"] for record in self.stages) or 1.0
+        lines = []
+        for record in self.stages:
+            counts = ", ".join(
+                "%s=%s" % (key, value)
+                for key, value in record.items()
+                if key not in ("stage", "seconds")
+            )
+            lines.append(
+                "%-20s %10.4f s %5.1f%%  %s"
+                % (
+                    record["stage"],
+                    record["seconds"],
+                    100.0 * record["seconds"] / total,
+                    counts,
+                )
+            )
+        return "\n".join(lines)
+
+
+class Stopwatch(object):
+    """
+    Time consecutive stages, recording each in a C{RenderMetrics} instance.
+
+    Parameters
+    ----------
+    metrics: RenderMetrics
+    """
+
+    def __init__(self, metrics):
+        self._metrics = metrics
+        self._last = perf_counter()
+
+    def lap(self, stage, **counts):
+        """
+        Record the stage that has just finished (since the stopwatch was started
+        or the previous lap).
+
+        Parameters
+        ----------
+        stage: str
+            The stage name.
+        counts: dict
+            Counts for the stage, such as the number of taxa or bytes.
+        """
+        now = perf_counter()
+        self._metrics.record(stage, now - self._last, **counts)
+        self._last = now
@@ -0,0 +1,299 @@
+from __future__ import print_function, division
+import re
+from itertools import islice
+
+import numpy as np
+
+
+def _sanitise(name):
+    """
+    Make a partition name usable as part of a BEAST2 XML id.
+    """
+    return re.sub(r"[^A-Za-z0-9_.\-]", "_", name)
+
+
+def read_bed(path):
+    """
+    Read regions from a BED file.
+
+    Parameters
+    ----------
+    path: str
+        Path to a BED file. Start coordinates are 0-based and end coordinates
+        are exclusive. If there is no name column, regions are named by their
+        (1-based) coordinates.
+
+    Returns
+    -------
+    regions: list of (str, int, int)
+        Region names with 1-based inclusive start and end coordinates.
+    """
+    regions = []
+    with open(path) as fp:
+        for line in fp:
+            if not line.strip() or line.startswith(("#", "track", "browser")):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            start, end = int(fields[1]) + 1, int(fields[2])
+            name = fields[3] if len(fields) > 3 and fields[3] else "%d-%d" % (start, end)
+            regions.append((name, start, end))
+    return regions
+
+
+def read_gff(path, feature_type="CDS"):
+    """
+    Read regions from a GFF3 (or GTF) file.
+
+    A feature split over several lines (e.g. a CDS with a ribosomal slippage
+    site, or the exons of a GTF gene_id) is read as one region made of all
+    its segments.
+
+    Parameters
+    ----------
+    path: str
+        Path to a GFF3 or GTF file.
+    feature_type: str or None, default "CDS"
+        Only features of this type (the third column) are read. If None, all
+        features are read.
+
+    Returns
+    -------
+    regions: list of (str, int, int, tuple)
+        Region names (from the Name, ID or gene_id attribute), in the order
+        they are first seen, with the 1-based inclusive start and end
+        coordinates of the whole region and a tuple of its segments. Each
+        segment is a (start, end, phase) tuple, with C{phase} the number of
+        bases before the first codon that starts in the segment (or C{None}
+        if the file does not give it).
+    """
+    segments = {}
+    with open(path) as fp:
+        for line in fp:
+            if line.startswith("##FASTA"):
+                break
+            if not line.strip() or line.startswith("#"):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if feature_type is not None and fields[2] != feature_type:
+                continue
+            start, end = int(fields[3]), int(fields[4])
+            attributes = dict(
+                match.groups()
+                for match in re.finditer(r'(\w+)[= ]"?([^";]+)"?', fields[8])
+            )
+            name = (
+                attributes.get("Name")
+                or attributes.get("ID")
+                or attributes.get("gene_id")
+                or "%s%d-%d" % (fields[2], start, end)
+            )
+            phase = int(fields[7]) if fields[7].isdigit() else None
+            segments.setdefault(name, []).append((start, end, phase))
+    return [
+        (
+            name,
+            min(start for start, _, _ in parts),
+            max(end for _, end, _ in parts),
+            tuple(sorted(parts)),
+        )
+        for name, parts in segments.items()
+    ]
+
+
+def _codon_filters(segments):
+    """
+    Get the filters of the three codon positions of a region made of
+    segments, counting codon positions along the joined segments.
+    """
+    pieces = ([], [], [])
+    length = 0
+    for start, end, phase in segments:
+        if phase is None:
+            # The bases that complete the last codon of the earlier segments.
+            phase = -length % 3
+        for position in range(3):
+            first = start + (phase + position) % 3
+            if first <= end:
+                pieces[position].append("%d-%d\\3" % (first, end))
+        length += end - start + 1
+    return [",".join(piece) for piece in pieces]
+
+
+def partition_filters(data_id, regions=None, codon_positions=False):
+    """
+    Get the ids and BEAST2 FilteredAlignment filters of alignment partitions.
+
+    Parameters
+    ----------
+    data_id: str
+        The id of the alignment being partitioned.
+    regions: list of (str, int, int) or (str, int, int, tuple), default None
+        Region names with 1-based inclusive start and end coordinates,
+        optionally followed by the (start, end, phase) segments the region is
+        made of (as returned by C{read_gff}). If None, the whole alignment is
+        used.
+    codon_positions: bool, default False
+        If True, each region (or the whole alignment) is split into three
+        partitions, one per codon position (counted from the start of the
+        region, along its segments and using their phases).
+
+    Returns
+    -------
+    partitions: list of (str, str)
+        Partition ids and filters.
+    """
+    partitions = []
+    if regions is None:
+        if not codon_positions:
+            raise ValueError("Either regions or codon_positions must be given.")
+        for position in (1, 2, 3):
+            partitions.append(
+                ("%s.codon%d" % (data_id, position), "%d::3" % position)
+            )
+        return partitions
+
+    seen = set()
+    for region in regions:
+        name, start, end = region[:3]
+        segments = region[3] if len(region) > 3 else ((start, end, 0),)
+        for segment_start, segment_end, _ in segments:
+            if segment_start < 1 or segment_end < segment_start:
+                raise ValueError(
+                    "Invalid partition region %r: %d-%d."
+                    % (name, segment_start, segment_end)
+                )
+        partition_id = "%s.%s" % (data_id, _sanitise(name))
+        if partition_id in seen:
+            raise ValueError("Duplicate partition name %r." % name)
+        seen.add(partition_id)
+        if codon_positions:
+            for position, filter_ in enumerate(_codon_filters(segments), start=1):
+                partitions.append(("%s.codon%d" % (partition_id, position), filter_))
+        else:
+            partitions.append(
+                (
+                    partition_id,
+                    ",".join(
+                        "%d-%d" % (segment_start, segment_end)
+                        for segment_start, segment_end, _ in segments
+                    ),
+                )
+            )
+    return partitions
+
+
+def filter_columns(filter_, length):
+    """
+    Get the alignment columns selected by a BEAST2 FilteredAlignment filter.
+
+    Parameters
+    ----------
+    filter_: str
+        A comma-separated list of 1-based inclusive ranges, each of the form
+        "i", "i-j", "i-j\\k" (every k-th column from i to j), "i::k" (every
+        k-th column from i to the end) or "-" (all columns).
+    length: int
+        The length of the alignment.
+
+    Returns
+    -------
+    columns: numpy.ndarray
+        The selected 0-based column indexes, in filter order.
+    """
+    columns = []
+    for part in filter_.split(","):
+        part = part.strip()
+        match = re.fullmatch(r"(\d*)-(\d*)(?:\\(\d+))?|(\d+)::(\d+)|(\d+)", part)
+        if match is None:
+            raise ValueError("Invalid alignment filter %r." % filter_)
+        start, end, step, from_, every, single = match.groups()
+        if single is not None:
+            start = end = single
+        elif from_ is not None:
+            start, end, step = from_, None, every
+        start = int(start) if start else 1
+        end = int(end) if end else length
+        if end > length:
+            raise ValueError(
+                "Alignment filter %r goes beyond the alignment length (%d)."
+                % (filter_, length)
+            )
+        columns.append(np.arange(start - 1, end, int(step) if step else 1))
+    return np.concatenate(columns)
+
+
+def columns_filter(columns):
+    """
+    Make a compact BEAST2 FilteredAlignment filter selecting alignment columns.
+
+    Parameters
+    ----------
+    columns: numpy.ndarray
+        Increasing 0-based column indexes.
+
+    Returns
+    -------
+    filter_: str
+        A comma-separated list of 1-based inclusive ranges.
+    """
+    columns = np.asarray(columns) + 1
+    breaks = np.flatnonzero(np.diff(columns) != 1) + 1
+    starts = columns[np.r_[0, breaks]]
+    ends = columns[np.r_[breaks - 1, len(columns) - 1]]
+    return ",".join(
+        "%d" % start if start == end else "%d-%d" % (start, end)
+        for start, end in zip(starts.tolist(), ends.tolist())
+    )
+
+
+def site_classes(sequences, block_size=256):
+    """
+    Find the constant and all-missing columns of an alignment.
+
+    The sequences are read in blocks, so they need not all be in memory at
+    once (e.g. when they are kept on disk).
+
+    Parameters
+    ----------
+    sequences: iterable of str
+        Aligned sequences, all of the same length.
+    block_size: int, default 256
+        The number of sequences to compare at a time.
+
+    Returns
+    -------
+    variable: numpy.ndarray
+        A boolean array that is C{True} for the columns that are neither
+        constant nor entirely missing data (gaps, '?' or 'N').
+    constant: numpy.ndarray
+        An array with the index of the base ("ACGT") of each column whose
+        sequences all have that base, and -1 for the other columns.
+    """
+    missing_bases = np.frombuffer(b"-?N", dtype=np.uint8)
+    first = same = missing = None
+    sequences = iter(sequences)
+    while True:
+        block = list(islice(sequences, block_size))
+        if not block:
+            break
+        if first is None:
+            first = np.frombuffer(block[0].upper().encode("ascii"), dtype=np.uint8)
+            same = np.ones(len(first), dtype=bool)
+            missing = np.ones(len(first), dtype=bool)
+        if any(len(sequence) != len(first) for sequence in block):
+            raise ValueError(
+                "All sequences must have the same length to find invariant sites."
+            )
+        matrix = np.frombuffer(
+            "".join(block).upper().encode("ascii"), dtype=np.uint8
+        ).reshape(len(block), len(first))
+        same &= (matrix == first).all(axis=0)
+        missing &= np.isin(matrix, missing_bases).all(axis=0)
+    if first is None:
+        raise ValueError(
+            "All sequences must have the same length to find invariant sites."
+        )
+    constant = np.full(len(first), -1)
+    for index, base in enumerate(b"ACGT"):
+        constant[same & (first == base)] = index
+    return (constant == -1) & ~missing, constant
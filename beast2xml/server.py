@@ -0,0 +1,486 @@
+from __future__ import print_function, division
+import argparse
+import io
+import json
+import os
+import socketserver
+import stat
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dark.reads import parseFASTACommandLineOptions
+
+from beast2xml.batch import _load_template
+from beast2xml.beast2 import BEAST2XML
+from beast2xml.storage import parse_size
+
+# The keys of a render request (see render_request).
+REQUEST_KEYS = (
+    "template",
+    "clock_model",
+    "sequence_id_date_regex",
+    "sequence_id_age_regex",
+    "sequence_id_regex_must_match",
+    "date_unit",
+    "fasta_file",
+    "fasta",
+    "read_class",
+    "format",
+    "ages",
+    "to_xml",
+    "output",
+)
+
+# The input formats a request can give, as command line options of
+# dark.reads.addFASTACommandLineOptions.
+FORMATS = {"fasta": "fasta", "fastq": "fastq", "fasta-ss": "fasta_ss"}
+
+# The clock models that have packaged templates.
+CLOCK_MODELS = ("random-local", "relaxed-exponential", "relaxed-lognormal", "strict")
+
+# The BEAST2XML.to_xml arguments that (with target_samples or
+# max_tree_log_bytes) determine the logging plan.
+LOG_EVERY = (
+    "trace_log_every",
+    "tree_log_every",
+    "screen_log_every",
+    "store_state_every",
+)
+
+# The Host header names accepted by the HTTP server, so that a web page cannot
+# reach it by DNS rebinding.
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+
+def _read_request_sequences(request):
+    """
+    Read the sequences given in a request.
+    """
+    if request.get("fasta_file") is not None and request.get("fasta") is not None:
+        raise ValueError("A request cannot give both fasta_file and fasta.")
+    format_ = request.get("format", "fasta")
+    if format_ not in FORMATS:
+        raise ValueError(
+            "Unknown sequence format %r. Use one of %s."
+            % (format_, ", ".join(sorted(FORMATS)))
+        )
+    if request.get("fasta") is not None:
+        fasta_file = io.BytesIO(request["fasta"].encode("utf-8"))
+    elif request.get("fasta_file") is not None:
+        fasta_file = request["fasta_file"]
+    else:
+        return []
+    args = argparse.Namespace(
+        fastaFile=fasta_file,
+        readClass=request.get("read_class", "DNARead"),
+        fasta=False,
+        fastq=False,
+        fasta_ss=False,
+    )
+    setattr(args, FORMATS[format_], True)
+    return parseFASTACommandLineOptions(args)
+
+
+def render_request(request, reads=None):
+    """
+    Make BEAST2 XML for a render request.
+
+    Templates are parsed once per process and copied for each request (and
+    parsed again if a template file changes), so a long-lived process renders
+    small requests quickly.
+
+    Parameters
+    ----------
+    request: dict
+        With optional keys:
+            "template", "clock_model", "sequence_id_date_regex",
+                "sequence_id_age_regex", "sequence_id_regex_must_match",
+                "date_unit": as for C{BEAST2XML}.
+            "fasta_file": the path to a file of sequences.
+            "fasta": the sequences, as a string.
+            "read_class": the name of the C{dark.reads} class of the sequences
+                (default "DNARead").
+            "format": "fasta" (the default), "fastq" or "fasta-ss".
+            "ages": a C{dict} of ages, keyed by sequence id.
+            "to_xml": a C{dict} of C{BEAST2XML.to_xml} arguments.
+                "max_tree_log_bytes" may be given as a size such as "500M" (see
+                C{beast2xml.storage.parse_size}).
+            "output": the path to write the XML to. If not given, the XML is
+                returned.
+        If "target_samples" or "max_tree_log_bytes" is given in "to_xml", a
+        logging plan is made (see C{BEAST2XML.plan_logging}), with any log
+        intervals in "to_xml" overriding those of the plan.
+    reads: iterable of dark.reads.Read, default None
+        Sequences to add, instead of those given in the request.
+
+    Returns
+    -------
+    response: dict
+        With keys "status" ("ok"), "xml" (the XML, or C{None} if it was
+        written to "output"), "output", "logging_plan" (or C{None}) and
+        "metrics" (see C{RenderMetrics.as_dict}).
+
+    Raises
+    ------
+    ValueError
+        If the request has an unknown key.
+    """
+    unknown = set(request) - set(REQUEST_KEYS)
+    if unknown:
+        raise ValueError("Unknown request key(s): %s." % ", ".join(sorted(unknown)))
+
+    to_xml = dict(request.get("to_xml") or {})
+    if to_xml.get("max_tree_log_bytes") is not None:
+        to_xml["max_tree_log_bytes"] = parse_size(to_xml["max_tree_log_bytes"])
+
+    xml = BEAST2XML(
+        template=_load_template(request),
+        sequence_id_date_regex=request.get("sequence_id_date_regex"),
+        sequence_id_age_regex=request.get("sequence_id_age_regex"),
+        sequence_id_regex_must_match=request.get("sequence_id_regex_must_match", True),
+        date_unit=request.get("date_unit", "year"),
+    )
+
+    xml.add_sequences(_read_request_sequences(request) if reads is None else reads)
+    for id_, age in (request.get("ages") or {}).items():
+        xml.add_age(id_, float(age))
+
+    plan = None
+    if (
+        to_xml.get("target_samples") is not None
+        or to_xml.get("max_tree_log_bytes") is not None
+    ):
+        plan = xml.plan_logging(
+            chain_length=to_xml.get("chain_length"),
+            target_samples=to_xml.get("target_samples"),
+            max_tree_log_bytes=to_xml.get("max_tree_log_bytes"),
+            **{name: to_xml.get(name) for name in LOG_EVERY},
+        )
+
+    output = request.get("output")
+    if output is None:
+        text = xml.to_string(**to_xml)
+    else:
+        text = None
+        tmp = "%s.tmp-%d" % (output, os.getpid())
+        try:
+            xml.to_xml(tmp, **to_xml)
+            os.replace(tmp, output)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    return {
+        "status": "ok",
+        "xml": text,
+        "output": output,
+        "logging_plan": plan,
+        "metrics": xml.metrics.as_dict(),
+    }
+
+
+def _render_response(request):
+    try:
+        return render_request(request)
+    except Exception as e:
+        return {"status": "error", "error": "%s: %s" % (type(e).__name__, e)}
+
+
+def _warm():
+    """
+    Parse all packaged templates in a worker process.
+    """
+    for clock_model in CLOCK_MODELS:
+        _load_template({"clock_model": clock_model})
+
+
+class RenderService(object):
+    """
+    Render requests (see C{render_request}) in a pool of warm worker
+    processes.
+
+    Parameters
+    ----------
+    workers: int, default None
+        The number of worker processes. If C{None}, the number of CPUs is used.
+    executor: concurrent.futures.Executor, default None
+        An executor to render requests in, instead of a new process pool.
+    """
+
+    def __init__(self, workers=None, executor=None):
+        self._own_executor = executor is None
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_warm)
+        self.executor = executor
+        self.requests = 0
+
+    def handle(self, request):
+        """
+        Render a request.
+
+        Parameters
+        ----------
+        request: dict
+
+        Returns
+        -------
+        response: dict
+            As returned by C{render_request}, or with keys "status" ("error")
+            and "error" (a message) if the request could not be rendered.
+        """
+        self.requests += 1
+        if not isinstance(request, dict):
+            return {"status": "error", "error": "A request must be a JSON object."}
+        try:
+            return self.executor.submit(_render_response, request).result()
+        except Exception as e:
+            return {"status": "error", "error": "%s: %s" % (type(e).__name__, e)}
+
+    def status(self):
+        """
+        Get the service status.
+
+        Returns
+        -------
+        status: dict
+            With keys "status" ("ok"), "pid" and "requests".
+        """
+        return {"status": "ok", "pid": os.getpid(), "requests": self.requests}
+
+    def close(self):
+        """
+        Shut down the worker pool (unless it was given to C{__init__}).
+        """
+        if self._own_executor:
+            self.executor.shutdown()
+
+
+class _UnixHandler(socketserver.StreamRequestHandler):
+    """
+    Handle JSON requests on a Unix socket, one per line, writing one JSON
+    response line for each.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                response = {"status": "error", "error": "Invalid JSON: %s" % e}
+            else:
+                response = self.server.service.handle(request)
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+def _is_socket(path):
+    try:
+        return stat.S_ISSOCK(os.lstat(path).st_mode)
+    except FileNotFoundError:
+        return False
+
+
+class UnixRenderServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Serve render requests on a Unix socket.
+
+    The socket is only accessible by its owner.
+
+    Parameters
+    ----------
+    path: str
+        The socket path. An existing socket at the path is replaced.
+    service: RenderService
+
+    Raises
+    ------
+    ValueError
+        If something other than a socket exists at C{path}.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, service):
+        if _is_socket(path):
+            os.remove(path)
+        elif os.path.lexists(path):
+            raise ValueError("%r exists and is not a socket." % path)
+        self.service = service
+        socketserver.UnixStreamServer.__init__(self, path, _UnixHandler)
+
+    def server_bind(self):
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.server_bind(self)
+        finally:
+            os.umask(umask)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if _is_socket(self.server_address):
+            os.remove(self.server_address)
+
+
+def _host_name(host):
+    """
+    Get the name in a Host header, without its port.
+    """
+    if host.startswith("["):
+        return host[1:].partition("]")[0]
+    if host.count(":") == 1:
+        return host.partition(":")[0]
+    return host
+
+
+class _HTTPHandler(BaseHTTPRequestHandler):
+    """
+    Handle JSON requests POSTed to /render, and status requests to /status.
+
+    Requests must have a localhost Host header and no Origin header, and
+    render requests must have a Content-Type of application/json, so that web
+    pages cannot send requests to the server (by DNS rebinding or with a
+    cross-origin POST that needs no CORS preflight).
+    """
+
+    def _check_local(self):
+        """
+        Respond with an error unless the request comes from a local client
+        that is not a web page.
+
+        Returns
+        -------
+        local: bool
+        """
+        if _host_name(self.headers.get("Host", "")).lower() not in LOCAL_HOSTS:
+            self._respond(403, {"status": "error", "error": "Forbidden host."})
+            return False
+        if self.headers.get("Origin") is not None:
+            self._respond(403, {"status": "error", "error": "Forbidden origin."})
+            return False
+        return True
+
+    def _respond(self, code, response):
+        body = json.dumps(response).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if not self._check_local():
+            return
+        if self.path == "/status":
+            self._respond(200, self.server.service.status())
+        else:
+            self._respond(404, {"status": "error", "error": "Not found."})
+
+    def do_POST(self):
+        if not self._check_local():
+            return
+        if self.path != "/render":
+            self._respond(404, {"status": "error", "error": "Not found."})
+            return
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.partition(";")[0].strip().lower() != "application/json":
+            self._respond(
+                415,
+                {"status": "error", "error": "Content-Type must be application/json."},
+            )
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length))
+        except ValueError as e:
+            self._respond(400, {"status": "error", "error": "Invalid JSON: %s" % e})
+            return
+        self._respond(200, self.server.service.handle(request))
+
+    def log_message(self, format, *args):
+        # Do not write a line to stderr for every request.
+        pass
+
+
+class HTTPRenderServer(ThreadingHTTPServer):
+    """
+    Serve render requests over HTTP.
+
+    Parameters
+    ----------
+    address: tuple of (str, int)
+        The host and port to listen on. Use a port of 0 to choose a free one.
+    service: RenderService
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        self.service = service
+        ThreadingHTTPServer.__init__(self, address, _HTTPHandler)
+
+
+def make_server(socket_path=None, host="127.0.0.1", port=None, service=None):
+    """
+    Make a server for render requests.
+
+    Parameters
+    ----------
+    socket_path: str, default None
+        The path of a Unix socket to listen on.
+    host: str, default "127.0.0.1"
+        The host to listen on for HTTP requests, if C{port} is given.
+    port: int, default None
+        The port to listen on for HTTP requests.
+    service: RenderService, default None
+        The service to render requests with. If C{None}, a new one is made.
+
+    Returns
+    -------
+    server: UnixRenderServer or HTTPRenderServer
+
+    Raises
+    ------
+    ValueError
+        If neither or both of C{socket_path} and C{port} are given.
+    """
+    if (socket_path is None) == (port is None):
+        raise ValueError("Exactly one of socket_path and port must be given.")
+    if service is None:
+        service = RenderService()
+    if socket_path is not None:
+        return UnixRenderServer(socket_path, service)
+    return HTTPRenderServer((host, port), service)
+
+
+def serve(socket_path=None, host="127.0.0.1", port=None, workers=None):
+    """
+    Serve render requests until interrupted.
+
+    Parameters
+    ----------
+    socket_path: str, default None
+        The path of a Unix socket to listen on.
+    host: str, default "127.0.0.1"
+        The host to listen on for HTTP requests, if C{port} is given.
+    port: int, default None
+        The port to listen on for HTTP requests.
+    workers: int, default None
+        The number of worker processes. If C{None}, the number of CPUs is used.
+    """
+    service = RenderService(workers=workers)
+    try:
+        server = make_server(
+            socket_path=socket_path, host=host, port=port, service=service
+        )
+    except Exception:
+        service.close()
+        raise
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
@@ -0,0 +1,103 @@
+from __future__ import print_function, division
+
+# The XPath of the birth death skyline model distribution.
+SKYLINE_PATH = (
+    "./run/distribution/distribution/distribution"
+    "[@spec='beast.evolution.speciation.BirthDeathSkylineModel']"
+)
+
+# The XPath of the compound distribution holding the parameter priors.
+PRIOR_PATH = "./run/distribution/distribution[@id='prior']"
+
+# The XPath of the compound distribution holding the tree likelihoods.
+LIKELIHOOD_PATH = "./run/distribution/distribution[@id='likelihood']"
+
+
+class TemplateSkeleton(object):
+    """
+    Direct references to the elements of a template that C{BEAST2XML} edits,
+    found (and checked) once so that later edits and renders do not search
+    the template again.
+
+    The referenced elements are edited in place, but never replaced, by
+    C{BEAST2XML}, so a skeleton stays valid for the life of its template.
+
+    Parameters
+    ----------
+    tree: xml.etree.ElementTree.ElementTree
+        The template.
+
+    Raises
+    ------
+    ValueError
+        If the template does not have a data, run, trait, trace logger, tree
+        logger or screen logger element.
+
+    Attributes
+    ----------
+    data: xml.etree.ElementTree.Element
+        The (first) data element, holding the alignment.
+    data_id: str
+        The id of the data element.
+    run: xml.etree.ElementTree.Element
+    state: xml.etree.ElementTree.Element
+    trait: xml.etree.ElementTree.Element
+        The trait (e.g. date) element of the tree.
+    trace_logger: xml.etree.ElementTree.Element
+    tree_logger: xml.etree.ElementTree.Element
+    screen_logger: xml.etree.ElementTree.Element
+    inits: list of xml.etree.ElementTree.Element
+        The init elements of the run.
+    prior: xml.etree.ElementTree.Element or None
+        The compound distribution with id "prior". If there is none, priors
+        are searched for in all the compound distributions of the posterior.
+    likelihood: xml.etree.ElementTree.Element or None
+        The compound distribution with id "likelihood".
+    skyline: xml.etree.ElementTree.Element or None
+        The birth death skyline model distribution.
+    """
+
+    def __init__(self, tree):
+        root = tree.getroot()
+        self._paths = {}
+        data_id = None
+        for tag in (
+            "data",
+            "run",
+            "./run/state/tree/trait",
+            "./run/logger[@id='tracelog']",
+            "./run/logger[@id='treelog.t:",
+            "./run/logger[@id='screenlog']",
+        ):
+            if tag == "./run/logger[@id='treelog.t:":
+                tag = tag + data_id + "']"
+            element = root.find(tag)
+            if element is None:
+                raise ValueError("Could not find %r tag in XML template" % tag)
+            if tag == "data":
+                data_id = element.get("id")
+            self._paths[tag] = element
+
+        self.data = self._paths["data"]
+        self.data_id = data_id
+        self.run = self._paths["run"]
+        self.state = self.run.find("state")
+        self.trait = self._paths["./run/state/tree/trait"]
+        self.trace_logger = self._paths["./run/logger[@id='tracelog']"]
+        self.tree_logger = self._paths["./run/logger[@id='treelog.t:" + data_id + "']"]
+        self.screen_logger = self._paths["./run/logger[@id='screenlog']"]
+        self.inits = self.run.findall("init")
+        self.prior = root.find(PRIOR_PATH)
+        self.likelihood = root.find(LIKELIHOOD_PATH)
+        self.skyline = root.find(SKYLINE_PATH)
+
+    def elements(self):
+        """
+        Get the data, run, trait and logger elements keyed by their XPaths (as
+        returned by C{BEAST2XML.find_elements}).
+
+        Returns
+        -------
+        elements: dict {str:xml.etree.ElementTree.Element}
+        """
+        return dict(self._paths)
@@ -0,0 +1,127 @@
+from __future__ import print_function, division
+import re
+import tempfile
+
+from dark.reads import Read
+
+
+def parse_size(size):
+    """
+    Convert a size such as 512M or 8G to a number of bytes.
+
+    Parameters
+    ----------
+    size: int or str
+        A number of bytes, or a number with a K, M, G or T suffix (powers of
+        1024). A trailing B (as in GB) is ignored.
+
+    Returns
+    -------
+    int
+    """
+    if isinstance(size, int):
+        return size
+    match = re.fullmatch(r"\s*([0-9.]+)\s*([KMGT]?)B?\s*", str(size).upper())
+    if match is None:
+        raise ValueError("Could not understand the size %r." % size)
+    number, suffix = match.groups()
+    multiplier = 1024 ** ("KMGT".index(suffix) + 1) if suffix else 1
+    return int(float(number) * multiplier)
+
+
+class DiskReads(object):
+    """
+    Sequences kept in a temporary file instead of in memory.
+
+    Only the ids and file offsets of the sequences are held in memory. Sequences
+    are read back (as C{dark.reads.Read} instances) as they are iterated over.
+    The file is shared by the views returned by C{subset} and C{filter_ids}, and
+    is removed when they are all garbage collected.
+
+    Parameters
+    ----------
+    reads: iterable of dark.reads.Read, default=()
+        Sequences to store.
+    directory: str, default=None
+        The directory to make the temporary file in. If C{None}, the system
+        default is used.
+    """
+
+    def __init__(self, reads=(), directory=None):
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self._index = []
+        for read in reads:
+            self.add(read)
+
+    def add(self, read):
+        """
+        Store a sequence.
+
+        Parameters
+        ----------
+        read: dark.reads.Read
+        """
+        data = read.sequence.encode("ascii")
+        self._file.seek(0, 2)
+        self._index.append((read.id, self._file.tell(), len(data)))
+        self._file.write(data)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        for entry in self._index:
+            yield self._read(entry)
+
+    def _read(self, entry):
+        id_, offset, length = entry
+        self._file.seek(offset)
+        return Read(id_, self._file.read(length).decode("ascii"))
+
+    def _view(self, index):
+        view = DiskReads.__new__(DiskReads)
+        view._file = self._file
+        view._index = index
+        return view
+
+    def ids(self):
+        """
+        Get the ids of the sequences, without reading the sequences.
+
+        Returns
+        -------
+        list of str
+        """
+        return [entry[0] for entry in self._index]
+
+    def subset(self, indexes):
+        """
+        Select sequences by index.
+
+        Parameters
+        ----------
+        indexes: iterable of int
+
+        Returns
+        -------
+        DiskReads
+            A view of the selected sequences, sharing this instance's file.
+        """
+        return self._view([self._index[index] for index in indexes])
+
+    def filter_ids(self, keep):
+        """
+        Select sequences by id.
+
+        Parameters
+        ----------
+        keep: callable
+            Called with each sequence id, returning C{True} if the sequence is
+            to be kept.
+
+        Returns
+        -------
+        DiskReads
+            A view of the selected sequences, sharing this instance's file.
+        """
+        return self._view([entry for entry in self._index if keep(entry[0])])
@@ -0,0 +1,316 @@
+from __future__ import print_function, division
+import io
+import os
+import warnings
+
+import numpy as np
+
+
+def ess(values, max_lag=2000):
+    """
+    Get the effective sample sizes of traces, as Tracer computes them.
+
+    The autocovariance of each trace is computed (for all traces at once) with
+    an FFT, and summed over pairs of adjacent lags until the sum of a pair is
+    not positive.
+
+    Parameters
+    ----------
+    values: numpy.ndarray
+        A 1D trace, or a 2D array with one trace per row.
+    max_lag: int, default 2000
+        The largest lag to sum autocovariances over (Tracer also uses 2000).
+
+    Returns
+    -------
+    numpy.ndarray or float
+        The effective sample size of each trace (NaN for a constant trace).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    one = values.ndim == 1
+    values = np.atleast_2d(values)
+    samples = values.shape[1]
+    if samples < 2:
+        result = np.full(values.shape[0], np.nan)
+        return result[0] if one else result
+    centered = values - values.mean(axis=1, keepdims=True)
+    size = 1 << (2 * samples - 1).bit_length()
+    transform = np.fft.rfft(centered, n=size, axis=1)
+    lags = min(max_lag, samples)
+    autocovariance = np.fft.irfft(transform * transform.conj(), n=size, axis=1)
+    autocovariance = autocovariance[:, :lags] / (samples - np.arange(lags))
+    # The sums of the autocovariances at lags (1, 2), (3, 4), ..., used until
+    # the first that is not positive.
+    pairs = autocovariance[:, 1:-1:2] + autocovariance[:, 2::2]
+    positive = np.cumprod(pairs > 0, axis=1, dtype=bool)
+    variance = autocovariance[:, 0] + 2.0 * (pairs * positive).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = samples * autocovariance[:, 0] / variance
+    result[autocovariance[:, 0] <= 0] = np.nan
+    return result[0] if one else result
+
+
+def hpd(values, level=0.95):
+    """
+    Get the highest posterior density intervals of traces.
+
+    Parameters
+    ----------
+    values: numpy.ndarray
+        A 1D trace, or a 2D array with one trace per row.
+    level: float, default 0.95
+        The proportion of samples in each interval.
+
+    Returns
+    -------
+    lower, upper: numpy.ndarray or float
+        The bounds of the narrowest interval holding C{level} of the samples of
+        each trace.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    one = values.ndim == 1
+    values = np.sort(np.atleast_2d(values), axis=1)
+    samples = values.shape[1]
+    if not samples:
+        raise ValueError("Cannot find the HPD interval of an empty trace.")
+    width = max(1, int(round(level * samples)))
+    widths = values[:, width - 1 :] - values[:, : samples - width + 1]
+    start = np.argmin(widths, axis=1)
+    rows = np.arange(values.shape[0])
+    lower, upper = values[rows, start], values[rows, start + width - 1]
+    return (lower[0], upper[0]) if one else (lower, upper)
+
+
+class TraceLog(object):
+    """
+    Read a BEAST2 trace log (the tab-separated ".log" file) into numpy arrays.
+
+    The file is read in chunks, and a log that is still being written can be
+    read again with C{update}, which only reads what has been added since the
+    last read.
+
+    Parameters
+    ----------
+    path: str
+        The trace log.
+    chunk_size: int, default 1 << 20
+        The number of bytes to read at a time.
+
+    Attributes
+    ----------
+    columns: list of str
+        The column names, starting with the state ("Sample") column. Empty until
+        the header has been read.
+    offset: int
+        The byte offset in the file of the first line not yet read.
+    """
+
+    def __init__(self, path, chunk_size=1 << 20):
+        self.path = path
+        self.chunk_size = chunk_size
+        self._reset()
+        self.update()
+
+    def _reset(self):
+        self.columns = []
+        self.offset = 0
+        self._rows = 0
+        self._data = np.empty((0, 0))
+
+    def update(self):
+        """
+        Read the lines added to the log since the last read.
+
+        If the file is now shorter than what was read (e.g. because a chain was
+        restarted), it is read again from the start.
+
+        Returns
+        -------
+        int
+            The number of samples read.
+        """
+        if os.path.getsize(self.path) < self.offset:
+            self._reset()
+        rows = self._rows
+        with open(self.path, "rb") as fp:
+            fp.seek(self.offset)
+            remainder = b""
+            for chunk in iter(lambda: fp.read(self.chunk_size), b""):
+                chunk = remainder + chunk
+                end = chunk.rfind(b"\n") + 1
+                remainder = chunk[end:]
+                if end:
+                    self._add_lines(chunk[:end])
+                    self.offset += end
+        return self._rows - rows
+
+    def _add_lines(self, text):
+        """
+        Add complete lines of the log.
+        """
+        if not self.columns:
+            lines = text.split(b"\n")
+            for index, line in enumerate(lines):
+                if line.strip() and not line.startswith(b"#"):
+                    self.columns = line.decode("utf-8").split()
+                    self._data = np.empty((len(self.columns), 1024))
+                    text = b"\n".join(lines[index + 1 :])
+                    break
+            else:
+                return
+        with warnings.catch_warnings():
+            # Do not warn about text holding only comments or blank lines.
+            warnings.simplefilter("ignore", UserWarning)
+            try:
+                values = np.loadtxt(io.BytesIO(text), comments="#", ndmin=2)
+            except ValueError:
+                values = None
+        if values is None or (values.size and values.shape[1] != len(self.columns)):
+            raise ValueError(
+                "The trace log %r has a line without %d values."
+                % (self.path, len(self.columns))
+            )
+        if not values.size:
+            return
+        values = values.T
+        count = values.shape[1]
+        if self._rows + count > self._data.shape[1]:
+            data = np.empty(
+                (len(self.columns), max(2 * self._data.shape[1], self._rows + count))
+            )
+            data[:, : self._rows] = self._data[:, : self._rows]
+            self._data = data
+        self._data[:, self._rows : self._rows + count] = values
+        self._rows += count
+
+    def __len__(self):
+        return self._rows
+
+    def __getitem__(self, name):
+        """
+        Get a column.
+
+        Parameters
+        ----------
+        name: str
+
+        Returns
+        -------
+        numpy.ndarray
+            A read-only view of the column's values.
+        """
+        try:
+            index = self.columns.index(name)
+        except ValueError:
+            raise KeyError(name)
+        column = self._data[index, : self._rows]
+        column.flags.writeable = False
+        return column
+
+    @property
+    def states(self):
+        """
+        Get the states of the samples (the first column).
+
+        Returns
+        -------
+        numpy.ndarray of int64
+        """
+        return self._data[0, : self._rows].astype(np.int64)
+
+    def _values(self, burnin):
+        """
+        Get the values (other than states) after the burn-in.
+        """
+        if not 0.0 <= burnin < 1.0:
+            raise ValueError("The burn-in must be a proportion in [0, 1).")
+        start = int(self._rows * burnin)
+        return self._data[1:, start : self._rows]
+
+    def mean(self, burnin=0.1):
+        """
+        Get the mean of each column.
+
+        Parameters
+        ----------
+        burnin: float, default 0.1
+            The proportion of samples to discard from the start of the log.
+
+        Returns
+        -------
+        means: dict
+            Keyed by column name (other than the state column).
+        """
+        return dict(zip(self.columns[1:], self._values(burnin).mean(axis=1)))
+
+    def ess(self, burnin=0.1, max_lag=2000):
+        """
+        Get the effective sample size of each column (see C{ess}).
+
+        Parameters
+        ----------
+        burnin: float, default 0.1
+            The proportion of samples to discard from the start of the log.
+        max_lag: int, default 2000
+            The largest lag to sum autocovariances over.
+
+        Returns
+        -------
+        sizes: dict
+            Keyed by column name (other than the state column).
+        """
+        return dict(zip(self.columns[1:], ess(self._values(burnin), max_lag=max_lag)))
+
+    def hpd(self, burnin=0.1, level=0.95):
+        """
+        Get the highest posterior density interval of each column (see
+        C{hpd}).
+
+        Parameters
+        ----------
+        burnin: float, default 0.1
+            The proportion of samples to discard from the start of the log.
+        level: float, default 0.95
+            The proportion of samples in each interval.
+
+        Returns
+        -------
+        intervals: dict
+            Keyed by column name (other than the state column), with (lower,
+            upper) values.
+        """
+        lower, upper = hpd(self._values(burnin), level=level)
+        return dict(zip(self.columns[1:], zip(lower, upper)))
+
+    def summary(self, burnin=0.1, level=0.95, max_lag=2000):
+        """
+        Summarise each column.
+
+        Parameters
+        ----------
+        burnin: float, default 0.1
+            The proportion of samples to discard from the start of the log.
+        level: float, default 0.95
+            The proportion of samples in each HPD interval.
+        max_lag: int, default 2000
+            The largest lag to sum autocovariances over for the ESS.
+
+        Returns
+        -------
+        summary: dict
+            Keyed by column name (other than the state column), with C{dict}
+            values with "mean", "ess", "hpd_lower" and "hpd_upper" keys.
+        """
+        values = self._values(burnin)
+        means = values.mean(axis=1)
+        sizes = ess(values, max_lag=max_lag)
+        lower, upper = hpd(values, level=level)
+        return {
+            name: {
+                "mean": means[index],
+                "ess": sizes[index],
+                "hpd_lower": lower[index],
+                "hpd_upper": upper[index],
+            }
+            for index, name in enumerate(self.columns[1:])
+        }
@@ -0,0 +1,576 @@
+from __future__ import print_function, division
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import ete3
+import numpy as np
+
+# BEAST writes node metadata (e.g. [&rate=1.0]) as Newick comments, which ete3
+# cannot parse.
+_COMMENT = re.compile(r"\[[^\]]*\]")
+
+
+def _read_translate(fp):
+    """
+    Read the translate table at the start of the trees block of a NEXUS file.
+
+    Parameters
+    ----------
+    fp: file
+        Open (in text mode) at the start of the file. It is left positioned at
+        the line after the translate table, or at the end of the file if there
+        is none.
+
+    Returns
+    -------
+    translate: dict
+        Taxon names keyed by the labels used in the trees.
+    """
+    translate = {}
+    in_table = False
+    for line in fp:
+        stripped = line.strip()
+        if not in_table:
+            if stripped.lower() == "translate":
+                in_table = True
+            elif stripped.lower().startswith("tree "):
+                raise ValueError("Tree found before a translate table.")
+            continue
+        for item in stripped.rstrip(";").split(","):
+            if item.strip():
+                label, name = item.split(None, 1)
+                translate[label] = name.strip().strip("'\"")
+        if stripped.endswith(";"):
+            break
+    return translate
+
+
+def _last_line(fp, match, block_size=1 << 16):
+    """
+    Find the last line of a file that matches, reading backwards from its end.
+
+    Parameters
+    ----------
+    fp: file
+        Open in binary mode.
+    match: callable
+        Called with each line (as C{bytes}) until it returns True.
+    block_size: int, default 1 << 16
+        The number of bytes to read at a time.
+
+    Returns
+    -------
+    line: str or None
+    """
+    fp.seek(0, os.SEEK_END)
+    end = fp.tell()
+    tail = b""
+    while end > 0:
+        start = max(0, end - block_size)
+        fp.seek(start)
+        tail = fp.read(end - start) + tail
+        end = start
+        lines = tail.split(b"\n")
+        # The first line may be incomplete unless the start of the file has
+        # been reached.
+        for line in reversed(lines if end == 0 else lines[1:]):
+            if match(line):
+                return line.decode("utf-8").strip()
+        if end:
+            tail = lines[0]
+    return None
+
+
+def _is_tree_line(line):
+    return line.lstrip().lower().startswith(b"tree ")
+
+
+def _last_tree_line(fp, block_size=1 << 16):
+    """
+    Find the last tree line of a NEXUS file, reading backwards from its end.
+
+    Parameters
+    ----------
+    fp: file
+        Open in binary mode.
+    block_size: int, default 1 << 16
+        The number of bytes to read at a time.
+
+    Returns
+    -------
+    line: str or None
+    """
+    return _last_line(fp, _is_tree_line, block_size=block_size)
+
+
+def parse_tree_line(line, translate=None):
+    """
+    Parse a tree line of a BEAST tree log.
+
+    Parameters
+    ----------
+    line: str
+        A line such as "tree STATE_1000 = ((1:0.5,2:0.5):0.1,3:0.6);".
+    translate: dict, default None
+        Taxon names keyed by the labels used in the tree (see the NEXUS
+        translate table). If None, the labels are kept.
+
+    Returns
+    -------
+    name: str
+        The name of the tree (e.g. "STATE_1000").
+    tree: ete3.Tree
+    """
+    name, newick = line.split("=", 1)
+    tree = ete3.Tree(_COMMENT.sub("", newick).strip(), format=5)
+    if translate:
+        for leaf in tree.iter_leaves():
+            leaf.name = translate.get(leaf.name, leaf.name)
+    return name.split(None, 1)[1].strip(), tree
+
+
+def last_tree(path):
+    """
+    Get the last tree of a BEAST tree log (e.g. the final state of a run),
+    without reading the trees before it.
+
+    Parameters
+    ----------
+    path: str
+        Path to a NEXUS tree log, as written by BEAST.
+
+    Returns
+    -------
+    tree: ete3.Tree
+        With leaves named by taxon.
+    """
+    with open(path) as fp:
+        translate = _read_translate(fp)
+    with open(path, "rb") as fp:
+        line = _last_tree_line(fp)
+    if line is None:
+        raise ValueError("No trees found in %r." % path)
+    return parse_tree_line(line, translate)[1]
+
+
+def graft_tips(tree, heights, spacing=1e-3):
+    """
+    Add new tips to a time tree, above its root.
+
+    The tips are joined to the tree one at a time, each by a new root placed
+    just above both the tree so far and the tip, so the tree stays binary and
+    every branch has a positive length. The heights of the tips already in the
+    tree are kept.
+
+    Parameters
+    ----------
+    tree: ete3.Tree
+        A tree whose branch lengths are in the units of C{heights}.
+    heights: dict
+        The height (time before the youngest sample) of every tip, old and new,
+        keyed by tip name.
+    spacing: float, default 1e-3
+        The gap between each new root and the higher of its children, as a
+        fraction of the height of the original root.
+
+    Returns
+    -------
+    tree: ete3.Tree
+        The new tree (C{tree} is modified, becoming its descendant).
+    """
+    old = tree.get_leaf_names()
+    missing = set(old) - set(heights)
+    if missing:
+        raise ValueError(
+            "No height was given for tree tip(s): %s." % ", ".join(sorted(missing))
+        )
+    root_height = heights[old[0]] + tree.get_distance(old[0])
+    step = spacing * root_height or spacing
+    present = set(old)
+    new = sorted(
+        (height, name) for name, height in heights.items() if name not in present
+    )
+    current, current_height = tree, root_height
+    for height, name in new:
+        parent_height = max(current_height, height) + step
+        parent = ete3.Tree()
+        parent.add_child(current, dist=parent_height - current_height)
+        parent.add_child(name=name, dist=parent_height - height)
+        current, current_height = parent, parent_height
+    current.dist = 0.0
+    return current
+
+
+# A tree line's state, and its Newick tree (from the opening parenthesis).
+_TREE_STATE = re.compile(rb"^\s*tree\s+STATE_(\d+)", re.IGNORECASE)
+
+# The tokens of a Newick tree (once comments have been removed): parentheses,
+# commas and semicolons, and the labels and branch lengths between them.
+_NEWICK_TOKEN = re.compile(r"[(),;]|[^(),;]+")
+
+
+class ArrayTree(object):
+    """
+    A rooted time tree held in arrays.
+
+    Nodes are numbered with the tips first (in the order of the taxa of the
+    tree log they came from), then the internal nodes, with each internal node
+    numbered before its descendants (so the root is node C{tips}).
+
+    Parameters
+    ----------
+    state: int
+        The MCMC state of the tree.
+    parent: numpy.ndarray of int32
+        The parent of each node, or -1 for the root.
+    height: numpy.ndarray of float64
+        The height of each node above the youngest tip.
+    tips: int
+        The number of tips.
+    """
+
+    __slots__ = ("state", "parent", "height", "tips")
+
+    def __init__(self, state, parent, height, tips):
+        self.state = state
+        self.parent = parent
+        self.height = height
+        self.tips = tips
+
+    def __getstate__(self):
+        return (self.state, self.parent, self.height, self.tips)
+
+    def __setstate__(self, state):
+        self.state, self.parent, self.height, self.tips = state
+
+    @property
+    def root_height(self):
+        """
+        Get the height of the root.
+
+        Returns
+        -------
+        float
+        """
+        return float(self.height[self.tips])
+
+    def branch_lengths(self):
+        """
+        Get the length of the branch above each node.
+
+        Returns
+        -------
+        numpy.ndarray of float64
+            With 0.0 for the root.
+        """
+        lengths = np.zeros_like(self.height)
+        has_parent = self.parent >= 0
+        lengths[has_parent] = (
+            self.height[self.parent[has_parent]] - self.height[has_parent]
+        )
+        return lengths
+
+    def to_ete3(self, taxa=None):
+        """
+        Make an ete3 tree.
+
+        Parameters
+        ----------
+        taxa: list of str, default None
+            The names of the tips, in order. If None, tips are named by their
+            index.
+
+        Returns
+        -------
+        tree: ete3.Tree
+        """
+        lengths = self.branch_lengths()
+        nodes = [None] * len(self.parent)
+        root = nodes[self.tips] = ete3.Tree()
+        # Internal nodes are numbered before their descendants.
+        for node in list(range(self.tips + 1, len(self.parent))) + list(
+            range(self.tips)
+        ):
+            name = (taxa[node] if taxa else str(node)) if node < self.tips else ""
+            nodes[node] = nodes[self.parent[node]].add_child(
+                name=name, dist=lengths[node]
+            )
+        return root
+
+
+def parse_array_tree(line, labels):
+    """
+    Parse a tree line of a BEAST tree log into an C{ArrayTree}.
+
+    Parameters
+    ----------
+    line: bytes or str
+        A line such as "tree STATE_1000 = ((1:0.5,2:0.5):0.1,3:0.6);".
+    labels: dict
+        The index of each tip, keyed by the label used for it in the tree.
+
+    Returns
+    -------
+    tree: ArrayTree
+    """
+    if isinstance(line, bytes):
+        line = line.decode("utf-8")
+    name, newick = line.split("=", 1)
+    state = int(name.split("STATE_", 1)[1])
+    tips = len(labels)
+    parent = np.full(2 * tips - 1, -1, dtype=np.int32)
+    length = np.zeros(2 * tips - 1)
+    stack = []
+    next_internal = tips
+    last = None
+    for token in _NEWICK_TOKEN.findall(_COMMENT.sub("", newick)):
+        if token == "(":
+            parent[next_internal] = stack[-1] if stack else -1
+            stack.append(next_internal)
+            next_internal += 1
+            last = None
+        elif token == ")":
+            last = stack.pop()
+        elif token == ",":
+            last = None
+        elif token == ";":
+            break
+        elif token.strip():
+            label, _, branch_length = token.partition(":")
+            if last is None:
+                label = label.strip()
+                try:
+                    last = labels[label]
+                except KeyError:
+                    raise ValueError(
+                        "Unknown tip %r in the tree for state %d." % (label, state)
+                    )
+                parent[last] = stack[-1]
+            if branch_length.strip():
+                length[last] = float(branch_length)
+    if next_internal != 2 * tips - 1:
+        raise ValueError(
+            "The tree for state %d is not binary with %d tips." % (state, tips)
+        )
+    # Internal nodes come after their parents, so their depths can be found in
+    # order. Then the tips can be done at once.
+    depth = np.zeros(2 * tips - 1)
+    for node in range(tips + 1, 2 * tips - 1):
+        depth[node] = depth[parent[node]] + length[node]
+    depth[:tips] = depth[parent[:tips]] + length[:tips]
+    return ArrayTree(state, parent, depth.max() - depth, tips)
+
+
+def _read_nexus_header(fp):
+    """
+    Read the taxa and translate table of a NEXUS tree log.
+
+    Parameters
+    ----------
+    fp: file
+        Open in binary mode at the start of the file. It is left positioned at
+        the first tree line (or the end of the file).
+
+    Returns
+    -------
+    taxa: list of str
+        The taxon names, in translate table (or taxa block) order.
+    labels: dict
+        The index (in C{taxa}) of each tip, keyed by the label used for it in
+        the trees.
+    """
+    taxlabels = []
+    translate = []
+    section = None
+    while True:
+        offset = fp.tell()
+        line = fp.readline()
+        if not line:
+            break
+        stripped = line.decode("utf-8").strip()
+        lower = stripped.lower()
+        if _TREE_STATE.match(line) or lower.startswith("tree "):
+            fp.seek(offset)
+            break
+        if section is None:
+            if lower == "translate":
+                section = translate
+            elif lower == "taxlabels":
+                section = taxlabels
+            continue
+        if section is translate:
+            for item in stripped.rstrip(";").split(","):
+                if item.strip():
+                    label, name = item.split(None, 1)
+                    translate.append((label, name.strip().strip("'\"")))
+        else:
+            taxlabels.extend(
+                name.strip("'\"") for name in stripped.rstrip(";").split()
+            )
+        if stripped.endswith(";"):
+            section = None
+    if translate:
+        return [name for _, name in translate], {
+            label: index for index, (label, _) in enumerate(translate)
+        }
+    if taxlabels:
+        return taxlabels, {name: index for index, name in enumerate(taxlabels)}
+    raise ValueError("No translate table or taxa block found.")
+
+
+def _parse_range(path, start, end, labels, func):
+    """
+    Parse the trees whose lines start in a byte range of a tree log.
+    """
+    results = []
+    with open(path, "rb") as fp:
+        # Skip to the start of the first line starting in the range.
+        fp.seek(start - 1)
+        fp.readline()
+        while fp.tell() < end:
+            line = fp.readline()
+            if not line:
+                break
+            if _TREE_STATE.match(line):
+                tree = parse_array_tree(line, labels)
+                results.append(tree if func is None else func(tree))
+    return results
+
+
+class TreeLog(object):
+    """
+    Read the trees of a BEAST tree log (the NEXUS ".trees" file) lazily, as
+    C{ArrayTree}s.
+
+    Only the taxa and translate table are read when a C{TreeLog} is made.
+    Iterating reads the trees one line at a time. C{tree_at} finds the tree
+    for a state using an index of the byte offset of each tree (built on first
+    use by scanning the file, without parsing the trees), and C{map} parses
+    ranges of the file in parallel.
+
+    Parameters
+    ----------
+    path: str
+        The tree log.
+
+    Attributes
+    ----------
+    taxa: list of str
+        The taxon names. Tip C{i} of every tree is C{taxa[i]}.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fp:
+            self.taxa, self._labels = _read_nexus_header(fp)
+            self._start = fp.tell()
+        self._states = None
+        self._offsets = None
+
+    def __iter__(self):
+        with open(self.path, "rb") as fp:
+            fp.seek(self._start)
+            for line in fp:
+                if _TREE_STATE.match(line):
+                    yield parse_array_tree(line, self._labels)
+
+    def _index(self):
+        """
+        Find the state and byte offset of every tree.
+        """
+        if self._states is None:
+            states = []
+            offsets = []
+            offset = self._start
+            with open(self.path, "rb") as fp:
+                fp.seek(offset)
+                for line in fp:
+                    match = _TREE_STATE.match(line)
+                    if match:
+                        states.append(int(match.group(1)))
+                        offsets.append(offset)
+                    offset += len(line)
+            self._states = np.array(states, dtype=np.int64)
+            self._offsets = np.array(offsets, dtype=np.int64)
+        return self._states, self._offsets
+
+    def __len__(self):
+        return len(self._index()[0])
+
+    @property
+    def states(self):
+        """
+        Get the states of the trees.
+
+        Returns
+        -------
+        numpy.ndarray of int64
+        """
+        return self._index()[0]
+
+    def tree_at(self, state):
+        """
+        Get the tree for a state.
+
+        Parameters
+        ----------
+        state: int
+
+        Returns
+        -------
+        tree: ArrayTree
+
+        Raises
+        ------
+        KeyError
+            If there is no tree for the state.
+        """
+        states, offsets = self._index()
+        index = np.searchsorted(states, state)
+        if index == len(states) or states[index] != state:
+            raise KeyError(state)
+        with open(self.path, "rb") as fp:
+            fp.seek(offsets[index])
+            return parse_array_tree(fp.readline(), self._labels)
+
+    def map(self, func=None, workers=None, chunks=None):
+        """
+        Parse the trees in parallel, in worker processes that each parse a
+        range of the file.
+
+        Parameters
+        ----------
+        func: callable, default None
+            Called (in a worker process) on each C{ArrayTree}, to reduce what is
+            sent back. It must be picklable (e.g. a module-level function). If
+            None, the trees themselves are returned.
+        workers: int, default None
+            The number of worker processes. If C{None}, the number of CPUs is
+            used. If 1, the trees are parsed in this process.
+        chunks: int, default None
+            The number of ranges to divide the file into. If C{None}, four per
+            worker.
+
+        Returns
+        -------
+        results: list
+            The result of C{func} (or the tree) for each tree, in file order.
+        """
+        workers = workers or os.cpu_count() or 1
+        chunks = chunks or 4 * workers
+        size = os.path.getsize(self.path)
+        bounds = np.linspace(self._start, size, chunks + 1).astype(np.int64)
+        # The first range starts at a line, so nothing should be skipped.
+        bounds[0] = self._start
+        ranges = [
+            (self.path, int(start), int(end), self._labels, func)
+            for start, end in zip(bounds[:-1], bounds[1:])
+            if end > start
+        ]
+        if workers == 1:
+            parts = [_parse_range(*range_) for range_ in ranges]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                parts = list(executor.map(_parse_range, *zip(*ranges)))
+        return [result for part in parts for result in part]
@@ -0,0 +1,416 @@
+#!/usr/bin/env python
+
+"""
+Time the main BEAST2XML operations on synthetic workloads, record their peak
+memory use, and compare results against a baseline.
+
+    benchmarks/run.py run --sizes 1000 10000 100000 --output results.json
+    benchmarks/run.py compare benchmarks/baselines/baseline.json results.json
+"""
+
+from __future__ import print_function, division
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tracemalloc
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from synthetic import make_workload, write_workload
+
+from beast2xml import BEAST2XML
+
+
+# Priors changed (in turn, to each distribution) by the change_prior sweep.
+SWEEP_PRIORS = ("ClockPrior", "GammaShapePrior", "PopSizePrior", "RateAGPrior")
+SWEEP_DISTRIBUTIONS = (
+    ("lognormal", {"M": 1.0, "S": 1.25}),
+    ("gamma", {"alpha": 2.0, "beta": 0.5}),
+    ("exponential", {"mean": 1.0}),
+)
+
+
+def _loaded(workload, paths, tree=False):
+    xml = BEAST2XML()
+    xml.add_sequences(workload["reads"])
+    xml.add_ages(workload["ages"])
+    if tree:
+        xml.add_initial_tree(paths["newick"])
+    return xml
+
+
+def bench_add_sequences(workload, paths):
+    xml = BEAST2XML()
+    return lambda: xml.add_sequences(workload["reads"])
+
+
+def bench_add_dates(workload, paths):
+    xml = BEAST2XML()
+    return lambda: xml.add_dates(workload["dates"])
+
+
+def bench_add_ages(workload, paths):
+    xml = BEAST2XML()
+    return lambda: xml.add_ages(workload["ages"])
+
+
+def bench_add_initial_tree(workload, paths):
+    xml = BEAST2XML()
+    return lambda: xml.add_initial_tree(paths["newick"])
+
+
+def bench_change_prior(workload, paths):
+    # Priors are changed after a render, when the tree holds the alignment.
+    xml = _loaded(workload, paths)
+    xml.to_string()
+
+    def sweep():
+        for prior in SWEEP_PRIORS:
+            for distribution, kwargs in SWEEP_DISTRIBUTIONS:
+                xml.change_prior(prior, distribution, **kwargs)
+
+    return sweep
+
+
+def bench_to_string(workload, paths):
+    xml = _loaded(workload, paths, tree=True)
+    return lambda: xml.to_string(chain_length=10000000)
+
+
+def bench_to_xml(workload, paths):
+    xml = _loaded(workload, paths, tree=True)
+    output = os.path.join(os.path.dirname(paths["fasta"]), "output.xml")
+    return lambda: xml.to_xml(output, chain_length=10000000)
+
+
+BENCHMARKS = {
+    "add_sequences": bench_add_sequences,
+    "add_dates": bench_add_dates,
+    "add_ages": bench_add_ages,
+    "add_initial_tree": bench_add_initial_tree,
+    "change_prior": bench_change_prior,
+    "to_string": bench_to_string,
+    "to_xml": bench_to_xml,
+}
+
+
+def measure(benchmark, workload, paths, repeat):
+    """
+    Time a benchmark and measure its peak memory use.
+
+    The best of C{repeat} timings is kept. As in timeit, garbage collection is
+    turned off while timing. Peak memory is measured (with tracemalloc, which
+    slows code down) in a separate untimed run.
+
+    Parameters
+    ----------
+    benchmark: callable
+        Called with the workload and its file paths, it does any setup and
+        returns a function to measure.
+    workload: dict
+        As returned by C{synthetic.make_workload}.
+    paths: dict
+        As returned by C{synthetic.write_workload}.
+    repeat: int
+        The number of timed runs.
+
+    Returns
+    -------
+    result: dict
+        With keys "seconds" and "peak_bytes".
+    """
+    times = []
+    for _ in range(repeat):
+        function = benchmark(workload, paths)
+        gc.collect()
+        gc.disable()
+        try:
+            start = perf_counter()
+            function()
+            times.append(perf_counter() - start)
+        finally:
+            gc.enable()
+    function = benchmark(workload, paths)
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(times), "peak_bytes": peak}
+
+
+def run(sizes, names, length, repeat, progress=None):
+    """
+    Run benchmarks on synthetic workloads of several sizes.
+
+    Parameters
+    ----------
+    sizes: iterable of int
+        The numbers of taxa of the workloads.
+    names: iterable of str
+        The names of the benchmarks to run (keys of C{BENCHMARKS}).
+    length: int
+        The alignment length.
+    repeat: int
+        The number of timed runs of each benchmark.
+    progress: callable, default None
+        If not C{None}, called with each result key and result.
+
+    Returns
+    -------
+    results: dict
+        With "metadata" and "results" keys. Results are keyed by
+        "name/taxa".
+    """
+    results = {}
+    for taxa in sizes:
+        workload = make_workload(taxa, length=length)
+        with TemporaryDirectory() as directory:
+            paths = write_workload(workload, directory)
+            for name in names:
+                key = "%s/%d" % (name, taxa)
+                results[key] = measure(BENCHMARKS[name], workload, paths, repeat)
+                if progress:
+                    progress(key, results[key])
+    return {
+        "metadata": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "length": length,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(
+    baseline,
+    current,
+    threshold=0.2,
+    memory_threshold=0.2,
+    min_seconds=0.01,
+    min_bytes=2**20,
+):
+    """
+    Compare benchmark results against a baseline.
+
+    Parameters
+    ----------
+    baseline: dict
+        Results, as returned by C{run}.
+    current: dict
+        Results, as returned by C{run}.
+    threshold: float, default 0.2
+        The fraction by which a time may exceed its baseline.
+    memory_threshold: float, default 0.2
+        The fraction by which a peak memory use may exceed its baseline.
+    min_seconds: float, default 0.01
+        Times are not compared if both are below this, as they are too noisy.
+    min_bytes: int, default 2**20
+        Peak memory uses are not compared if both are below this.
+
+    Returns
+    -------
+    rows: list of tuple
+        (key, baseline seconds, seconds, baseline peak bytes, peak bytes,
+        regressed), for the keys in both results. Keys missing from the
+        baseline are not compared (see C{missing_from_baseline}).
+    """
+    rows = []
+    for key, result in current["results"].items():
+        if key not in baseline["results"]:
+            continue
+        base = baseline["results"][key]
+        slower = (
+            max(result["seconds"], base["seconds"]) >= min_seconds
+            and result["seconds"] > base["seconds"] * (1 + threshold)
+        )
+        bigger = (
+            max(result["peak_bytes"], base["peak_bytes"]) >= min_bytes
+            and result["peak_bytes"] > base["peak_bytes"] * (1 + memory_threshold)
+        )
+        rows.append(
+            (
+                key,
+                base["seconds"],
+                result["seconds"],
+                base["peak_bytes"],
+                result["peak_bytes"],
+                slower or bigger,
+            )
+        )
+    return rows
+
+
+def missing_from_baseline(baseline, current):
+    """
+    Find the results that have no baseline to be compared with.
+
+    Parameters
+    ----------
+    baseline: dict
+        Results, as returned by C{run}.
+    current: dict
+        Results, as returned by C{run}.
+
+    Returns
+    -------
+    keys: list of str
+        The keys of C{current} results that are not in C{baseline}.
+    """
+    return [key for key in current["results"] if key not in baseline["results"]]
+
+
+def print_comparison(rows, fp=sys.stdout):
+    print(
+        "%-24s %10s %10s %7s %12s %12s %7s"
+        % ("benchmark", "base s", "s", "ratio", "base MiB", "MiB", "ratio"),
+        file=fp,
+    )
+    for key, base_seconds, seconds, base_peak, peak, regressed in rows:
+        print(
+            "%-24s %10.4f %10.4f %7.2f %12.1f %12.1f %7.2f%s"
+            % (
+                key,
+                base_seconds,
+                seconds,
+                seconds / base_seconds if base_seconds else float("inf"),
+                base_peak / 2**20,
+                peak / 2**20,
+                peak / base_peak if base_peak else float("inf"),
+                "  REGRESSION" if regressed else "",
+            ),
+            file=fp,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="Benchmark BEAST2 XML generation.",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser(
+        "run",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        help="Run the benchmarks.",
+    )
+    run_parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1000, 10000, 100000],
+        metavar="N",
+        help="The numbers of taxa to benchmark with (e.g., 1000 10000 100000).",
+    )
+    run_parser.add_argument(
+        "--benchmarks",
+        nargs="+",
+        choices=sorted(BENCHMARKS),
+        default=list(BENCHMARKS),
+        metavar="NAME",
+        help="The benchmarks to run. Choices: %s." % ", ".join(BENCHMARKS),
+    )
+    run_parser.add_argument(
+        "--length", type=int, default=1000, help="The alignment length."
+    )
+    run_parser.add_argument(
+        "--repeat", type=int, default=3, help="The number of timed runs."
+    )
+    run_parser.add_argument(
+        "--output", metavar="FILE", help="A JSON file to write the results to."
+    )
+    run_parser.add_argument(
+        "--compare",
+        metavar="BASELINE",
+        help="A baseline JSON file to compare the results with.",
+    )
+
+    compare_parser = subparsers.add_parser(
+        "compare",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        help="Compare results with a baseline.",
+    )
+    compare_parser.add_argument("baseline", help="The baseline JSON file.")
+    compare_parser.add_argument("results", help="The results JSON file.")
+
+    for subparser in run_parser, compare_parser:
+        subparser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.2,
+            help="The fraction by which a time may exceed its baseline.",
+        )
+        subparser.add_argument(
+            "--memory_threshold",
+            type=float,
+            default=0.2,
+            help="The fraction by which peak memory may exceed its baseline.",
+        )
+        subparser.add_argument(
+            "--min_seconds",
+            type=float,
+            default=0.01,
+            help="Times below this are too noisy to compare.",
+        )
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run(
+            args.sizes,
+            args.benchmarks,
+            args.length,
+            args.repeat,
+            progress=lambda key, result: print(
+                "%-24s %10.4f s %10.1f MiB"
+                % (key, result["seconds"], result["peak_bytes"] / 2**20),
+                file=sys.stderr,
+            ),
+        )
+        if args.output:
+            with open(args.output, "w") as fp:
+                json.dump(results, fp, indent=2, sort_keys=True)
+                fp.write("\n")
+        baseline_path = args.compare
+    else:
+        with open(args.results) as fp:
+            results = json.load(fp)
+        baseline_path = args.baseline
+
+    if baseline_path:
+        with open(baseline_path) as fp:
+            baseline = json.load(fp)
+        rows = compare(
+            baseline,
+            results,
+            threshold=args.threshold,
+            memory_threshold=args.memory_threshold,
+            min_seconds=args.min_seconds,
+        )
+        print_comparison(rows)
+        missing = missing_from_baseline(baseline, results)
+        if missing:
+            print(
+                "%d result(s) not in the baseline, so not compared: %s"
+                % (len(missing), ", ".join(missing)),
+                file=sys.stderr,
+            )
+        regressions = [row[0] for row in rows if row[-1]]
+        if regressions:
+            print(
+                "%d regression(s): %s" % (len(regressions), ", ".join(regressions)),
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+"""
+Generate synthetic workloads (alignments, dated ids, metadata tables and
+Newick trees) for the benchmarks in this directory.
+"""
+
+from __future__ import print_function, division
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+from dark.reads import Read
+
+
+REGIONS = ("Africa", "Asia", "Europe", "North America", "Oceania", "South America")
+
+
+def make_workload(taxa, length=1000, seed=0, mutation_rate=0.01):
+    """
+    Make a synthetic workload.
+
+    Parameters
+    ----------
+    taxa: int
+        The number of sequences.
+    length: int, default 1000
+        The alignment length.
+    seed: int, default 0
+        The random seed, so workloads are reproducible.
+    mutation_rate: float, default 0.01
+        The fraction of sites of each sequence that differ from a random
+        reference.
+
+    Returns
+    -------
+    workload: dict
+        With keys "reads" (a list of C{dark.reads.Read}), "ids", "dates" (a
+        C{pandas.DataFrame} with strain and date columns), "ages" (with strain
+        and year_decimal columns), "metadata" (with strain, date, region and
+        country columns) and "newick" (a random tree with the ids as tips).
+    """
+    rng = np.random.default_rng(seed)
+    bases = np.frombuffer(b"ACGT", dtype=np.uint8)
+    reference = rng.choice(bases, length)
+    matrix = np.tile(reference, (taxa, 1))
+    mutated = rng.random(matrix.shape) < mutation_rate
+    matrix[mutated] = rng.choice(bases, int(mutated.sum()))
+
+    days = rng.integers(0, 4 * 365, taxa)
+    dates = pd.Timestamp("2020-01-01") + pd.to_timedelta(days, unit="D")
+    width = len(str(taxa))
+    ids = [
+        "seq%0*d_%s" % (width, index, date)
+        for index, date in enumerate(dates.strftime("%Y-%m-%d"))
+    ]
+    reads = [
+        Read(id_, row.tobytes().decode("ascii")) for id_, row in zip(ids, matrix)
+    ]
+    regions = rng.choice(REGIONS, taxa)
+
+    return {
+        "reads": reads,
+        "ids": ids,
+        "dates": pd.DataFrame({"strain": ids, "date": dates}),
+        "ages": pd.DataFrame(
+            {
+                "strain": ids,
+                "year_decimal": dates.year
+                + (dates.dayofyear - 0.5) / np.where(dates.is_leap_year, 366, 365),
+            }
+        ),
+        "metadata": pd.DataFrame(
+            {
+                "strain": ids,
+                "date": dates.strftime("%Y-%m-%d"),
+                "region": regions,
+                "country": [
+                    "%s-%d" % (region, number)
+                    for region, number in zip(regions, rng.integers(0, 10, taxa))
+                ],
+            }
+        ),
+        "newick": random_newick(ids, rng),
+    }
+
+
+def random_newick(ids, rng):
+    """
+    Make a random (coalescent-like) tree with the given tip names.
+
+    Parameters
+    ----------
+    ids: list of str
+        The tip names.
+    rng: numpy.random.Generator
+
+    Returns
+    -------
+    newick: str
+    """
+    nodes = list(ids)
+    while len(nodes) > 1:
+        first = nodes.pop(rng.integers(len(nodes)))
+        second = nodes.pop(rng.integers(len(nodes)))
+        lengths = rng.exponential(0.01, 2)
+        nodes.append(
+            "(%s:%.6f,%s:%.6f)" % (first, lengths[0], second, lengths[1])
+        )
+    return nodes[0] + ";"
+
+
+def write_workload(workload, directory):
+    """
+    Write a workload to files in a directory.
+
+    Parameters
+    ----------
+    workload: dict
+        As returned by C{make_workload}.
+    directory: str
+
+    Returns
+    -------
+    paths: dict
+        With keys "fasta", "dates", "ages", "metadata" and "newick" giving the
+        paths of the files written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {
+        "fasta": os.path.join(directory, "sequences.fasta"),
+        "dates": os.path.join(directory, "dates.tsv"),
+        "ages": os.path.join(directory, "ages.tsv"),
+        "metadata": os.path.join(directory, "metadata.tsv"),
+        "newick": os.path.join(directory, "tree.nwk"),
+    }
+    with open(paths["fasta"], "w") as fp:
+        for read in workload["reads"]:
+            fp.write(">%s\n%s\n" % (read.id, read.sequence))
+    for name in "dates", "ages", "metadata":
+        workload[name].to_csv(paths[name], sep="\t", index=False)
+    with open(paths["newick"], "w") as fp:
+        fp.write(workload["newick"] + "\n")
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="Write a synthetic benchmark workload to a directory.",
+    )
+    parser.add_argument("directory", help="The directory to write files to.")
+    parser.add_argument(
+        "--taxa", type=int, default=1000, help="The number of sequences."
+    )
+    parser.add_argument(
+        "--length", type=int, default=1000, help="The alignment length."
+    )
+    parser.add_argument("--seed", type=int, default=0, help="The random seed.")
+    args = parser.parse_args()
+
+    for name, path in write_workload(
+        make_workload(args.taxa, length=args.length, seed=args.seed), args.directory
+    ).items():
+        print("%s: %s" % (name, path))
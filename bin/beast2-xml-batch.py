@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, division
+
+import argparse
+import sys
+
+from beast2xml.batch import render_many
+from beast2xml.cache import RenderCache
+
+parser = argparse.ArgumentParser(
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    description=(
+        "Write many BEAST2 XML files, as described by a CSV, TSV or JSON "
+        "manifest, using a pool of worker processes. Outputs that already "
+        "exist are skipped, so an interrupted batch can be run again."
+    ),
+)
+
+parser.add_argument(
+    "manifest",
+    metavar="MANIFEST",
+    help=(
+        "The manifest file (.csv, .tsv or .json). Each job must give an "
+        '"output" path and may give "template" or "clock_model", '
+        '"sequences" (a FASTA file), "ages" or "dates" (tab separated files, '
+        'see "separator", "age_column", "date_column" and "sample_id_field"), '
+        '"initial_tree" and any of the to_xml arguments: "chain_length", '
+        '"default_age", "date_direction", "log_file_basename", '
+        '"trace_log_every", "tree_log_every", "screen_log_every", '
+        '"store_state_every" and "mimic_beauti".'
+    ),
+)
+
+parser.add_argument(
+    "--workers",
+    type=int,
+    metavar="N",
+    help="The number of worker processes. Defaults to the number of CPUs.",
+)
+
+parser.add_argument(
+    "--cache",
+    metavar="DIR",
+    help=(
+        "A directory to cache rendered XML in. Jobs whose input files and "
+        "arguments are unchanged since they were cached are not rendered again."
+    ),
+)
+
+parser.add_argument(
+    "--cache_max_bytes",
+    metavar="SIZE",
+    help=(
+        "The largest the cache may grow to, as a number of bytes or with a K, "
+        "M, G or T suffix (e.g. 20G). The least recently used files are removed "
+        "to keep it within this size."
+    ),
+)
+
+parser.add_argument(
+    "--quiet",
+    action="store_true",
+    help="If specified, do not report progress on standard error.",
+)
+
+args = parser.parse_args()
+
+
+def progress(done, total, result):
+    message = "[%d/%d] %s %s" % (done, total, result["status"], result["output"])
+    if result["error"]:
+        message += ": " + result["error"]
+    print(message, file=sys.stderr)
+
+
+if args.cache is None:
+    cache = None
+else:
+    cache = RenderCache(args.cache, max_bytes=args.cache_max_bytes)
+
+results = render_many(
+    args.manifest,
+    workers=args.workers,
+    progress=None if args.quiet else progress,
+    cache=cache,
+)
+
+sys.exit(int(any(result["status"] == "failed" for result in results)))
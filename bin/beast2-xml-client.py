@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, division
+
+import argparse
+import json
+import os
+import sys
+from beast2xml.cli import (
+    add_arguments,
+    add_fasta_arguments,
+    print_logging_plan,
+    print_xml,
+    request_from_args,
+)
+from beast2xml.client import send_request
+
+parser = argparse.ArgumentParser(
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    description=(
+        "Given FASTA on stdin (or in a file via the --fastaFile option), write "
+        "an XML BEAST2 input file on stdout, made by a server started with "
+        "beast2-xml-serve.py. The options are those of beast2-xml.py."
+    ),
+)
+
+group = parser.add_mutually_exclusive_group(required=True)
+
+group.add_argument(
+    "--socket", metavar="PATH", help="The path of the server's Unix socket."
+)
+
+group.add_argument(
+    "--url", help="The URL of the server (e.g. http://127.0.0.1:8765)."
+)
+
+add_arguments(parser)
+add_fasta_arguments(parser)
+args = parser.parse_args()
+
+request = request_from_args(args)
+
+if args.fastaFile is None or args.fastaFile == "-":
+    request["fasta"] = sys.stdin.read()
+else:
+    # The server may not share our working directory.
+    request["fasta_file"] = os.path.abspath(args.fastaFile)
+if args.template_file is not None:
+    request["template"] = os.path.abspath(args.template_file)
+request["read_class"] = args.readClass
+request["format"] = "fastq" if args.fastq else "fasta-ss" if args.fasta_ss else "fasta"
+
+response = send_request(request, socket_path=args.socket, url=args.url)
+
+if response["status"] != "ok":
+    print("Error: %s" % response["error"], file=sys.stderr)
+    sys.exit(1)
+
+if response["logging_plan"] is not None:
+    print_logging_plan(response["logging_plan"])
+
+print_xml(response["xml"])
+
+if args.profile:
+    from beast2xml.metrics import RenderMetrics
+
+    metrics = RenderMetrics()
+    metrics.stages = response["metrics"]["stages"]
+    print(metrics.report(), file=sys.stderr)
+
+if args.metrics_json:
+    with open(args.metrics_json, "w") as fp:
+        json.dump(response["metrics"], fp, indent=2)
+        fp.write("\n")
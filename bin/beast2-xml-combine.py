@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, division
+
+import argparse
+import sys
+from beast2xml.combine import combine_logs
+
+
+def burnin(value):
+    """
+    Convert a burn-in to a proportion (if less than one) or a number of states.
+    """
+    value = float(value)
+    return value if value < 1.0 else int(value)
+
+
+parser = argparse.ArgumentParser(
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    description=(
+        "Combine the trace (.log) and tree (.trees) logs of replicate BEAST2 "
+        "runs, removing a burn-in from each and optionally thinning them, as "
+        "BEAST's LogCombiner does."
+    ),
+)
+
+parser.add_argument(
+    "basenames",
+    nargs="+",
+    metavar="BASENAME",
+    help=(
+        "The log file basename of each run (as given to beast2-xml.py with "
+        "--log_file_basename)."
+    ),
+)
+
+parser.add_argument(
+    "--output",
+    required=True,
+    metavar="BASENAME",
+    help='The basename of the combined logs (".log" and ".trees" are added).',
+)
+
+parser.add_argument(
+    "--burnin",
+    type=burnin,
+    nargs="+",
+    default=[0.1],
+    metavar="N",
+    help=(
+        "The burn-in to remove from each run: a proportion of its states (if "
+        "less than one) or a number of states. Give one value for all runs or "
+        "one per run."
+    ),
+)
+
+parser.add_argument(
+    "--resample",
+    type=int,
+    metavar="N",
+    help="If given, only keep samples whose state is a multiple of this.",
+)
+
+parser.add_argument(
+    "--workers",
+    type=int,
+    metavar="N",
+    help="The number of worker processes (default: one per log, up to the number "
+    "of CPUs).",
+)
+
+args = parser.parse_args()
+
+try:
+    results = combine_logs(
+        args.basenames,
+        args.output,
+        burnin=args.burnin[0] if len(args.burnin) == 1 else args.burnin,
+        resample=args.resample,
+        workers=args.workers,
+    )
+except ValueError as e:
+    print(e, file=sys.stderr)
+    sys.exit(1)
+
+for output, samples in results.items():
+    print(
+        "%s: %d samples (%s)"
+        % (output, sum(samples), ", ".join(map(str, samples))),
+        file=sys.stderr,
+    )
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, division
+
+import argparse
+import json
+import sys
+from beast2xml.diff import diff
+
+parser = argparse.ArgumentParser(
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    description=(
+        "Report the differences between two BEAST2 XML files: taxa added or "
+        "removed, changed sequences and ages, and added, removed or changed "
+        "model elements (compared by id). Exits with status 1 if the files "
+        "differ."
+    ),
+)
+
+parser.add_argument("xml1", metavar="OLD.xml", help="The first (old) XML file.")
+
+parser.add_argument("xml2", metavar="NEW.xml", help="The second (new) XML file.")
+
+parser.add_argument(
+    "--json",
+    action="store_true",
+    help="If specified, print the differences as JSON.",
+)
+
+args = parser.parse_args()
+
+differences = diff(args.xml1, args.xml2)
+
+if args.json:
+    print(json.dumps(differences.as_dict(), indent=2))
+else:
+    print(differences.report())
+
+sys.exit(1 if differences else 0)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, division
+
+import argparse
+import signal
+import sys
+from beast2xml.server import serve
+
+parser = argparse.ArgumentParser(
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    description=(
+        "Serve BEAST2 XML render requests (e.g. from beast2-xml-client.py) "
+        "from a pool of worker processes that keep templates and imported "
+        "modules loaded."
+    ),
+)
+
+group = parser.add_mutually_exclusive_group(required=True)
+
+group.add_argument(
+    "--socket", metavar="PATH", help="The path of a Unix socket to listen on."
+)
+
+group.add_argument(
+    "--port", type=int, metavar="N", help="The port to listen on for HTTP requests."
+)
+
+parser.add_argument(
+    "--host",
+    default="127.0.0.1",
+    help="The host to listen on for HTTP requests (if --port is given).",
+)
+
+parser.add_argument(
+    "--workers",
+    type=int,
+    metavar="N",
+    help="The number of worker processes (default: the number of CPUs).",
+)
+
+args = parser.parse_args()
+
+# Exit normally when terminated, so the socket is removed.
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+try:
+    serve(socket_path=args.socket, host=args.host, port=args.port, workers=args.workers)
+except ValueError as e:
+    print(e, file=sys.stderr)
+    sys.exit(1)
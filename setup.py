@@ -27,7 +27,15 @@ setup(
     ),
     long_description=("Please see https://github.com/acorg/beast2-xml for details."),
     license="MIT",
-    scripts=["bin/beast2-xml.py", "bin/beast2-xml-version.py"],
+    scripts=[
+        "bin/beast2-xml.py",
+        "bin/beast2-xml-batch.py",
+        "bin/beast2-xml-client.py",
+        "bin/beast2-xml-combine.py",
+        "bin/beast2-xml-diff.py",
+        "bin/beast2-xml-serve.py",
+        "bin/beast2-xml-version.py",
+    ],
     install_requires=[
         "dark-matter>=1.1.28",
         "pandas>=2.2.2",
@@ -0,0 +1,146 @@
+import json
+import os
+import shutil
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+import xml.etree.ElementTree as ET
+
+from beast2xml import BEAST2XML
+from beast2xml.batch import read_manifest, render_many
+
+
+class TestBatch(TestCase):
+    """
+    Test rendering many XML files from a manifest.
+    """
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.fasta = os.path.join(self.dir, "seqs.fasta")
+        with open(self.fasta, "w") as fp:
+            fp.write(">id1\nACGT\n>id2\nACGA\n")
+        self.ages = os.path.join(self.dir, "ages.tsv")
+        with open(self.ages, "w") as fp:
+            fp.write("strain\tyear_decimal\nid1\t2020.5\nid2\t2021.0\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_manifest(self, name, clock_models):
+        path = os.path.join(self.dir, name)
+        with open(path, "w") as fp:
+            fp.write("output,clock_model,sequences,ages,chain_length\n")
+            for clock_model in clock_models:
+                fp.write(
+                    "%s,%s,%s,%s,1000\n"
+                    % (
+                        os.path.join(self.dir, "out", clock_model + ".xml"),
+                        clock_model,
+                        self.fasta,
+                        self.ages,
+                    )
+                )
+        return path
+
+    def test_read_csv_manifest(self):
+        """
+        A CSV manifest must be read with its to_xml arguments converted.
+        """
+        jobs = read_manifest(self.write_manifest("jobs.csv", ["strict"]))
+        self.assertEqual(1, len(jobs))
+        self.assertEqual(1000, jobs[0]["chain_length"])
+        self.assertEqual("strict", jobs[0]["clock_model"])
+
+    def test_unknown_manifest_key(self):
+        """
+        A manifest job with an unknown key must raise a ValueError.
+        """
+        path = os.path.join(self.dir, "jobs.json")
+        with open(path, "w") as fp:
+            json.dump([{"output": "x.xml", "chainLength": 3}], fp)
+        self.assertRaisesRegex(
+            ValueError, r"^Unknown manifest key\(s\): chainLength\.$", read_manifest, path
+        )
+
+    def test_render_many(self):
+        """
+        Rendering a manifest must write one XML per job, report progress and
+        skip the jobs whose output exists when run again.
+        """
+        clock_models = ["strict", "relaxed-lognormal", "random-local"]
+        manifest = self.write_manifest("jobs.csv", clock_models)
+        progress = []
+        results = render_many(
+            manifest, workers=2, progress=lambda *args: progress.append(args[:2])
+        )
+        self.assertEqual(["rendered"] * 3, [result["status"] for result in results])
+        self.assertEqual([(1, 3), (2, 3), (3, 3)], progress)
+        for clock_model in clock_models:
+            tree = ET.parse(os.path.join(self.dir, "out", clock_model + ".xml"))
+            elements = BEAST2XML.find_elements(tree)
+            self.assertEqual("1000", elements["run"].get("chainLength"))
+            self.assertEqual(
+                "id1=2020.5,id2=2021.0",
+                elements["./run/state/tree/trait"].get("value"),
+            )
+
+        results = render_many(manifest, workers=1)
+        self.assertEqual(["skipped"] * 3, [result["status"] for result in results])
+
+    def test_failed_job(self):
+        """
+        A job that cannot be rendered must be reported as failed without
+        leaving an output file.
+        """
+        output = os.path.join(self.dir, "bad.xml")
+        (result,) = render_many(
+            [{"output": output, "sequences": self.fasta, "ages": self.fasta}],
+            workers=1,
+        )
+        self.assertEqual("failed", result["status"])
+        self.assertEqual("An age_data column must be id or strain", result["error"])
+        self.assertEqual(["ages.tsv", "seqs.fasta"], sorted(os.listdir(self.dir)))
+
+    def test_cache(self):
+        """
+        Jobs whose inputs are unchanged since they were rendered with a cache
+        must be taken from the cache, and jobs whose inputs have changed must
+        be rendered again.
+        """
+        manifest = self.write_manifest("jobs.csv", ["strict", "random-local"])
+        cache = os.path.join(self.dir, "cache")
+        results = render_many(manifest, workers=1, cache=cache)
+        self.assertEqual(["rendered"] * 2, [result["status"] for result in results])
+        shutil.rmtree(os.path.join(self.dir, "out"))
+        results = render_many(manifest, workers=1, cache=cache)
+        self.assertEqual(["cached"] * 2, [result["status"] for result in results])
+        self.assertTrue(os.path.exists(os.path.join(self.dir, "out", "strict.xml")))
+
+        shutil.rmtree(os.path.join(self.dir, "out"))
+        with open(self.ages, "w") as fp:
+            fp.write("strain\tyear_decimal\nid1\t2020.5\nid2\t2021.5\n")
+        results = render_many(manifest, workers=1, cache=cache)
+        self.assertEqual(["rendered"] * 2, [result["status"] for result in results])
+
+    def test_rewritten_inputs(self):
+        """
+        An alignment and age table rewritten at the same paths must be read
+        again by a later batch in the same process.
+        """
+        manifest = self.write_manifest("jobs.csv", ["strict"])
+        output = os.path.join(self.dir, "out", "strict.xml")
+        render_many(manifest, workers=1)
+        os.remove(output)
+        with open(self.fasta, "w") as fp:
+            fp.write(">id1\nACGT\n>id3\nACGA\n")
+        with open(self.ages, "w") as fp:
+            fp.write("strain\tyear_decimal\nid1\t2020.5\nid3\t2022.0\n")
+        for path in self.fasta, self.ages:
+            mtime = os.stat(path).st_mtime_ns + 10**9
+            os.utime(path, ns=(mtime, mtime))
+        render_many(manifest, workers=1)
+        elements = BEAST2XML.find_elements(ET.parse(output))
+        self.assertEqual(
+            "id1=2020.5,id3=2022.0", elements["./run/state/tree/trait"].get("value")
+        )
@@ -1,10 +1,18 @@
-from unittest import TestCase
+import os
+import shutil
+import tempfile
+from unittest import IsolatedAsyncioTestCase, TestCase
 from six.moves import builtins
-from six import assertRaisesRegex, PY3, StringIO
+from six import assertRaisesRegex, BytesIO, PY3, StringIO
 import xml.etree.ElementTree as ET
 from dark.reads import Read
 from beast2xml import BEAST2XML
+from beast2xml.beast2 import _ChunkWriter, _parse_template
+from beast2xml.date_utilities import decimals_to_dates
 from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+import ete3
 
 try:
     from unittest.mock import mock_open, patch
@@ -13,6 +21,73 @@ except ImportError:
 
 open_ = ("builtins" if PY3 else "__builtin__") + ".open"
 
+SKYLINE_TEMPLATE = """<?xml version='1.0' encoding='UTF-8'?>
+<beast version="2.6">
+<data id="alignment" name="alignment"></data>
+<run id="mcmc" spec="MCMC" chainLength="1000000">
+    <state id="state" storeEvery="5000">
+        <tree id="Tree.t:alignment" name="stateNode">
+            <trait id="dateTrait.t:alignment" spec="beast.evolution.tree.TraitSet" traitname="date" value="">
+                <taxa id="TaxonSet.alignment" spec="TaxonSet">
+                    <alignment idref="alignment"/>
+                </taxa>
+            </trait>
+            <taxonset idref="TaxonSet.alignment"/>
+        </tree>
+        <parameter id="reproductiveNumber.t:alignment" spec="parameter.RealParameter" dimension="1" lower="0.0" name="stateNode" upper="Infinity">2.0</parameter>
+        <parameter id="becomeUninfectiousRate.t:alignment" spec="parameter.RealParameter" dimension="1" lower="0.0" name="stateNode" upper="Infinity">1.0</parameter>
+        <parameter id="samplingProportion.t:alignment" spec="parameter.RealParameter" dimension="1" lower="0.0" name="stateNode" upper="1.0">0.01</parameter>
+    </state>
+    <init id="RandomTree.t:alignment" spec="beast.evolution.tree.RandomTree" estimate="false" initial="@Tree.t:alignment" taxa="@alignment">
+        <populationModel id="ConstantPopulation0.t:alignment" spec="ConstantPopulation">
+            <parameter id="randomPopSize.t:alignment" name="popSize">1.0</parameter>
+        </populationModel>
+    </init>
+    <distribution id="posterior" spec="util.CompoundDistribution">
+        <distribution id="prior" spec="util.CompoundDistribution">
+            <distribution id="BirthDeathSkySerial.t:alignment" spec="beast.evolution.speciation.BirthDeathSkylineModel" becomeUninfectiousRate="@becomeUninfectiousRate.t:alignment" reproductiveNumber="@reproductiveNumber.t:alignment" samplingProportion="@samplingProportion.t:alignment" tree="@Tree.t:alignment">
+                <parameter id="origin.t:alignment" name="origin">10.0</parameter>
+            </distribution>
+            <prior id="reproductiveNumberPrior.t:alignment" name="distribution" x="@reproductiveNumber.t:alignment">
+                <LogNormal id="LogNormalDistributionModel.0" name="distr" M="0.0" S="1.0"/>
+            </prior>
+            <prior id="becomeUninfectiousRatePrior.t:alignment" name="distribution" x="@becomeUninfectiousRate.t:alignment">
+                <LogNormal id="LogNormalDistributionModel.1" name="distr" M="0.0" S="1.0"/>
+            </prior>
+            <prior id="samplingProportionPrior.t:alignment" name="distribution" x="@samplingProportion.t:alignment">
+                <Beta id="Beta.0" name="distr" alpha="1.0" beta="1.0"/>
+            </prior>
+        </distribution>
+        <distribution id="likelihood" spec="util.CompoundDistribution" useThreads="true">
+            <distribution id="treeLikelihood.alignment" spec="ThreadedTreeLikelihood" data="@alignment" tree="@Tree.t:alignment">
+                <siteModel id="SiteModel.s:alignment" spec="SiteModel">
+                    <parameter id="mutationRate.s:alignment" estimate="false" name="mutationRate">1.0</parameter>
+                    <substModel id="JC69.s:alignment" spec="JukesCantor"/>
+                </siteModel>
+                <branchRateModel id="StrictClock.c:alignment" spec="beast.evolution.branchratemodel.StrictClockModel">
+                    <parameter id="clockRate.c:alignment" estimate="false" name="clock.rate">1.0</parameter>
+                </branchRateModel>
+            </distribution>
+        </distribution>
+    </distribution>
+    <logger id="tracelog" fileName="skyline.log" logEvery="1000" model="@posterior" sanitiseHeaders="true" sort="smart">
+        <log idref="posterior"/>
+        <log idref="likelihood"/>
+        <log idref="prior"/>
+        <log idref="reproductiveNumber.t:alignment"/>
+        <log idref="becomeUninfectiousRate.t:alignment"/>
+        <log idref="samplingProportion.t:alignment"/>
+    </logger>
+    <logger id="screenlog" logEvery="1000">
+        <log idref="posterior"/>
+    </logger>
+    <logger id="treelog.t:alignment" fileName="skyline.trees" logEvery="1000" mode="tree">
+        <log id="TreeWithMetaDataLogger.t:alignment" spec="beast.evolution.tree.TreeWithMetaDataLogger" tree="@Tree.t:alignment"/>
+    </logger>
+</run>
+</beast>
+"""
+
 
 class TestTemplate(TestCase):
     """
@@ -176,6 +251,48 @@ class TestTemplate(TestCase):
         """
         ET.fromstring(BEAST2XML(template=StringIO(BEAST2XML().to_string())).to_string())
 
+    def test_template_alignment_is_skipped(self):
+        """
+        An alignment embedded in a template must not be loaded, whatever size
+        of chunks the template is read in, and must be replaced by the added
+        sequences.
+        """
+        original = BEAST2XML()
+        original.add_sequences([Read("old1", "AC>T" * 5), Read("old2", "GGGG")])
+        template = original.to_string()
+        for chunk_size in (1, 5, 7, 64, 1 << 20):
+            tree = _parse_template(StringIO(template), chunk_size=chunk_size)
+            self.assertEqual(0, len(tree.find("data")))
+            self.assertEqual("alignment", tree.find("data").get("id"))
+            self.assertIsNot(None, tree.find("./run/state/tree/trait"))
+
+        xml = BEAST2XML(template=StringIO(template))
+        xml.add_sequence(Read("new1", "ACGT"))
+        tree = ET.ElementTree(ET.fromstring(xml.to_string()))
+        data = BEAST2XML.find_elements(tree)["data"]
+        self.assertEqual(["new1"], [child.get("taxon") for child in data])
+
+    def test_template_nested_data_is_skipped(self):
+        """
+        <data> elements nested in the <data> element of a template must be
+        skipped with it, whatever size of chunks the template is read in.
+        """
+        original = BEAST2XML()
+        original.add_sequences([Read("old1", "ACGT")])
+        template = original.to_string().replace(
+            "<sequence ",
+            '<data idref="b"></data><data id="c"><data idref="d" /></data >'
+            '<data idref="e"/><sequence ',
+            1,
+        )
+        ET.fromstring(template)
+        for chunk_size in (1, 5, 7, 64, 1 << 20):
+            for source in StringIO(template), BytesIO(template.encode()):
+                tree = _parse_template(source, chunk_size=chunk_size)
+                self.assertEqual(0, len(tree.find("data")))
+                self.assertEqual("alignment", tree.find("data").get("id"))
+                self.assertIsNot(None, tree.find("./run/state/tree/trait"))
+
 
 class TestMisc(TestCase):
     """
@@ -667,3 +784,978 @@ class TestStrictClockModel(TestCase, ClockModelMixin):
             './run/logger[@id="tracelog"]/log[@idref="clockRate.c:alignment"]'
         )
         self.assertTrue(logger is not None)
+
+
+class TestSkyline(TestCase):
+    """
+    Test editing the change times of a birth death skyline model.
+    """
+
+    def skyline_xml(self):
+        xml = BEAST2XML(template=StringIO(SKYLINE_TEMPLATE))
+        xml.add_sequences([Read("id1", "AC"), Read("id2", "AG")])
+        xml.add_ages({"id1": 2020.0, "id2": 2021.0})
+        return xml
+
+    def test_repeated_calls_replace_change_times(self):
+        """
+        Calling add_rate_change_times twice must leave a single change-time
+        element holding the second set of times.
+        """
+        xml = self.skyline_xml()
+        xml.add_rate_change_times("birthRateChangeTimes", [0.5])
+        xml.add_rate_change_times("birthRateChangeTimes", [0.25, 0.75])
+        skyline = xml._find_skyline_element()
+        self.assertEqual(1, len(skyline.findall("birthRateChangeTimes")))
+        self.assertEqual(
+            [0.0, 0.25, 0.75],
+            list(xml.extract_rate_change_reverse_times("birthRateChangeTimes")),
+        )
+        parameter = xml._tree.find(
+            "./run/state/parameter[@id='reproductiveNumber.t:alignment']"
+        )
+        self.assertEqual("3", parameter.get("dimension"))
+
+    def test_times_are_not_modified(self):
+        """
+        The times passed to add_rate_change_times must not be modified.
+        """
+        xml = self.skyline_xml()
+        times = [0.5, 0.1]
+        xml.add_rate_change_times("samplingRateChangeTimes", times)
+        self.assertEqual([0.5, 0.1], times)
+
+    def test_set_all_change_times(self):
+        """
+        Setting all three change-time arrays in one call must set each array
+        and the matching reverseTimeArrays flags.
+        """
+        xml = self.skyline_xml()
+        xml.set_rate_change_times(
+            birth_rate_change_times=np.array([0.5]),
+            death_rate_change_times=[0.2, 0.4],
+            sampling_rate_change_times=(0.1,),
+        )
+        skyline = xml._find_skyline_element()
+        self.assertEqual(
+            "true true true false false", skyline.find("reverseTimeArrays").get("value")
+        )
+        self.assertEqual("0.0 0.2 0.4", skyline.find("deathRateChangeTimes").get("value"))
+        self.assertEqual("0.0 0.1", skyline.find("samplingRateChangeTimes").get("value"))
+
+    def test_unsupported_parameter(self):
+        """
+        Passing an unsupported parameter to add_rate_change_times must raise
+        a ValueError.
+        """
+        xml = self.skyline_xml()
+        error = "^Currently this method only supports parameter being: "
+        assertRaisesRegex(
+            self, ValueError, error, xml.add_rate_change_times, "origin", [1.0]
+        )
+
+    def test_add_rate_change_dates_datetime_index(self):
+        """
+        Passing a DatetimeIndex to add_rate_change_dates must give times back
+        from the youngest sample.
+        """
+        xml = self.skyline_xml()
+        xml.add_rate_change_dates(
+            "samplingRateChangeTimes", pd.DatetimeIndex(["2020-01-01", "2020-07-02"])
+        )
+        times = xml.extract_rate_change_reverse_times("samplingRateChangeTimes")
+        self.assertEqual(3, len(times))
+        self.assertAlmostEqual(0.5, times[1], places=2)
+        self.assertAlmostEqual(1.0, times[2])
+
+    def test_auto_rate_change_grid_equal(self):
+        """
+        An equal grid must divide the sampling period into equal intervals
+        and fix the sampling proportion of empty intervals to zero, counting
+        the dimensions forward in time from the interval before the earliest
+        sample.
+        """
+        xml = self.skyline_xml()
+        xml.add_ages({"id3": 2016.0})
+        times = xml.auto_rate_change_grid(
+            "samplingRateChangeTimes", 5, strategy="equal"
+        )
+        self.assertEqual([0.0, 1.0, 2.0, 3.0, 4.0], list(times[:-1]))
+        self.assertAlmostEqual(5.0 + 1e-6, times[-1])
+        state = xml._tree.find(
+            "./run/state/parameter[@id='samplingProportion.t:alignment']"
+        )
+        self.assertEqual("0.0 0.01 0.0 0.0 0.01 0.01", state.text)
+        prior = xml._tree.find(
+            "./run/distribution/distribution/"
+            "distribution[@id='samplingProportionPrior.t:alignment']"
+        )
+        self.assertEqual("false true false false true true", prior.get("xInclude"))
+
+    def test_auto_rate_change_grid_quantile(self):
+        """
+        A quantile grid must place boundaries at quantiles of the ages.
+        """
+        xml = self.skyline_xml()
+        xml.add_ages({"id3": 2020.5, "id4": 2020.75})
+        times = xml.auto_rate_change_grid("birthRateChangeTimes", 2)
+        self.assertAlmostEqual(0.375, times[1])
+        self.assertAlmostEqual(1.0 + 1e-6, times[2])
+
+    def test_auto_rate_change_grid_epi_week(self):
+        """
+        An epi-week grid must place boundaries on Sundays, with each interval
+        spanning the same number of whole weeks.
+        """
+        xml = self.skyline_xml()
+        times = xml.auto_rate_change_grid(
+            "birthRateChangeTimes", 4, strategy="epi-week", offset_earliest=0
+        )
+        self.assertEqual(
+            ["2020-10-18", "2020-07-12", "2020-04-05", "2019-12-29"],
+            [str(day) for day in decimals_to_dates(2021.0 - times[1:]).astype("M8[D]")],
+        )
+
+    def test_auto_rate_change_grid_again(self):
+        """
+        Calling auto_rate_change_grid again must replace the grid, freeing the
+        sampling proportions it fixed to zero before fixing those of the new
+        empty intervals.
+        """
+        xml = self.skyline_xml()
+        xml.auto_rate_change_grid(
+            "samplingRateChangeTimes", 4, strategy="epi-week", offset_earliest=0
+        )
+        times = xml.auto_rate_change_grid(
+            "samplingRateChangeTimes", 2, strategy="equal", offset_earliest=0
+        )
+        self.assertEqual([0.0, 0.5, 1.0], list(times))
+        state = xml._tree.find(
+            "./run/state/parameter[@id='samplingProportion.t:alignment']"
+        )
+        self.assertEqual("3", state.get("dimension"))
+        self.assertEqual("0.01 0.0 0.01", state.text)
+        prior = xml._tree.find(
+            "./run/distribution/distribution/"
+            "distribution[@id='samplingProportionPrior.t:alignment']"
+        )
+        self.assertEqual("true false true", prior.get("xInclude"))
+
+    def test_auto_rate_change_grid_after_fixing(self):
+        """
+        auto_rate_change_grid must not change the dimension of a sampling
+        proportion whose values were fixed by the user.
+        """
+        xml = self.skyline_xml()
+        xml.add_rate_change_times("samplingRateChangeTimes", [0.5])
+        xml.set_dimension_values_to_0("samplingProportion", indexes=[1])
+        assertRaisesRegex(
+            self,
+            AssertionError,
+            "^A sampling rate value has been fixed",
+            xml.auto_rate_change_grid,
+            "samplingRateChangeTimes",
+            2,
+        )
+
+    def test_auto_rate_change_grid_unknown_strategy(self):
+        """
+        Passing an unknown strategy to auto_rate_change_grid must raise a
+        ValueError.
+        """
+        xml = self.skyline_xml()
+        error = '^strategy must be either "quantile", "equal" or "epi-week".$'
+        assertRaisesRegex(
+            self,
+            ValueError,
+            error,
+            xml.auto_rate_change_grid,
+            "birthRateChangeTimes",
+            2,
+            strategy="monthly",
+        )
+
+
+class TestExtractAges(TestCase):
+    """
+    Test extracting ages from the dateTrait of an XML template.
+    """
+
+    def template(self, value):
+        xml = BEAST2XML()
+        xml._tree.find("./run/state/tree/trait").set("value", value)
+        return xml
+
+    def test_numeric_ages(self):
+        """
+        Numeric ages must be returned as float64 with their ids.
+        """
+        ids, ages = self.template("id1=2020.5,id2=2019.25").extract_ages()
+        self.assertEqual(["id1", "id2"], list(ids))
+        self.assertEqual(np.float64, ages.dtype)
+        self.assertEqual([2020.5, 2019.25], list(ages))
+
+    def test_date_ages(self):
+        """
+        Dates must be converted to year decimals.
+        """
+        xml = self.template("id1=2020-07-02, id2=2019-01-01")
+        ids, ages = xml.extract_ages()
+        self.assertEqual(["id1", "id2"], list(ids))
+        self.assertAlmostEqual(2020.5, ages[0], places=2)
+        self.assertEqual(2019.0, ages[1])
+        self.assertAlmostEqual(2020.5, xml.extract_youngest_year_decimal(), places=2)
+
+    def test_results_are_cached(self):
+        """
+        Extracting ages twice from an unchanged trait must return the same
+        (read-only) arrays.
+        """
+        xml = self.template("id1=1.0,id2=2.0")
+        ids, ages = xml.extract_ages()
+        self.assertIs(ages, xml.extract_ages()[1])
+        self.assertFalse(ages.flags.writeable)
+
+    def test_unparseable_ages(self):
+        """
+        Ages that are neither numbers nor dates must raise a ValueError.
+        """
+        xml = self.template("id1=abc")
+        error = "^Could not convert age/date information in xml into a date or float$"
+        assertRaisesRegex(self, ValueError, error, xml.extract_ages)
+
+
+class TestFromBeastXML(TestCase):
+    """
+    Test creating a BEAST2XML instance from an existing BEAST2 XML file.
+    """
+
+    def test_round_trip(self):
+        """
+        Loading generated XML must recover its sequences and ages and give
+        the same XML when rendered again.
+        """
+        xml = BEAST2XML()
+        xml.add_sequences([Read("id1", "ACGT"), Read("id2", "AC-T")])
+        xml.add_ages({"id1": 2020.5, "id2": 2021.25})
+        original = xml.to_string()
+
+        loaded = BEAST2XML.from_beast_xml(StringIO(original))
+        self.assertEqual(
+            [("id1", "ACGT"), ("id2", "AC-T")],
+            [(read.id, read.sequence) for read in loaded._sequences],
+        )
+        self.assertEqual({"id1": 2020.5, "id2": 2021.25}, loaded._age_by_short_id)
+        self.assertEqual(0, len(loaded._tree.find("data")))
+        self.assertEqual(original, loaded.to_string())
+
+    def test_sequence_text_values(self):
+        """
+        Sequences given as element text (rather than a value attribute) must
+        be loaded.
+        """
+        template = BEAST2XML().to_string().replace(
+            '<data id="alignment" name="alignment" />',
+            '<data id="alignment" name="alignment">'
+            '<sequence id="seq_id1" taxon="id1">\nAC\nGT\n</sequence></data>',
+        )
+        loaded = BEAST2XML.from_beast_xml(StringIO(template))
+        self.assertEqual(
+            [("id1", "ACGT")], [(read.id, read.sequence) for read in loaded._sequences]
+        )
+
+
+class TestSubsample(TestCase):
+    """
+    Test subsampling the added sequences.
+    """
+
+    def xml(self):
+        xml = BEAST2XML()
+        for index in range(12):
+            # Two per month from January to June 2020.
+            xml.add_sequence(
+                Read("id%d" % index, "ACGT"), 2020.0 + (index // 2) / 12 + 0.01
+            )
+        return xml
+
+    def test_unstratified(self):
+        """
+        An unstratified subsample must select n sequences, reproducibly for a
+        given seed.
+        """
+        masks = self.xml().subsample(5, replicates=3, seed=7)
+        self.assertEqual(3, len(masks))
+        self.assertEqual([5, 5, 5], [int(mask.sum()) for mask in masks])
+        again = self.xml().subsample(5, replicates=3, seed=7)
+        self.assertTrue(all((a == b).all() for a, b in zip(masks, again)))
+
+    def test_stratified_by_month_and_metadata(self):
+        """
+        A stratified subsample must take the same number of sequences from
+        each group.
+        """
+        metadata = pd.DataFrame(
+            {"strain": ["id%d" % index for index in range(12)], "region": ["a", "b"] * 6}
+        )
+        (mask,) = self.xml().subsample(
+            6, by=["month", "region"], seed=1, metadata=metadata
+        )
+        self.assertEqual(6, mask.sum())
+        # There are 12 groups of one sequence, so any 6 groups can be taken.
+        (mask,) = self.xml().subsample(6, by=["month"], seed=1)
+        self.assertEqual([1] * 6, [int(mask[i : i + 2].sum()) for i in range(0, 12, 2)])
+
+    def test_unknown_field(self):
+        """
+        Stratifying by a field that is not age-derived or in the metadata
+        must raise a ValueError.
+        """
+        error = "^Cannot stratify by 'region'"
+        assertRaisesRegex(
+            self, ValueError, error, self.xml().subsample, 3, by=["region"]
+        )
+
+    def test_render_with_mask(self):
+        """
+        Passing a mask to to_string must write only the selected sequences
+        and their ages.
+        """
+        xml = BEAST2XML()
+        xml.add_sequences([Read("id1", "AA"), Read("id2", "CC"), Read("id3", "GG")])
+        xml.add_ages({"id1": 1.0, "id2": 2.0, "id3": 3.0})
+        tree = ET.ElementTree(
+            ET.fromstring(xml.to_string(sequence_mask=np.array([True, False, True])))
+        )
+        elements = BEAST2XML.find_elements(tree)
+        self.assertEqual(["id1", "id3"], [child.get("taxon") for child in elements["data"]])
+        self.assertEqual(
+            "id1=1.0,id3=3.0", elements["./run/state/tree/trait"].get("value")
+        )
+
+
+class TestPlanLogging(TestCase):
+    """
+    Test choosing logging intervals and estimating log sizes.
+    """
+
+    def xml(self, taxa=100):
+        xml = BEAST2XML(clock_model="relaxed-lognormal")
+        xml.add_sequences([Read("id%d" % i, "ACGT") for i in range(taxa)])
+        return xml
+
+    def test_template_intervals(self):
+        """
+        Without a target, the template intervals and chain length must be used.
+        """
+        plan = self.xml().plan_logging()
+        self.assertEqual(100000, plan["chain_length"])
+        self.assertEqual(100, plan["taxa"])
+        self.assertEqual(2000, plan["trace_log_every"])
+        self.assertEqual(2000, plan["tree_log_every"])
+        self.assertEqual(51, plan["tree_samples"])
+
+    def test_target_samples(self):
+        """
+        All intervals must be chosen from the target number of samples, rounded
+        up to two significant figures.
+        """
+        plan = self.xml().plan_logging(chain_length=10000000, target_samples=3000)
+        self.assertEqual(3400, plan["trace_log_every"])
+        self.assertEqual(3400, plan["tree_log_every"])
+        self.assertEqual(3400, plan["screen_log_every"])
+        self.assertEqual(3400, plan["store_state_every"])
+
+    def test_max_tree_log_bytes(self):
+        """
+        The tree log interval must be increased so the estimated tree log size
+        is within the limit, without changing the trace log interval.
+        """
+        xml = self.xml(5000)
+        unlimited = xml.plan_logging(chain_length=10000000, target_samples=10000)
+        plan = xml.plan_logging(
+            chain_length=10000000, target_samples=10000, max_tree_log_bytes=10**8
+        )
+        self.assertGreater(unlimited["tree_log_bytes"], 10**8)
+        self.assertLessEqual(plan["tree_log_bytes"], 10**8)
+        self.assertGreater(plan["tree_log_every"], plan["trace_log_every"])
+        self.assertEqual(1000, plan["trace_log_every"])
+
+    def test_explicit_intervals(self):
+        """
+        Intervals given explicitly must override those planned, and the
+        estimates must be made with them.
+        """
+        xml = self.xml(5000)
+        plan = xml.plan_logging(
+            chain_length=10000000,
+            target_samples=10000,
+            max_tree_log_bytes=10**8,
+            tree_log_every=1000,
+            store_state_every=50,
+        )
+        unlimited = xml.plan_logging(chain_length=10000000, target_samples=10000)
+        self.assertEqual(1000, plan["tree_log_every"])
+        self.assertEqual(50, plan["store_state_every"])
+        self.assertEqual(unlimited["tree_samples"], plan["tree_samples"])
+        self.assertEqual(unlimited["tree_log_bytes"], plan["tree_log_bytes"])
+
+    def test_tree_log_grows_with_taxa(self):
+        """
+        The estimated size of the tree log must grow with the number of taxa.
+        """
+        self.assertGreater(
+            self.xml(1000).plan_logging()["tree_log_bytes"],
+            5 * self.xml(100).plan_logging()["tree_log_bytes"],
+        )
+
+    def test_too_small_tree_log(self):
+        """
+        A tree log limit too small for one tree must raise a ValueError.
+        """
+        error = "^max_tree_log_bytes is too small to log one tree of 100 taxa"
+        assertRaisesRegex(
+            self, ValueError, error, self.xml().plan_logging, max_tree_log_bytes=100
+        )
+
+    def test_render(self):
+        """
+        Passing target_samples to to_string must set the intervals not given
+        explicitly.
+        """
+        tree = ET.ElementTree(
+            ET.fromstring(
+                self.xml().to_string(
+                    chain_length=1000000, target_samples=100, screen_log_every=7
+                )
+            )
+        )
+        elements = BEAST2XML.find_elements(tree)
+        self.assertEqual(
+            "10000", elements["./run/logger[@id='tracelog']"].get("logEvery")
+        )
+        self.assertEqual(
+            "10000", elements["./run/logger[@id='treelog.t:alignment']"].get("logEvery")
+        )
+        self.assertEqual("7", elements["./run/logger[@id='screenlog']"].get("logEvery"))
+        self.assertEqual("10000", elements["run"].get("storeEvery"))
+
+
+class TestTaxonOrder(TestCase):
+    """
+    Test the order sequences and ages are written in.
+    """
+
+    def xml(self):
+        xml = BEAST2XML()
+        xml.add_sequences(
+            [Read("id3", "AA"), Read("id1 a", "CC"), Read("id2", "GG")]
+        )
+        xml.add_ages({"id1": 1.0, "id2": 2.0, "id3": 3.0})
+        return xml
+
+    def order(self, xml, **kwargs):
+        tree = ET.ElementTree(ET.fromstring(xml.to_string(**kwargs)))
+        elements = BEAST2XML.find_elements(tree)
+        taxa = [sequence.get("taxon") for sequence in elements["data"]]
+        trait = elements["./run/state/tree/trait"].get("value")
+        return taxa, [pair.split("=")[0] for pair in trait.split(",")]
+
+    def test_sorted(self):
+        """
+        By default, sequences and ages must both be written in short id order.
+        """
+        self.assertEqual(
+            (["id1", "id2", "id3"], ["id1", "id2", "id3"]), self.order(self.xml())
+        )
+
+    def test_insertion(self):
+        """
+        Sequences and ages must both be written in the order sequences were
+        added if taxon_order is "insertion".
+        """
+        self.assertEqual(
+            (["id3", "id1", "id2"], ["id3", "id1", "id2"]),
+            self.order(self.xml(), taxon_order="insertion"),
+        )
+
+    def test_added_after_render(self):
+        """
+        Sequences added after a render must be merged into the sorted order.
+        """
+        xml = self.xml()
+        xml.to_string()
+        xml.add_sequences([Read("id0", "TT"), Read("id22", "TT")])
+        self.assertEqual(
+            ["id0", "id1", "id2", "id22", "id3"], self.order(xml)[0]
+        )
+
+    def test_mask(self):
+        """
+        Masked sequences must be written in sorted order, whatever the order of
+        the mask indexes.
+        """
+        self.assertEqual(
+            ["id2", "id3"], self.order(self.xml(), sequence_mask=[2, 0])[0]
+        )
+        self.assertEqual(
+            ["id2", "id3"],
+            self.order(self.xml(), sequence_mask=[2, 0], taxon_order="insertion")[0],
+        )
+
+    def test_invalid_order(self):
+        """
+        An unknown taxon order must raise a ValueError.
+        """
+        error = '^taxon_order must be either "sorted" or "insertion".$'
+        assertRaisesRegex(
+            self, ValueError, error, self.xml().to_string, taxon_order="random"
+        )
+
+
+class TestUpdateXML(TestCase):
+    """
+    Test adding sequences and ages to existing XML.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "run.xml")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, sequences, ages, **kwargs):
+        xml = BEAST2XML()
+        xml.add_sequences(sequences)
+        xml.add_ages(ages)
+        xml.to_xml(self.path, **kwargs)
+
+    def test_same_as_rendering(self):
+        """
+        Updating must give the same XML as rendering all the sequences at once,
+        whatever the chunk size.
+        """
+        old = [Read("id2", "ACGT"), Read("id4", "ACGA")]
+        new = [Read("id5", "GGGG"), Read("id1", "AAAA"), Read("id3", "CCCC")]
+        ages = {"id1": 1.0, "id2": 2.0, "id3": 3.0, "id4": 4.0, "id5": 5.0}
+        xml = BEAST2XML()
+        xml.add_sequences(old + new)
+        xml.add_ages(ages)
+        expected = xml.to_string()
+        for chunk_size in (13, 1 << 20):
+            self.write(old, {"id2": 2.0, "id4": 4.0})
+            count = BEAST2XML.update_xml(
+                self.path,
+                new,
+                {"id1": 1.0, "id3": 3.0, "id5": 5.0},
+                chunk_size=chunk_size,
+            )
+            self.assertEqual(3, count)
+            with open(self.path) as fp:
+                self.assertEqual(expected, fp.read())
+
+    def test_output_path(self):
+        """
+        If an output path is given, the existing file must be left as it was.
+        """
+        self.write([Read("id1", "AC")], {"id1": 1.0})
+        with open(self.path) as fp:
+            original = fp.read()
+        output = os.path.join(self.directory, "updated.xml")
+        BEAST2XML.update_xml(
+            self.path, [Read("id2", "GT")], {"id2": 2.0}, output_path=output
+        )
+        with open(self.path) as fp:
+            self.assertEqual(original, fp.read())
+        loaded = BEAST2XML.from_beast_xml(output)
+        self.assertEqual({"id1": 1.0, "id2": 2.0}, loaded._age_by_short_id)
+
+    def test_trait_text(self):
+        """
+        Ages given as the text of the trait element must be extended.
+        """
+        self.write([Read("id1", "AC")], {"id1": 1.0}, date_direction="forward")
+        BEAST2XML.update_xml(self.path, [Read("id0", "GT")], {"id0": 0.5})
+        trait = ET.parse(self.path).find("./run/state/tree/trait")
+        self.assertEqual("id0=0.5,\nid1=1.0\n", trait.text)
+
+    def test_existing_sequence(self):
+        """
+        Adding a sequence that is already in the XML must raise a ValueError
+        and leave the file unchanged.
+        """
+        self.write([Read("id1", "AC")], {"id1": 1.0})
+        with open(self.path) as fp:
+            original = fp.read()
+        error = "^The XML already has an age for: id1\\.$"
+        assertRaisesRegex(
+            self,
+            ValueError,
+            error,
+            BEAST2XML.update_xml,
+            self.path,
+            [Read("id1", "GT")],
+            {"id1": 2.0},
+        )
+        with open(self.path) as fp:
+            self.assertEqual(original, fp.read())
+        self.assertEqual([], os.listdir(self.directory)[1:])
+
+    def test_missing_age(self):
+        """
+        A new sequence without an age must cause a ValueError.
+        """
+        self.write([Read("id1", "AC")], {"id1": 1.0})
+        error = "^No age was given for sequence 'id2'\\.$"
+        assertRaisesRegex(
+            self,
+            ValueError,
+            error,
+            BEAST2XML.update_xml,
+            self.path,
+            [Read("id2", "GT")],
+            {},
+        )
+
+    def test_wrong_length(self):
+        """
+        A new sequence of a different length to the alignment must cause a
+        ValueError.
+        """
+        self.write([Read("id1", "AC")], {"id1": 1.0})
+        error = "^Sequence 'id2' has length 3 but the alignment has length 2\\.$"
+        assertRaisesRegex(
+            self,
+            ValueError,
+            error,
+            BEAST2XML.update_xml,
+            self.path,
+            [Read("id2", "GTA")],
+            {"id2": 2.0},
+        )
+
+    def test_graft_onto_initial_tree(self):
+        """
+        New taxa must be grafted onto a Newick initial tree.
+        """
+        newick = os.path.join(self.directory, "tree.nwk")
+        with open(newick, "w") as fp:
+            fp.write("(id1:1.0,id2:1.0);")
+        xml = BEAST2XML()
+        xml.add_sequences([Read("id1", "AC"), Read("id2", "AC")])
+        xml.add_ages({"id1": 2000.0, "id2": 2000.0})
+        xml.add_initial_tree(newick)
+        xml.to_xml(self.path, date_direction="forward")
+        BEAST2XML.update_xml(self.path, [Read("id3", "GT")], {"id3": 2000.5})
+        init = ET.parse(self.path).find("./run/init")
+        self.assertEqual("true", init.get("adjustTipHeights"))
+        tree = ete3.Tree(init.get("newick"))
+        self.assertEqual(["id1", "id2", "id3"], sorted(tree.get_leaf_names()))
+        # id3 is half a year younger than id1.
+        self.assertAlmostEqual(
+            0.5, tree.get_distance("id3") - tree.get_distance("id1")
+        )
+
+    def test_previous_tree_log(self):
+        """
+        The last tree of a previous run's tree log must be carried over as the
+        initial tree, with the new taxa grafted on.
+        """
+        trees = os.path.join(self.directory, "run.trees")
+        with open(trees, "w") as fp:
+            fp.write(
+                "#NEXUS\n\nBegin trees;\n\tTranslate\n\t\t1 id1,\n\t\t2 id2\n;\n"
+                "tree STATE_0 = (1:1.0,2:1.0):0.0;\n"
+                "tree STATE_10 = (1[&rate=1.0]:2.0,2[&rate=1.0]:2.0):0.0;\n"
+                "End;\n"
+            )
+        self.write(
+            [Read("id1", "AC"), Read("id2", "AC")],
+            {"id1": 2000.0, "id2": 2000.0},
+            date_direction="forward",
+        )
+        BEAST2XML.update_xml(
+            self.path, [Read("id3", "GT")], {"id3": 2001.0}, previous_tree_log=trees
+        )
+        init = ET.parse(self.path).find("./run/init")
+        self.assertEqual("beast.util.TreeParser", init.get("spec"))
+        self.assertEqual(0, len(init))
+        tree = ete3.Tree(init.get("newick"))
+        self.assertAlmostEqual(2.0, tree.get_distance("id1", "id2") / 2)
+        self.assertAlmostEqual(
+            1.0, tree.get_distance("id3") - tree.get_distance("id1")
+        )
+
+
+class TestAsync(IsolatedAsyncioTestCase):
+    """
+    Test the asyncio variants of adding sequences and rendering.
+    """
+
+    def xml(self):
+        xml = BEAST2XML()
+        xml.add_ages({"id1": 1.0, "id2": 2.0})
+        return xml
+
+    async def test_add_sequences_from_file(self):
+        """
+        Sequences must be added from a FASTA file.
+        """
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "seqs.fasta")
+            with open(path, "w") as fp:
+                fp.write(">id1\nACGT\n>id2\nACGA\n")
+            xml = self.xml()
+            await xml.add_sequences_async(path)
+            self.assertEqual(["id1", "id2"], [read.id for read in xml._sequences])
+        finally:
+            shutil.rmtree(directory)
+
+    async def test_to_string(self):
+        """
+        to_string_async must give the same XML as to_string.
+        """
+        xml = self.xml()
+        await xml.add_sequences_async([Read("id1", "ACGT"), Read("id2", "ACGA")])
+        expected = xml.to_string(chain_length=10)
+        self.assertEqual(expected, await xml.to_string_async(chain_length=10))
+
+    async def test_chunks(self):
+        """
+        The chunks must make up the same XML as to_string, and be about the
+        requested size.
+        """
+        xml = self.xml()
+        xml.add_sequences([Read("id1", "ACGT" * 100), Read("id2", "ACGA" * 100)])
+        expected = xml.to_string(chain_length=10)
+        chunks = [
+            chunk
+            async for chunk in xml.iter_chunks_async(chunk_size=1000, chain_length=10)
+        ]
+        self.assertGreater(len(chunks), 2)
+        self.assertTrue(all(len(chunk) < 2000 for chunk in chunks))
+        self.assertEqual(expected, b"".join(chunks).decode("utf-8"))
+
+    async def test_chunks_error(self):
+        """
+        An error while rendering must be raised by the chunk iterator.
+        """
+        xml = self.xml()
+        with self.assertRaisesRegex(TypeError, "^The default age must be"):
+            async for _ in xml.iter_chunks_async(default_age="old"):
+                pass
+
+    async def test_chunks_abandoned(self):
+        """
+        Stopping reading chunks early must stop the rendering, with no chunks
+        left waiting.
+        """
+        made = []
+
+        class CountingWriter(_ChunkWriter):
+            def __init__(self, put, chunk_size):
+                def counting_put(chunk):
+                    made.append(chunk)
+                    put(chunk)
+
+                _ChunkWriter.__init__(self, counting_put, chunk_size)
+
+        xml = self.xml()
+        xml.add_sequences([Read("id%d" % index, "ACGT" * 100) for index in range(200)])
+        with patch("beast2xml.beast2._ChunkWriter", CountingWriter):
+            chunks = xml.iter_chunks_async(chunk_size=100, max_pending=2)
+            self.assertTrue((await chunks.__anext__()).startswith(b"<?xml"))
+            await chunks.aclose()
+            # aclose waits for the rendering, which must have stopped without
+            # being serialised in full.
+            self.assertNotIn(
+                "serialise", [record["stage"] for record in xml.metrics.stages]
+            )
+            abandoned = len(made)
+            del made[:]
+            full = [chunk async for chunk in xml.iter_chunks_async(chunk_size=100)]
+        self.assertEqual(len(full), len(made))
+        # The chunk read, the two queued, one waiting for room in the queue
+        # and one made before the cancellation was seen.
+        self.assertLessEqual(abandoned, 5)
+        self.assertGreater(len(full), 100)
+
+
+class TestSkeleton(TestCase):
+    """
+    Test the template skeleton.
+    """
+
+    def test_made_once(self):
+        """
+        The skeleton must be made once and reused by later renders.
+        """
+        xml = BEAST2XML()
+        xml.add_sequences([Read("id1", "ACGT")])
+        skeleton = xml.skeleton
+        xml.to_string(chain_length=10, tree_log_every=5)
+        xml.to_string(chain_length=20)
+        self.assertIs(skeleton, xml.skeleton)
+        self.assertEqual("20", skeleton.run.get("chainLength"))
+        self.assertEqual("5", skeleton.tree_logger.get("logEvery"))
+        self.assertEqual("treelog.t:alignment", skeleton.tree_logger.get("id"))
+
+    def test_find_elements(self):
+        """
+        find_elements must return the elements of the skeleton.
+        """
+        xml = BEAST2XML()
+        elements = BEAST2XML.find_elements(xml._tree)
+        self.assertIs(xml.skeleton.data, elements["data"])
+        self.assertIs(xml.skeleton.trait, elements["./run/state/tree/trait"])
+
+    def test_parameter_and_prior(self):
+        """
+        Changing a parameter and its prior must edit the elements under the
+        state and prior of the skeleton.
+        """
+        xml = BEAST2XML()
+        xml.change_parameter_state_node("clockRate", value=0.002, upper=0.01)
+        xml.change_prior("ClockPrior", "normal", mean=1.0, sigma=0.5)
+        state = xml.skeleton.state.find("parameter[@id='clockRate.c:alignment']")
+        prior = xml.skeleton.prior.find("prior[@id='ClockPrior.c:alignment']")
+        self.assertEqual("0.002", state.text)
+        self.assertEqual("0.01", state.get("upper"))
+        self.assertEqual("ClockPrior_Normal", prior[0].get("id"))
+
+    def test_prior_with_other_id(self):
+        """
+        Priors must be found in a template whose compound distribution of
+        priors does not have the id "prior".
+        """
+        template = BEAST2XML().to_string().replace('id="prior"', 'id="priors"', 1)
+        xml = BEAST2XML(template=StringIO(template))
+        self.assertIsNone(xml.skeleton.prior)
+        xml.change_prior("ClockPrior", "normal", mean=1.0, sigma=0.5)
+        prior = xml._tree.find(
+            "./run/distribution/distribution[@id='priors']"
+            "/prior[@id='ClockPrior.c:alignment']"
+        )
+        self.assertEqual("ClockPrior_Normal", prior[0].get("id"))
+
+    def test_no_skyline(self):
+        """
+        A template without a skyline model must have no skyline in its
+        skeleton, and editing change times must raise a ValueError.
+        """
+        xml = BEAST2XML()
+        self.assertIsNone(xml.skeleton.skyline)
+        error = "^No distribution of spec BirthDeathSkylineModel was found."
+        assertRaisesRegex(
+            self,
+            ValueError,
+            error,
+            xml.add_rate_change_times,
+            "birthRateChangeTimes",
+            [0.5],
+        )
+
+
+class TestWarmStart(TestCase):
+    """
+    Test starting a run from the final state of a previous run.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.basename = os.path.join(self.directory, "previous")
+        with open(self.basename + ".trees", "w") as fp:
+            fp.write(
+                "#NEXUS\n\nBegin trees;\n\tTranslate\n\t\t1 id1,\n\t\t2 id2,\n"
+                "\t\t3 id3\n;\n"
+                "tree STATE_0 = ((1:1.0,2:1.0):1.0,3:2.0):0.0;\n"
+                "tree STATE_10 = ((1[&rate=1.0]:1.5,3:1.5):0.5,2:2.0):0.0;\n"
+                "End;\n"
+            )
+        with open(self.basename + ".log", "w") as fp:
+            fp.write(
+                "Sample\tposterior\tclockRate.c:alignment\t"
+                "proportionInvariant.s:alignment\tgammaShape.s:alignment\t"
+                + "\t".join(
+                    "freqParameter.s:alignment.%d" % index for index in range(1, 5)
+                )
+                + "\n0\t-10.0\t1.0E-4\t0.5\t1.0\t0.25\t0.25\t0.25\t0.25\n"
+                "10\t-9.0\t5.0E-4\t1.5\t0.75\t0.1\t0.2\t0.3\t0.4\n"
+            )
+        self.xml = BEAST2XML()
+        self.xml.add_sequences([Read("id1", "AC"), Read("id2", "AC"), Read("id4", "GT")])
+        self.xml.add_ages({"id1": 2000.0, "id2": 2000.0, "id4": 2001.0})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_tree(self):
+        """
+        Removed taxa must be pruned from the last tree of the tree log and new
+        taxa grafted on, giving the initial tree.
+        """
+        result = self.xml.warm_start_from(self.basename, date_direction="forward")
+        self.assertEqual(["id3"], result["pruned"])
+        self.assertEqual(["id4"], result["new"])
+        self.assertTrue(result["grafted"])
+        xml = ET.fromstring(self.xml.to_string(date_direction="forward"))
+        init = xml.find("./run/init")
+        self.assertEqual("beast.util.TreeParser", init.get("spec"))
+        self.assertEqual("true", init.get("adjustTipHeights"))
+        tree = ete3.Tree(init.get("newick"))
+        self.assertEqual(["id1", "id2", "id4"], sorted(tree.get_leaf_names()))
+        self.assertAlmostEqual(4.0, tree.get_distance("id1", "id2"))
+        # id4 is a year younger than id1.
+        self.assertAlmostEqual(
+            1.0, tree.get_distance("id4") - tree.get_distance("id1")
+        )
+
+    def test_parameters(self):
+        """
+        The last values of state parameters in the trace log must become their
+        starting values, unless they are out of bounds.
+        """
+        result = self.xml.warm_start_from(self.basename)
+        self.assertEqual(
+            {
+                "clockRate.c:alignment": "0.0005",
+                "gammaShape.s:alignment": "0.75",
+                "freqParameter.s:alignment": "0.1 0.2 0.3 0.4",
+            },
+            result["parameters"],
+        )
+        state = ET.fromstring(self.xml.to_string()).find("./run/state")
+        values = {node.get("id"): node.text for node in state.findall("parameter")}
+        self.assertEqual("0.0005", values["clockRate.c:alignment"])
+        self.assertEqual("0.1 0.2 0.3 0.4", values["freqParameter.s:alignment"])
+        self.assertEqual("0.3", values["proportionInvariant.s:alignment"])
+
+    def test_no_parameters(self):
+        """
+        Parameters must be left alone when parameters is False.
+        """
+        result = self.xml.warm_start_from(self.basename, parameters=False)
+        self.assertEqual({}, result["parameters"])
+
+    def test_no_graft(self):
+        """
+        When grafting is turned off, new taxa must be warned about and left
+        out of the tree.
+        """
+        with self.assertWarns(UserWarning):
+            result = self.xml.warm_start_from(self.basename, graft=False)
+        self.assertFalse(result["grafted"])
+        tree = self.xml._initial_phylo_tree
+        self.assertEqual(["id1", "id2"], sorted(tree.get_leaf_names()))
+
+    def test_too_few_taxa(self):
+        """
+        A tree log with fewer than two of the added taxa must cause a
+        ValueError.
+        """
+        xml = BEAST2XML()
+        xml.add_sequences([Read("id1", "AC"), Read("id5", "AC")])
+        error = "^Fewer than two of the taxa in the tree log of .* are among "
+        assertRaisesRegex(self, ValueError, error, xml.warm_start_from, self.basename)
@@ -0,0 +1,186 @@
+import os
+import time
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from dark.reads import Read
+
+from beast2xml import BEAST2XML
+from beast2xml.cache import RenderCache
+
+
+class TestRenderCache(TestCase):
+    """
+    Test the on-disk render cache.
+    """
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.cache = RenderCache(os.path.join(self.dir, "cache"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, content):
+        path = os.path.join(self.dir, name)
+        with open(path, "w") as fp:
+            fp.write(content)
+        return path
+
+    def test_key(self):
+        """
+        Keys must depend on every part, and not on the order of dict items.
+        """
+        self.assertEqual(
+            RenderCache.key({"a": 1, "b": 2}), RenderCache.key({"b": 2, "a": 1})
+        )
+        self.assertNotEqual(RenderCache.key("x", 1), RenderCache.key("x", 2))
+
+    def test_fetch_and_store(self):
+        """
+        A stored file must be fetched for its key, and nothing for other keys.
+        """
+        path = self.write("a.xml", "<beast />")
+        self.cache.store("key1", path)
+        output = os.path.join(self.dir, "b.xml")
+        self.assertFalse(self.cache.fetch("key2", output))
+        self.assertFalse(os.path.exists(output))
+        self.assertTrue(self.cache.fetch("key1", output))
+        with open(output) as fp:
+            self.assertEqual("<beast />", fp.read())
+
+    def test_file_digest_remembered(self):
+        """
+        The digest of an unchanged file must be remembered (also by a new
+        cache instance), and a changed file must be hashed again.
+        """
+        path = self.write("seqs.fasta", ">id1\nACGT\n")
+        digest = self.cache.file_digest(path)
+        cache = RenderCache(self.cache.directory)
+        self.assertEqual(digest, cache.file_digest(path))
+        self.assertEqual(1, len(cache._load_digests()))
+        self.write("seqs.fasta", ">id1\nACGA\n")
+        os.utime(path, ns=(0, 10**9))
+        self.assertNotEqual(digest, cache.file_digest(path))
+
+    def test_evict_entries(self):
+        """
+        The least recently used files must be removed when there are too many.
+        """
+        cache = RenderCache(self.cache.directory, max_entries=2)
+        for count, key in enumerate(("k1", "k2")):
+            cache.store(key, self.write(key, "<beast />"))
+            os.utime(cache._path(key), (count, count))
+        cache.fetch("k1", os.path.join(self.dir, "out.xml"))
+        cache.store("k3", self.write("k3", "<beast />"))
+        self.assertEqual(["k1", "k3"], sorted(entry[0] for entry in cache.entries()))
+
+    def test_evict_bytes(self):
+        """
+        The least recently used files must be removed when the cache is too
+        large.
+        """
+        cache = RenderCache(self.cache.directory, max_bytes="25")
+        for count, key in enumerate(("k1", "k2", "k3")):
+            cache.store(key, self.write(key, "x" * 10))
+            os.utime(cache._path(key), (time.time() + count,) * 2)
+        cache.evict()
+        self.assertEqual(["k2", "k3"], [entry[0] for entry in cache.entries()])
+
+
+class TestToXMLCache(TestCase):
+    """
+    Test using a render cache with BEAST2XML.to_xml.
+    """
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.cache = RenderCache(os.path.join(self.dir, "cache"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def xml(self, sequence="ACGT"):
+        xml = BEAST2XML()
+        xml.add_sequences([Read("id1", sequence), Read("id2", "ACGA")])
+        xml.add_ages({"id1": 1.0, "id2": 2.0})
+        return xml
+
+    def test_hit(self):
+        """
+        Rendering the same inputs again must take the XML from the cache.
+        """
+        first = os.path.join(self.dir, "first.xml")
+        second = os.path.join(self.dir, "second.xml")
+        self.xml().to_xml(first, chain_length=10, cache=self.cache)
+        xml = self.xml()
+        xml.to_xml(second, chain_length=10, cache=self.cache)
+        self.assertEqual(
+            ["cache_hit"],
+            [
+                record["stage"]
+                for record in xml.metrics.stages
+                if record["stage"].startswith("cache")
+            ],
+        )
+        with open(first) as fp1, open(second) as fp2:
+            self.assertEqual(fp1.read(), fp2.read())
+
+    def test_key_changes(self):
+        """
+        The render key must change with the sequences, ages, template and
+        arguments.
+        """
+        key = self.xml().render_key(chain_length=10)
+        self.assertEqual(key, self.xml().render_key(chain_length=10))
+        self.assertNotEqual(key, self.xml().render_key(chain_length=20))
+        self.assertNotEqual(key, self.xml("ACGG").render_key(chain_length=10))
+        xml = self.xml()
+        xml.add_age("id2", 3.0)
+        self.assertNotEqual(key, xml.render_key(chain_length=10))
+        xml = self.xml()
+        xml.change_prior("ClockPrior", "normal", mean=1.0, sigma=0.5)
+        self.assertNotEqual(key, xml.render_key(chain_length=10))
+
+    def test_overwrite_fetched_output(self):
+        """
+        Rendering different XML to a path that holds a fetched file must not
+        change the cached file.
+        """
+        path = os.path.join(self.dir, "out.xml")
+        self.xml().to_xml(path, cache=self.cache)
+        self.xml().to_xml(path, cache=self.cache)
+        with open(path) as fp:
+            cached = fp.read()
+        self.xml("ACGG").to_xml(path, cache=self.cache)
+        (entry, *_), *_ = self.cache.entries()
+        with open(self.cache._path(entry)) as fp:
+            self.assertEqual(cached, fp.read())
+
+    def test_uncached_write_to_cached_output(self):
+        """
+        Rendering without the cache (or with a transform function, which turns
+        the cache off) to a path holding a cached file must not change the
+        cached file.
+        """
+        path = os.path.join(self.dir, "out.xml")
+        self.xml().to_xml(path, cache=self.cache)
+        with open(path) as fp:
+            cached = fp.read()
+
+        def transform(tree):
+            tree.getroot().set("transformed", "yes")
+            return tree
+
+        self.xml().to_xml(path, transform_func=transform, cache=self.cache)
+        self.xml("ACGG").to_xml(path)
+        (entry, *_), *_ = self.cache.entries()
+        with open(self.cache._path(entry)) as fp:
+            self.assertEqual(cached, fp.read())
+        # A later hit must still give the XML that was cached.
+        xml = self.xml()
+        xml.to_xml(path, cache=self.cache)
+        with open(path) as fp:
+            self.assertEqual(cached, fp.read())
@@ -0,0 +1,127 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from six import assertRaisesRegex
+
+from beast2xml.combine import combine_logs
+
+TREES_HEADER = """#NEXUS
+
+Begin taxa;
+	Dimensions ntax=2;
+		Taxlabels
+			A
+			B
+			;
+End;
+Begin trees;
+	Translate
+		   1 A,
+		   2 B
+;
+"""
+
+
+class TestCombineLogs(TestCase):
+    """
+    Test combining the logs of replicate runs.
+    """
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.dir = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_run(self, name, states, columns="Sample\tposterior\n", trees=True):
+        basename = os.path.join(self.dir, name)
+        with open(basename + ".log", "w") as fp:
+            fp.write("# BEAST v2.7.5\n" + columns)
+            for state in states:
+                fp.write("%d\t-%d.5\n" % (state, state))
+        if trees:
+            with open(basename + ".trees", "w") as fp:
+                fp.write(TREES_HEADER)
+                for state in states:
+                    fp.write("tree STATE_%d = (1:%d,2:1.0):0.0;\n" % (state, state))
+                fp.write("End;\n")
+        return basename
+
+    def read(self, path):
+        with open(path) as fp:
+            return fp.read()
+
+    def test_combine(self):
+        """
+        The samples after each run's burn-in must be combined, with their
+        states renumbered.
+        """
+        run1 = self.write_run("run1", range(0, 1000, 100))
+        run2 = self.write_run("run2", range(0, 500, 100))
+        output = os.path.join(self.dir, "combined")
+        results = combine_logs([run1, run2], output, burnin=[0.5, 200], workers=1)
+        self.assertEqual({output + ".log": [5, 3], output + ".trees": [5, 3]}, results)
+        kept = (500, 600, 700, 800, 900, 200, 300, 400)
+        self.assertEqual(
+            "# BEAST v2.7.5\nSample\tposterior\n"
+            + "".join(
+                "%d\t-%d.5\n" % (100 * index, state) for index, state in enumerate(kept)
+            ),
+            self.read(output + ".log"),
+        )
+        trees = self.read(output + ".trees")
+        self.assertTrue(trees.startswith(TREES_HEADER + "tree STATE_0 = (1:500,"))
+        self.assertTrue(trees.endswith("tree STATE_700 = (1:400,2:1.0):0.0;\nEnd;\n"))
+        # The part files are removed.
+        self.assertEqual(6, len(os.listdir(self.dir)))
+
+    def test_resample(self):
+        """
+        Only samples whose state is a multiple of resample must be kept, and
+        renumbered that far apart.
+        """
+        run1 = self.write_run("run1", range(0, 1000, 100), trees=False)
+        run2 = self.write_run("run2", range(0, 1000, 100), trees=False)
+        output = os.path.join(self.dir, "combined")
+        combine_logs([run1, run2], output, burnin=0.0, resample=300)
+        states = [
+            line.split("\t")[0]
+            for line in self.read(output + ".log").splitlines()[2:]
+        ]
+        self.assertEqual([str(300 * i) for i in range(8)], states)
+        self.assertFalse(os.path.exists(output + ".trees"))
+
+    def test_different_columns(self):
+        """
+        Runs whose trace logs have different columns must cause a ValueError.
+        """
+        run1 = self.write_run("run1", range(0, 300, 100))
+        run2 = self.write_run("run2", range(0, 300, 100), columns="Sample\tprior\n")
+        error = "^The logs .* and .* do not have the same columns\\.$"
+        assertRaisesRegex(
+            self,
+            ValueError,
+            error,
+            combine_logs,
+            [run1, run2],
+            os.path.join(self.dir, "combined"),
+            workers=1,
+        )
+
+    def test_missing_log(self):
+        """
+        A run missing a log the other runs have must cause a ValueError.
+        """
+        run1 = self.write_run("run1", range(0, 300, 100))
+        run2 = self.write_run("run2", range(0, 300, 100), trees=False)
+        error = "^Missing log\\(s\\): .*run2\\.trees\\.$"
+        assertRaisesRegex(
+            self,
+            ValueError,
+            error,
+            combine_logs,
+            [run1, run2],
+            os.path.join(self.dir, "combined"),
+        )
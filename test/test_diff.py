@@ -0,0 +1,118 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from dark.reads import Read
+
+from beast2xml import BEAST2XML
+from beast2xml.diff import XMLSummary, diff
+
+
+class TestDiff(TestCase):
+    """
+    Test comparing two BEAST2 XML files.
+    """
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, sequences, ages, **kwargs):
+        xml = BEAST2XML(clock_model=kwargs.pop("clock_model", "strict"))
+        xml.add_sequences(Read(id_, sequence) for id_, sequence in sequences)
+        xml.add_ages(ages)
+        path = os.path.join(self.tmp.name, name)
+        xml.to_xml(path, **kwargs)
+        return path
+
+    def test_no_differences(self):
+        """
+        Comparing a file with itself must find no differences.
+        """
+        path = self.write("a.xml", [("id1", "ACGT")], {"id1": 1.0})
+        differences = diff(path, path)
+        self.assertFalse(differences)
+        self.assertEqual("No differences.", differences.report())
+
+    def test_taxa(self):
+        """
+        Added, removed and changed sequences and changed ages must be found.
+        """
+        path1 = self.write(
+            "a.xml",
+            [("id1", "ACGT"), ("id2", "ACGA"), ("id3", "AAAA")],
+            {"id1": 1.0, "id2": 2.0, "id3": 3.0},
+        )
+        path2 = self.write(
+            "b.xml",
+            [("id1", "ACGT"), ("id2", "ACGG"), ("id4", "AAAA")],
+            {"id1": 1.5, "id2": 2.0, "id4": 3.0},
+        )
+        differences = diff(path1, path2)
+        self.assertEqual(["id4"], differences.taxa_added)
+        self.assertEqual(["id3"], differences.taxa_removed)
+        self.assertEqual(["id2"], differences.sequences_changed)
+        self.assertEqual(
+            [("dateTrait.t:alignment", "id1", 1.0, 1.5)], differences.ages_changed
+        )
+        self.assertEqual([], differences.elements_added)
+        self.assertEqual({}, differences.elements_changed)
+
+    def test_elements(self):
+        """
+        Added, removed and changed model elements must be found.
+        """
+        sequences = [("id1", "ACGT")]
+        path1 = self.write("a.xml", sequences, {"id1": 1.0}, chain_length=10)
+        path2 = self.write(
+            "b.xml",
+            sequences,
+            {"id1": 1.0},
+            chain_length=20,
+            clock_model="relaxed-lognormal",
+        )
+        differences = diff(path1, path2)
+        self.assertEqual(
+            {"chainLength": ("10", "20")}, differences.elements_changed["mcmc"]
+        )
+        self.assertIn("ucldMean.c:alignment", differences.elements_added)
+        self.assertIn("StrictClock.c:alignment", differences.elements_removed)
+        self.assertIn(
+            "tracelog/log[idref=clockRate.c:alignment]", differences.elements_removed
+        )
+        self.assertIn("mcmc: chainLength", differences.report().replace(":\n    ", ": "))
+
+    def test_sequences_hashed(self):
+        """
+        A summary must keep a digest of each sequence, not the sequence.
+        """
+        path = self.write("a.xml", [("id1", "ACGT" * 1000)], {"id1": 1.0})
+        digest, attributes = XMLSummary(path).sequences["id1"]
+        self.assertEqual(64, len(digest))
+        self.assertEqual({"spec": "Sequence", "totalcount": "4"}, attributes)
+
+    def test_sequence_text(self):
+        """
+        Sequences given as element text must be compared by their text.
+        """
+        paths = []
+        for name, sequence in ("a.xml", "ACGT"), ("b.xml", "ACGA"), ("c.xml", "ACGA"):
+            path = os.path.join(self.tmp.name, name)
+            with open(path, "w") as fp:
+                fp.write(
+                    '<beast><data id="alignment">'
+                    '<sequence taxon="id1">\n  %s\n</sequence>'
+                    '<sequence taxon="id2">ACGT</sequence>'
+                    "</data></beast>" % sequence
+                )
+            paths.append(path)
+        self.assertEqual(["id1"], diff(paths[0], paths[1]).sequences_changed)
+        self.assertFalse(diff(paths[1], paths[2]))
+        # Text and attribute values with the same sequence are the same.
+        attribute = self.write("d.xml", [("id2", "ACGT")], {"id2": 1.0})
+        self.assertEqual(
+            XMLSummary(paths[0]).sequences["id2"][0],
+            XMLSummary(attribute).sequences["id2"][0],
+        )
@@ -0,0 +1,159 @@
+import json
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from dark.reads import Read
+
+from beast2xml import BEAST2XML
+from beast2xml.metrics import RenderMetrics
+
+
+class TestRenderMetrics(TestCase):
+    """
+    Test the RenderMetrics class.
+    """
+
+    def test_laps(self):
+        """
+        Each lap must record a stage with its counts.
+        """
+        metrics = RenderMetrics()
+        stopwatch = metrics.start()
+        stopwatch.lap("one", taxa=3)
+        stopwatch.lap("two")
+        self.assertEqual(["one", "two"], [record["stage"] for record in metrics.stages])
+        self.assertEqual(3, metrics.stages[0]["taxa"])
+        self.assertTrue(all(record["seconds"] >= 0.0 for record in metrics.stages))
+
+    def test_memory_growth(self):
+        """
+        When memory is tracked, each stage must record the (cumulative) peak
+        resident set size and how much the stage raised it.
+        """
+        metrics = RenderMetrics(track_memory=True)
+        with patch("beast2xml.metrics.peak_rss", side_effect=[100, 500, 500, 800]):
+            stopwatch = metrics.start()
+            for stage in "one", "two", "three":
+                stopwatch.lap(stage)
+        self.assertEqual(
+            [("one", 500, 400), ("two", 500, 0), ("three", 800, 300)],
+            [
+                (
+                    record["stage"],
+                    record["peak_rss_bytes"],
+                    record["peak_rss_growth_bytes"],
+                )
+                for record in metrics.stages
+            ],
+        )
+
+    def test_totals(self):
+        """
+        Stages recorded more than once must be totalled.
+        """
+        metrics = RenderMetrics()
+        metrics.record("one", 1.0)
+        metrics.record("two", 0.5)
+        metrics.record("one", 2.0)
+        self.assertEqual({"one": 3.0, "two": 0.5}, metrics.totals())
+
+    def test_callback(self):
+        """
+        The callback must be called with each record.
+        """
+        records = []
+        metrics = RenderMetrics(callback=records.append)
+        metrics.record("one", 1.0, bytes=10)
+        self.assertEqual([{"stage": "one", "seconds": 1.0, "bytes": 10}], records)
+
+    def test_reset(self):
+        """
+        Resetting must forget all stages.
+        """
+        metrics = RenderMetrics()
+        metrics.record("one", 1.0)
+        metrics.reset()
+        self.assertEqual({"stages": [], "totals": {}}, metrics.as_dict())
+
+    def test_to_json(self):
+        """
+        The stages and totals must be written as JSON.
+        """
+        metrics = RenderMetrics()
+        metrics.record("one", 1.0, taxa=2)
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, "metrics.json")
+            metrics.to_json(path)
+            with open(path) as fp:
+                self.assertEqual(metrics.as_dict(), json.load(fp))
+
+    def test_report(self):
+        """
+        The report must have one line per stage, with its counts.
+        """
+        metrics = RenderMetrics()
+        metrics.record("one", 1.0, taxa=2)
+        metrics.record("two", 3.0)
+        lines = metrics.report().split("\n")
+        self.assertEqual(2, len(lines))
+        self.assertIn("25.0%", lines[0])
+        self.assertIn("taxa=2", lines[0])
+
+
+class TestBEAST2XMLMetrics(TestCase):
+    """
+    Test the stages recorded by BEAST2XML.
+    """
+
+    def test_render_stages(self):
+        """
+        Building and rendering must record each stage, with counts.
+        """
+        xml = BEAST2XML()
+        xml.add_sequences([Read("id1", "ACGT"), Read("id2", "ACGA")])
+        xml.add_ages({"id1": 1.0, "id2": 2.0})
+        result = xml.to_string()
+        self.assertEqual(
+            [
+                "template",
+                "add_sequences",
+                "add_ages",
+                "find_elements",
+                "initial_tree",
+                "sequences",
+                "trait",
+                "settings",
+                "indent",
+                "serialise",
+            ],
+            [record["stage"] for record in xml.metrics.stages],
+        )
+        totals = {record["stage"]: record for record in xml.metrics.stages}
+        self.assertEqual(2, totals["sequences"]["taxa"])
+        self.assertEqual(4, totals["sequences"]["sites"])
+        self.assertEqual(len(result), totals["serialise"]["bytes"])
+
+    def test_to_xml_bytes(self):
+        """
+        Writing XML to a file must record the number of bytes written.
+        """
+        xml = BEAST2XML()
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, "out.xml")
+            xml.to_xml(path)
+            self.assertEqual(
+                os.path.getsize(path), xml.metrics.stages[-1]["bytes"]
+            )
+        self.assertEqual("write", xml.metrics.stages[-1]["stage"])
+
+    def test_shared_metrics(self):
+        """
+        Builders given the same metrics must record into it.
+        """
+        stages = []
+        metrics = RenderMetrics(callback=lambda record: stages.append(record["stage"]))
+        BEAST2XML(metrics=metrics)
+        BEAST2XML(metrics=metrics)
+        self.assertEqual(["template", "template"], stages)
@@ -0,0 +1,462 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+import xml.etree.ElementTree as ET
+
+from dark.reads import Read
+
+from beast2xml import BEAST2XML
+from beast2xml.partitions import (
+    columns_filter,
+    filter_columns,
+    partition_filters,
+    read_bed,
+    read_gff,
+    site_classes,
+)
+
+
+class TestPartitionFilters(TestCase):
+    """
+    Test reading partition regions and making their filters.
+    """
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.dir = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_read_bed(self):
+        """
+        BED coordinates must be converted to 1-based inclusive ones, and
+        unnamed regions named by their coordinates.
+        """
+        path = os.path.join(self.dir, "regions.bed")
+        with open(path, "w") as fp:
+            fp.write("track name=genes\nchr\t0\t300\tgag\nchr\t300\t600\n")
+        self.assertEqual([("gag", 1, 300), ("301-600", 301, 600)], read_bed(path))
+
+    def test_read_gff(self):
+        """
+        Only features of the given type must be read from a GFF file, and
+        nothing after a ##FASTA line.
+        """
+        path = os.path.join(self.dir, "genes.gff")
+        with open(path, "w") as fp:
+            fp.write(
+                "##gff-version 3\n"
+                "chr\t.\tgene\t1\t300\t.\t+\t.\tID=gene1\n"
+                "chr\t.\tCDS\t1\t300\t.\t+\t0\tID=cds1;Name=gag\n"
+                "chr\t.\tCDS\t301\t600\t.\t+\t0\tID=cds2\n"
+                "##FASTA\n>chr\nACGT\n"
+            )
+        self.assertEqual(
+            [("gag", 1, 300, ((1, 300, 0),)), ("cds2", 301, 600, ((301, 600, 0),))],
+            read_gff(path),
+        )
+        self.assertEqual(3, len(read_gff(path, feature_type=None)))
+
+    def test_read_gff_segments(self):
+        """
+        A feature split over several lines must be read as one region with
+        its segments, and give one partition per codon position counted along
+        the joined segments.
+        """
+        path = os.path.join(self.dir, "genes.gff")
+        with open(path, "w") as fp:
+            fp.write(
+                "##gff-version 3\n"
+                "chr\t.\tCDS\t266\t13468\t.\t+\t0\tID=cds1;Name=orf1ab\n"
+                "chr\t.\tCDS\t13468\t21555\t.\t+\t0\tID=cds1;Name=orf1ab\n"
+                "chr\t.\tCDS\t21563\t25384\t.\t+\t0\tID=cds2;Name=S\n"
+            )
+        regions = read_gff(path)
+        self.assertEqual(
+            [
+                ("orf1ab", 266, 21555, ((266, 13468, 0), (13468, 21555, 0))),
+                ("S", 21563, 25384, ((21563, 25384, 0),)),
+            ],
+            regions,
+        )
+        self.assertEqual(
+            [
+                ("alignment.orf1ab", "266-13468,13468-21555"),
+                ("alignment.S", "21563-25384"),
+            ],
+            partition_filters("alignment", regions),
+        )
+        self.assertEqual(
+            ("alignment.orf1ab.codon2", "267-13468\\3,13469-21555\\3"),
+            partition_filters("alignment", regions, True)[1],
+        )
+
+    def test_gtf_exons(self):
+        """
+        The exons of a GTF gene_id must be joined, with codon positions found
+        from the length of the earlier exons when there are no phases.
+        """
+        path = os.path.join(self.dir, "genes.gtf")
+        with open(path, "w") as fp:
+            fp.write(
+                'chr\t.\texon\t1\t10\t.\t+\t.\tgene_id "g1"; transcript_id "t1";\n'
+                'chr\t.\texon\t11\t20\t.\t+\t.\tgene_id "g1"; transcript_id "t1";\n'
+            )
+        regions = read_gff(path, feature_type="exon")
+        self.assertEqual([("g1", 1, 20, ((1, 10, None), (11, 20, None)))], regions)
+        self.assertEqual(
+            [
+                ("alignment.g1.codon1", "1-10\\3,13-20\\3"),
+                ("alignment.g1.codon2", "2-10\\3,11-20\\3"),
+                ("alignment.g1.codon3", "3-10\\3,12-20\\3"),
+            ],
+            partition_filters("alignment", regions, True),
+        )
+
+    def test_codon_positions(self):
+        """
+        Codon position partitions of the whole alignment must use stride
+        filters.
+        """
+        self.assertEqual(
+            [
+                ("alignment.codon1", "1::3"),
+                ("alignment.codon2", "2::3"),
+                ("alignment.codon3", "3::3"),
+            ],
+            partition_filters("alignment", codon_positions=True),
+        )
+
+    def test_regions_and_codon_positions(self):
+        """
+        Codon positions must be counted from the start of each region, and
+        region names made safe for use in ids.
+        """
+        self.assertEqual(
+            [
+                ("alignment.env_1.codon1", "4-12\\3"),
+                ("alignment.env_1.codon2", "5-12\\3"),
+                ("alignment.env_1.codon3", "6-12\\3"),
+            ],
+            partition_filters("alignment", [("env 1", 4, 12)], True),
+        )
+
+    def test_nothing_to_partition(self):
+        """
+        Giving neither regions nor codon positions must raise a ValueError.
+        """
+        error = "^Either regions or codon_positions must be given.$"
+        self.assertRaisesRegex(ValueError, error, partition_filters, "alignment")
+
+    def test_invalid_region(self):
+        """
+        A region ending before it starts must raise a ValueError.
+        """
+        error = r"^Invalid partition region 'gag': 10-5.$"
+        self.assertRaisesRegex(
+            ValueError, error, partition_filters, "alignment", [("gag", 10, 5)]
+        )
+
+    def test_duplicate_region(self):
+        """
+        Two regions with the same name must raise a ValueError.
+        """
+        error = "^Duplicate partition name 'gag'.$"
+        self.assertRaisesRegex(
+            ValueError,
+            error,
+            partition_filters,
+            "alignment",
+            [("gag", 1, 3), ("gag", 4, 6)],
+        )
+
+    def test_filter_columns(self):
+        """
+        Every form of filter must select the right 0-based columns.
+        """
+        self.assertEqual([0, 1, 2], filter_columns("1-3", 9).tolist())
+        self.assertEqual([1, 4, 7], filter_columns("2::3", 9).tolist())
+        self.assertEqual([2, 5], filter_columns("3-8\\3", 9).tolist())
+        self.assertEqual([0, 4, 5, 8], filter_columns("1,5-6,9", 9).tolist())
+        self.assertEqual(list(range(4)), filter_columns("-", 4).tolist())
+
+    def test_filter_beyond_alignment(self):
+        """
+        A filter going past the end of the alignment must raise a ValueError.
+        """
+        error = r"^Alignment filter '1-10' goes beyond the alignment length \(9\).$"
+        self.assertRaisesRegex(ValueError, error, filter_columns, "1-10", 9)
+
+    def test_columns_filter(self):
+        """
+        Runs of consecutive columns must be written as ranges.
+        """
+        self.assertEqual("1-3,5,8-9", columns_filter([0, 1, 2, 4, 7, 8]))
+
+
+class TestSiteClasses(TestCase):
+    """
+    Test finding constant and all-missing alignment columns.
+    """
+
+    def test_site_classes(self):
+        """
+        Constant columns must be given their base and all-missing columns must
+        not be variable. Case must be ignored.
+        """
+        variable, constant = site_classes(["ACGT-aN", "ACGA-TN", "aCGT?AN"])
+        self.assertEqual(
+            [False, False, False, True, False, True, False], variable.tolist()
+        )
+        self.assertEqual([0, 1, 2, -1, -1, -1, -1], constant.tolist())
+
+    def test_unequal_lengths(self):
+        """
+        Sequences of different lengths must raise a ValueError.
+        """
+        error = "^All sequences must have the same length to find invariant sites.$"
+        self.assertRaisesRegex(ValueError, error, site_classes, ["ACGT", "ACG"])
+
+
+class TestPartitionAlignment(TestCase):
+    """
+    Test partitioning the alignment of a BEAST2XML instance.
+    """
+
+    def render(self, clock_model="strict"):
+        xml = BEAST2XML(clock_model=clock_model)
+        xml.add_sequences([Read("id1", "ACGTACGTA"), Read("id2", "ACGTACGTT")])
+        xml.partition_alignment([("gag", 1, 6), ("pol", 7, 9)])
+        return ET.fromstring(xml.to_string())
+
+    def test_data_elements(self):
+        """
+        Each partition must be a FilteredAlignment of the alignment, which
+        must still hold the sequences.
+        """
+        root = self.render()
+        data = root.findall("data")
+        self.assertEqual(
+            ["alignment", "alignment.gag", "alignment.pol"],
+            [element.get("id") for element in data],
+        )
+        self.assertEqual(2, len(data[0].findall("sequence")))
+        self.assertEqual(
+            [
+                ("FilteredAlignment", "1-6", "@alignment"),
+                ("FilteredAlignment", "7-9", "@alignment"),
+            ],
+            [
+                (element.get("spec"), element.get("filter"), element.get("data"))
+                for element in data[1:]
+            ],
+        )
+
+    def test_linked_likelihoods(self):
+        """
+        Every clock model must give one tree likelihood per partition, all
+        sharing the tree, site model and clock model of the first.
+        """
+        for clock_model in (
+            "strict",
+            "random-local",
+            "relaxed-exponential",
+            "relaxed-lognormal",
+        ):
+            root = self.render(clock_model)
+            likelihood = root.find(
+                "./run/distribution/distribution[@id='likelihood']"
+            )
+            first, second = likelihood.findall("distribution")
+            self.assertEqual("@alignment.gag", first.get("data"))
+            self.assertEqual("@alignment.pol", second.get("data"))
+            self.assertEqual(first.get("tree"), second.get("tree"))
+            self.assertEqual(
+                "@" + first.find("siteModel").get("id"), second.get("siteModel")
+            )
+            self.assertEqual(
+                "@" + first.find("branchRateModel").get("id"),
+                second.get("branchRateModel"),
+            )
+            self.assertEqual([], list(second))
+
+    def test_logged_likelihoods(self):
+        """
+        The trace log must log each partition likelihood instead of the
+        original one.
+        """
+        root = self.render()
+        idrefs = [
+            log.get("idref")
+            for log in root.find("./run/logger[@id='tracelog']")
+            if log.get("idref")
+        ]
+        self.assertNotIn("treeLikelihood.alignment", idrefs)
+        self.assertIn("treeLikelihood.alignment.gag", idrefs)
+        self.assertIn("treeLikelihood.alignment.pol", idrefs)
+
+    def test_partition_twice(self):
+        """
+        Partitioning an alignment twice must raise a ValueError.
+        """
+        xml = BEAST2XML()
+        xml.partition_alignment(codon_positions=True)
+        error = "^The alignment has already been partitioned.$"
+        self.assertRaisesRegex(
+            ValueError, error, xml.partition_alignment, codon_positions=True
+        )
+
+
+class TestLikelihoodOptions(TestCase):
+    """
+    Test the threading and ambiguity options of the tree likelihoods.
+    """
+
+    def likelihood(self, xml, **kwargs):
+        root = ET.fromstring(xml.to_string(**kwargs))
+        return root.find("./run/distribution/distribution[@id='likelihood']")
+
+    def test_unchanged_by_default(self):
+        """
+        If no options are given, the template values must be kept.
+        """
+        likelihood = self.likelihood(BEAST2XML())
+        self.assertEqual("true", likelihood.get("useThreads"))
+        self.assertIsNone(likelihood.get("threads"))
+        self.assertIsNone(likelihood.find("distribution").get("useAmbiguities"))
+
+    def test_all_templates(self):
+        """
+        The options must be set in every bundled template.
+        """
+        for clock_model in (
+            "strict",
+            "random-local",
+            "relaxed-exponential",
+            "relaxed-lognormal",
+        ):
+            likelihood = self.likelihood(
+                BEAST2XML(clock_model=clock_model),
+                threads=8,
+                partition_threads=2,
+                use_ambiguities=True,
+            )
+            self.assertEqual("true", likelihood.get("useThreads"))
+            self.assertEqual("8", likelihood.get("threads"))
+            tree_likelihood = likelihood.find("distribution")
+            self.assertEqual("2", tree_likelihood.get("threads"))
+            self.assertEqual("true", tree_likelihood.get("useAmbiguities"))
+
+    def test_one_thread(self):
+        """
+        Asking for one thread must turn off threading.
+        """
+        likelihood = self.likelihood(BEAST2XML(), threads=1)
+        self.assertEqual("false", likelihood.get("useThreads"))
+
+    def test_invalid_threads(self):
+        """
+        A thread count that is not a positive integer must raise a ValueError.
+        """
+        error = "^threads must be a positive integer.$"
+        self.assertRaisesRegex(ValueError, error, BEAST2XML().to_string, threads=0)
+
+    def test_partition_threads_by_id(self):
+        """
+        Threads must be allocated to partitions by their data id.
+        """
+        xml = BEAST2XML()
+        xml.partition_alignment(codon_positions=True)
+        likelihood = self.likelihood(
+            xml, partition_threads={"alignment.codon1": 1, "alignment.codon3": 3}
+        )
+        self.assertEqual(
+            ["1", None, "3"],
+            [element.get("threads") for element in likelihood.findall("distribution")],
+        )
+
+    def test_unknown_partition_threads(self):
+        """
+        Allocating threads to an unknown partition must raise a ValueError.
+        """
+        error = r"^Unknown partition\(s\) in partition_threads: gag.$"
+        self.assertRaisesRegex(
+            ValueError, error, BEAST2XML().to_string, partition_threads={"gag": 2}
+        )
+
+
+class TestStripInvariantSites(TestCase):
+    """
+    Test writing only the variable sites of an alignment.
+    """
+
+    def setUp(self):
+        self.xml = BEAST2XML()
+        self.xml.add_sequences(
+            [
+                Read("id1", "ACGTACGTA-"),
+                Read("id2", "ACGTTCGTT-"),
+                Read("id3", "ACGTACGTA-"),
+            ]
+        )
+
+    def test_strip(self):
+        """
+        Only variable sites must be written, with the likelihood computed from
+        a FilteredAlignment giving the number of constant sites of each base.
+        """
+        root = ET.fromstring(self.xml.to_string(strip_invariant_sites=True))
+        self.assertEqual(
+            ["AA", "TT", "AA"],
+            [sequence.get("value") for sequence in root.iter("sequence")],
+        )
+        variable = root.find("data[@id='alignment.variable']")
+        self.assertEqual("FilteredAlignment", variable.get("spec"))
+        self.assertEqual("-", variable.get("filter"))
+        self.assertEqual("1 2 2 2", variable.get("constantSiteWeights"))
+        self.assertEqual(
+            "@alignment.variable",
+            root.find(".//distribution[@id='treeLikelihood.alignment']").get("data"),
+        )
+
+    def test_render_again_without_stripping(self):
+        """
+        Rendering without stripping after rendering with it must write the
+        full alignment.
+        """
+        self.xml.to_string(strip_invariant_sites=True)
+        root = ET.fromstring(self.xml.to_string())
+        self.assertIsNone(root.find("data[@id='alignment.variable']"))
+        self.assertEqual("ACGTACGTA-", root.find(".//sequence").get("value"))
+        self.assertEqual(
+            "@alignment",
+            root.find(".//distribution[@id='treeLikelihood.alignment']").get("data"),
+        )
+
+    def test_partitions(self):
+        """
+        Partition filters must be remapped to the variable sites and each
+        partition given its own constant site counts.
+        """
+        self.xml.partition_alignment([("gag", 1, 6), ("pol", 5, 10)])
+        for _ in range(2):
+            root = ET.fromstring(self.xml.to_string(strip_invariant_sites=True))
+            self.assertEqual(
+                [("1", "1 2 1 1"), ("1-2", "0 1 1 1")],
+                [
+                    (element.get("filter"), element.get("constantSiteWeights"))
+                    for element in root.findall("data[@spec='FilteredAlignment']")
+                ],
+            )
+
+    def test_no_variable_sites(self):
+        """
+        An alignment with no variable sites must raise a ValueError.
+        """
+        xml = BEAST2XML()
+        xml.add_sequences([Read("id1", "ACGT"), Read("id2", "ACGT")])
+        error = "^The alignment has no variable sites.$"
+        self.assertRaisesRegex(
+            ValueError, error, xml.to_string, strip_invariant_sites=True
+        )
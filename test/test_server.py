@@ -0,0 +1,294 @@
+import argparse
+import json
+import os
+import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from dark.reads import Read
+from six import assertRaisesRegex
+
+from beast2xml import BEAST2XML
+from beast2xml.cli import add_arguments, request_from_args
+from beast2xml.client import send_request
+from beast2xml.server import (
+    RenderService,
+    UnixRenderServer,
+    make_server,
+    render_request,
+)
+
+FASTA = ">id1\nACGT\n>id2\nACGA\n"
+
+
+def expected_xml(**kwargs):
+    xml = BEAST2XML()
+    xml.add_sequences([Read("id1", "ACGT"), Read("id2", "ACGA")])
+    xml.add_age("id1", 3.0)
+    return xml.to_string(**kwargs)
+
+
+class TestRequestFromArgs(TestCase):
+    """
+    Test making render requests from command line options.
+    """
+
+    def parse(self, *args):
+        parser = argparse.ArgumentParser()
+        add_arguments(parser)
+        return request_from_args(parser.parse_args(args))
+
+    def test_ages(self):
+        """
+        Ages given with --age must be in the request.
+        """
+        request = self.parse("--age", "id1=3", "id2=4.5", "--age", "id3=1")
+        self.assertEqual({"id1": 3.0, "id2": 4.5, "id3": 1.0}, request["ages"])
+
+    def test_default_log_every(self):
+        """
+        Log intervals must default to 2000, unless logging is planned.
+        """
+        self.assertEqual(2000, self.parse()["to_xml"]["tree_log_every"])
+        request = self.parse("--target_samples", "100")
+        self.assertIsNone(request["to_xml"]["tree_log_every"])
+        self.assertEqual(100, request["to_xml"]["target_samples"])
+
+
+class TestRenderRequest(TestCase):
+    """
+    Test rendering a request.
+    """
+
+    def test_fasta(self):
+        """
+        Sequences given as text must be rendered as BEAST2XML would.
+        """
+        response = render_request(
+            {"fasta": FASTA, "ages": {"id1": 3}, "to_xml": {"chain_length": 10}}
+        )
+        self.assertEqual("ok", response["status"])
+        self.assertIsNone(response["logging_plan"])
+        self.assertEqual(expected_xml(chain_length=10), response["xml"])
+
+    def test_output(self):
+        """
+        A request with an output path must write the XML there.
+        """
+        with TemporaryDirectory() as directory:
+            fasta = os.path.join(directory, "seqs.fasta")
+            with open(fasta, "w") as fp:
+                fp.write(FASTA)
+            output = os.path.join(directory, "out.xml")
+            response = render_request(
+                {"fasta_file": fasta, "ages": {"id1": 3}, "output": output}
+            )
+            self.assertIsNone(response["xml"])
+            with open(output) as fp:
+                self.assertEqual(expected_xml(), fp.read())
+            self.assertEqual(["out.xml", "seqs.fasta"], sorted(os.listdir(directory)))
+
+    def test_logging_plan(self):
+        """
+        A request with target_samples must have a logging plan, with given
+        intervals overriding those of the plan, and the numbers and sizes of
+        samples estimated from the intervals used.
+        """
+        planned = render_request(
+            {
+                "fasta": FASTA,
+                "to_xml": {"chain_length": 1000000, "target_samples": 1000},
+            }
+        )["logging_plan"]
+        plan = render_request(
+            {
+                "fasta": FASTA,
+                "to_xml": {
+                    "chain_length": 1000000,
+                    "target_samples": 1000,
+                    "trace_log_every": 10,
+                    "screen_log_every": 7,
+                },
+            }
+        )["logging_plan"]
+        self.assertEqual(1000, plan["tree_log_every"])
+        self.assertEqual(10, plan["trace_log_every"])
+        self.assertEqual(7, plan["screen_log_every"])
+        self.assertEqual(1001, plan["tree_samples"])
+        self.assertEqual(100001, plan["trace_samples"])
+        self.assertEqual(planned["tree_log_bytes"], plan["tree_log_bytes"])
+        self.assertEqual(
+            100001 * planned["trace_log_bytes"] // planned["trace_samples"],
+            plan["trace_log_bytes"],
+        )
+
+    def test_unknown_key(self):
+        """
+        A request with an unknown key must cause a ValueError.
+        """
+        error = "^Unknown request key\\(s\\): fastq_file\\.$"
+        assertRaisesRegex(
+            self, ValueError, error, render_request, {"fastq_file": "x"}
+        )
+
+
+class TestServers(TestCase):
+    """
+    Test sending requests to servers.
+    """
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.service = RenderService(executor=ThreadPoolExecutor(2))
+
+    def tearDown(self):
+        self.service.executor.shutdown()
+        self.tmp.cleanup()
+
+    def start(self, **kwargs):
+        server = make_server(service=self.service, **kwargs)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+
+        def stop():
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+        self.addCleanup(stop)
+        return server
+
+    def test_unix_socket(self):
+        """
+        Requests sent to a Unix socket must be rendered, and the socket must
+        only be accessible by its owner.
+        """
+        path = os.path.join(self.tmp.name, "beast2-xml.sock")
+        self.start(socket_path=path)
+        self.assertEqual(0o600, stat.S_IMODE(os.stat(path).st_mode))
+        response = send_request(
+            {"fasta": FASTA, "ages": {"id1": 3}}, socket_path=path, timeout=30
+        )
+        self.assertEqual(expected_xml(), response["xml"])
+
+    def test_http(self):
+        """
+        Requests sent over HTTP must be rendered.
+        """
+        server = self.start(port=0)
+        url = "http://127.0.0.1:%d" % server.server_address[1]
+        response = send_request({"fasta": FASTA, "ages": {"id1": 3}}, url=url)
+        self.assertEqual(expected_xml(), response["xml"])
+        self.assertEqual(1, self.service.status()["requests"])
+
+    def post(self, server, headers):
+        connection = HTTPConnection("127.0.0.1", server.server_address[1])
+        self.addCleanup(connection.close)
+        body = json.dumps({"fasta": FASTA, "output": self.tmp.name + "/out.xml"})
+        connection.request("POST", "/render", body=body, headers=headers)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def test_http_forbidden(self):
+        """
+        HTTP render requests that a web page could send (without a JSON
+        Content-Type, with an Origin header, or with a Host that is not
+        localhost) must be rejected without being rendered.
+        """
+        server = self.start(port=0)
+        json_type = {"Content-Type": "application/json"}
+        for headers, status, error in (
+            (
+                {"Content-Type": "text/plain"},
+                415,
+                "Content-Type must be application/json.",
+            ),
+            ({}, 415, "Content-Type must be application/json."),
+            (dict(json_type, Origin="https://example.com"), 403, "Forbidden origin."),
+            (dict(json_type, Host="attacker.example.com:80"), 403, "Forbidden host."),
+        ):
+            self.assertEqual(
+                (status, {"status": "error", "error": error}),
+                self.post(server, headers),
+            )
+        self.assertEqual(0, self.service.status()["requests"])
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "out.xml")))
+        status, response = self.post(
+            server, dict(json_type, Host="localhost:%d" % server.server_address[1])
+        )
+        self.assertEqual((200, "ok"), (status, response["status"]))
+
+    def test_error(self):
+        """
+        A request that cannot be rendered must get an error response.
+        """
+        path = os.path.join(self.tmp.name, "beast2-xml.sock")
+        self.start(socket_path=path)
+        response = send_request(
+            {"fasta": FASTA, "clock_model": "nonexistent"}, socket_path=path
+        )
+        self.assertEqual("error", response["status"])
+        self.assertIn("nonexistent", response["error"])
+
+    def test_template_reloaded(self):
+        """
+        A template that changes on disk must be parsed again.
+        """
+        template = os.path.join(self.tmp.name, "template.xml")
+        xml = BEAST2XML()
+        xml.to_xml(template, chain_length=10)
+        first = render_request({"template": template})["xml"]
+        xml.to_xml(template, chain_length=20)
+        os.utime(template, (time.time() + 10,) * 2)
+        second = render_request({"template": template})["xml"]
+        self.assertIn('chainLength="10"', first)
+        self.assertIn('chainLength="20"', second)
+
+    def test_socket_path_not_a_socket(self):
+        """
+        A socket path holding something other than a socket must cause a
+        ValueError, and must not be removed.
+        """
+        path = os.path.join(self.tmp.name, "results.xml")
+        with open(path, "w") as fp:
+            fp.write("<beast/>")
+        error = "^'.*results\\.xml' exists and is not a socket\\.$"
+        assertRaisesRegex(self, ValueError, error, UnixRenderServer, path, self.service)
+        with open(path) as fp:
+            self.assertEqual("<beast/>", fp.read())
+
+    def test_stale_socket_replaced(self):
+        """
+        A socket left at the socket path (e.g. by a server that was killed)
+        must be replaced.
+        """
+        path = os.path.join(self.tmp.name, "beast2-xml.sock")
+        UnixRenderServer(path, self.service).socket.close()
+        self.assertTrue(os.path.exists(path))
+        self.start(socket_path=path)
+        response = send_request({"fasta": FASTA, "ages": {"id1": 3}}, socket_path=path)
+        self.assertEqual("ok", response["status"])
+
+
+class TestProcessPool(TestCase):
+    """
+    Test rendering in the default pool of warm worker processes.
+    """
+
+    def test_render(self):
+        """
+        Requests must be rendered in worker processes, and errors reported.
+        """
+        service = RenderService(workers=1)
+        try:
+            response = service.handle({"fasta": FASTA, "ages": {"id1": 3}})
+            self.assertEqual(expected_xml(), response["xml"])
+            response = service.handle({"fasta": FASTA, "clock_model": "nonexistent"})
+            self.assertEqual("error", response["status"])
+            self.assertEqual(2, service.status()["requests"])
+        finally:
+            service.close()
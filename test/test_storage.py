@@ -0,0 +1,182 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+import xml.etree.ElementTree as ET
+
+from dark.reads import Read
+
+from beast2xml import BEAST2XML
+from beast2xml.storage import DiskReads, parse_size
+
+
+class TestParseSize(TestCase):
+    """
+    Test the parse_size function.
+    """
+
+    def test_int(self):
+        """
+        An int must be returned unchanged.
+        """
+        self.assertEqual(1000, parse_size(1000))
+
+    def test_suffixes(self):
+        """
+        K, M, G and T suffixes (optionally followed by B) must be powers of
+        1024, and case must be ignored.
+        """
+        self.assertEqual(2048, parse_size("2K"))
+        self.assertEqual(3 * 1024**2, parse_size("3MB"))
+        self.assertEqual(1024**3 // 2, parse_size("0.5g"))
+        self.assertEqual(1024**4, parse_size("1T"))
+        self.assertEqual(77, parse_size("77"))
+
+    def test_invalid(self):
+        """
+        A size that cannot be understood must raise a ValueError.
+        """
+        error = "^Could not understand the size 'lots'.$"
+        self.assertRaisesRegex(ValueError, error, parse_size, "lots")
+
+
+class TestDiskReads(TestCase):
+    """
+    Test the DiskReads class.
+    """
+
+    def setUp(self):
+        self.reads = DiskReads(
+            [Read("id3 x", "ACGT"), Read("id1", "AA"), Read("id2", "CCC")]
+        )
+
+    def test_iterate(self):
+        """
+        Sequences must be read back in the order they were added.
+        """
+        self.assertEqual(
+            [("id3 x", "ACGT"), ("id1", "AA"), ("id2", "CCC")],
+            [(read.id, read.sequence) for read in self.reads],
+        )
+        self.assertEqual(3, len(self.reads))
+
+    def test_add(self):
+        """
+        Sequences added after iterating must be stored.
+        """
+        list(self.reads)
+        self.reads.add(Read("id4", "G"))
+        self.assertEqual("G", list(self.reads)[-1].sequence)
+
+    def test_ids(self):
+        """
+        The ids must be given in the order the sequences were added.
+        """
+        self.assertEqual(["id3 x", "id1", "id2"], self.reads.ids())
+
+    def test_subset(self):
+        """
+        A subset must select sequences by index.
+        """
+        self.assertEqual(
+            ["CCC", "ACGT"],
+            [read.sequence for read in self.reads.subset([2, 0])],
+        )
+
+    def test_filter_ids(self):
+        """
+        Filtering must select sequences by id.
+        """
+        self.assertEqual(
+            ["AA"],
+            [read.sequence for read in self.reads.filter_ids(lambda id_: id_ == "id1")],
+        )
+
+
+class TestMemoryLimit(TestCase):
+    """
+    Test building XML within a memory limit.
+    """
+
+    def xml(self, memory_limit=None):
+        xml = BEAST2XML(memory_limit=memory_limit)
+        xml.add_sequences(
+            [Read("id2", "ACGT"), Read("id1", "AC&T"), Read("id3", "ACGA")]
+        )
+        xml.add_ages({"id1": 1.0, "id2": 2.0})
+        return xml
+
+    def test_no_limit(self):
+        """
+        Without a memory limit, sequences must be kept in memory and memory
+        must not be tracked.
+        """
+        xml = self.xml()
+        self.assertEqual("memory", xml.memory_report()["sequence_storage"])
+        self.assertEqual([], xml.memory_report()["stages"])
+
+    def test_large_limit(self):
+        """
+        Sequences within a memory limit must be kept in memory.
+        """
+        report = self.xml(memory_limit="1T").memory_report()
+        self.assertEqual("memory", report["sequence_storage"])
+        self.assertEqual("tree", report["output"])
+
+    def test_spill(self):
+        """
+        Sequences exceeding a memory limit must be moved to disk, and the peak
+        memory of each stage recorded.
+        """
+        report = self.xml(memory_limit=1).memory_report()
+        self.assertEqual(1, report["memory_limit"])
+        self.assertEqual("disk", report["sequence_storage"])
+        self.assertEqual("streaming", report["output"])
+        self.assertIn("spill_sequences", [stage for stage, _, _ in report["stages"]])
+
+    def test_streamed_output(self):
+        """
+        Streaming the sequences from disk must write the same XML as building
+        them into the tree.
+        """
+        with TemporaryDirectory() as directory:
+            outputs = []
+            for memory_limit in None, 1:
+                path = os.path.join(directory, "%s.xml" % memory_limit)
+                self.xml(memory_limit).to_xml(path, default_age=5.0)
+                with open(path) as fp:
+                    outputs.append(fp.read())
+        self.assertEqual(outputs[0], outputs[1])
+        data = BEAST2XML.find_elements(ET.ElementTree(ET.fromstring(outputs[1])))
+        self.assertEqual(
+            ["id1", "id2", "id3"], [sequence.get("taxon") for sequence in data["data"]]
+        )
+        self.assertEqual("AC&T", data["data"][0].get("value"))
+
+    def test_spilled_strip_invariant_sites(self):
+        """
+        Stripping invariant sites from sequences kept on disk must write the
+        same XML as stripping them in memory.
+        """
+        with TemporaryDirectory() as directory:
+            outputs = []
+            for memory_limit in None, 1:
+                path = os.path.join(directory, "%s.xml" % memory_limit)
+                self.xml(memory_limit).to_xml(path, strip_invariant_sites=True)
+                with open(path) as fp:
+                    outputs.append(fp.read())
+        self.assertEqual(outputs[0], outputs[1])
+        root = ET.fromstring(outputs[1])
+        self.assertEqual(
+            ["&T", "GT", "GA"],
+            [sequence.get("value") for sequence in root.iter("sequence")],
+        )
+
+    def test_spilled_subsample(self):
+        """
+        A sequence mask must select sequences kept on disk.
+        """
+        xml = self.xml(memory_limit=1)
+        root = ET.fromstring(xml.to_string(sequence_mask=[False, True, True]))
+        self.assertEqual(
+            ["id1", "id3"], [sequence.get("taxon") for sequence in root.iter("sequence")]
+        )
@@ -0,0 +1,153 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+from six import assertRaisesRegex
+
+from beast2xml.trace import TraceLog, ess, hpd
+
+HEADER = "# BEAST v2.7.5\n# Generated by a test\nSample\tposterior\tclockRate\n"
+
+
+def tracer_ess(values, max_lag=2000):
+    """
+    Compute an effective sample size as Tracer does, one lag at a time.
+    """
+    samples = len(values)
+    mean = values.mean()
+    lags = min(samples, max_lag)
+    gamma = np.zeros(lags)
+    lag = 0
+    while lag < lags:
+        gamma[lag] = np.sum(
+            (values[: samples - lag] - mean) * (values[lag:] - mean)
+        ) / (samples - lag)
+        if lag == 0:
+            variance = gamma[0]
+        elif lag % 2 == 0:
+            if gamma[lag - 1] + gamma[lag] > 0:
+                variance += 2.0 * (gamma[lag - 1] + gamma[lag])
+            else:
+                lags = lag
+        lag += 1
+    return samples * gamma[0] / variance
+
+
+class TestSummaries(TestCase):
+    """
+    Test the ESS and HPD functions.
+    """
+
+    def test_ess(self):
+        """
+        The ESS of several traces must be that computed by Tracer.
+        """
+        rng = np.random.default_rng(1)
+        independent = rng.normal(size=1000)
+        correlated = np.cumsum(rng.normal(size=1000)) * 0.1 + independent
+        sizes = ess(np.vstack([independent, correlated]))
+        self.assertAlmostEqual(tracer_ess(independent), sizes[0])
+        self.assertAlmostEqual(tracer_ess(correlated), sizes[1])
+        self.assertAlmostEqual(tracer_ess(correlated, 50), ess(correlated, 50))
+
+    def test_ess_constant(self):
+        """
+        The ESS of a constant trace must be NaN.
+        """
+        self.assertTrue(np.isnan(ess(np.ones(10))))
+
+    def test_hpd(self):
+        """
+        The HPD interval must be the narrowest holding the given proportion of
+        samples.
+        """
+        values = np.array([0.0, 1.0, 1.1, 1.2, 1.3, 5.0])
+        self.assertEqual((1.0, 1.3), hpd(values, level=0.7))
+        lower, upper = hpd(np.vstack([values, -values]), level=0.7)
+        self.assertEqual([1.0, -1.3], list(lower))
+        self.assertEqual([1.3, -1.0], list(upper))
+
+
+class TestTraceLog(TestCase):
+    """
+    Test reading trace logs.
+    """
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "run.log")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, text, mode="w"):
+        with open(self.path, mode) as fp:
+            fp.write(text)
+
+    def test_read(self):
+        """
+        Columns must be read into arrays, skipping comments.
+        """
+        self.write(HEADER + "0\t-10.5\t0.001\n1000\t-9.5\tNaN\n")
+        log = TraceLog(self.path)
+        self.assertEqual(["Sample", "posterior", "clockRate"], log.columns)
+        self.assertEqual(2, len(log))
+        self.assertEqual([0, 1000], list(log.states))
+        self.assertEqual([-10.5, -9.5], list(log["posterior"]))
+        self.assertTrue(np.isnan(log["clockRate"][1]))
+
+    def test_tail(self):
+        """
+        update must read only complete lines added since the last read.
+        """
+        self.write(HEADER + "0\t-10.5\t0.1\n1000\t-9.5")
+        log = TraceLog(self.path, chunk_size=7)
+        self.assertEqual(1, len(log))
+        offset = log.offset
+        self.write("\t0.2\n2000\t-9.0\t0.3\n", mode="a")
+        self.assertEqual(2, log.update())
+        self.assertGreater(log.offset, offset)
+        self.assertEqual([0.1, 0.2, 0.3], list(log["clockRate"]))
+        self.assertEqual(0, log.update())
+
+    def test_many_rows(self):
+        """
+        The arrays must grow to hold many rows.
+        """
+        self.write(
+            HEADER + "".join("%d\t%d\t0.5\n" % (i * 10, -i) for i in range(3000))
+        )
+        log = TraceLog(self.path, chunk_size=1000)
+        self.assertEqual(3000, len(log))
+        self.assertEqual(-2999, log["posterior"][-1])
+
+    def test_restarted(self):
+        """
+        A log that becomes shorter must be read again from the start.
+        """
+        self.write(HEADER + "0\t-10.5\t0.1\n1000\t-9.5\t0.2\n")
+        log = TraceLog(self.path)
+        self.write(HEADER + "0\t-11.5\t0.1\n")
+        log.update()
+        self.assertEqual([-11.5], list(log["posterior"]))
+
+    def test_summary(self):
+        """
+        The summary must discard the burn-in.
+        """
+        rows = ("%d\t%d\t1.0\n" % (i, 100 if i < 10 else i % 2) for i in range(100))
+        self.write(HEADER + "".join(rows))
+        summary = TraceLog(self.path).summary(burnin=0.1)
+        self.assertEqual(0.5, summary["posterior"]["mean"])
+        self.assertEqual(0.0, summary["posterior"]["hpd_lower"])
+        self.assertEqual(1.0, summary["posterior"]["hpd_upper"])
+        self.assertTrue(np.isnan(summary["clockRate"]["ess"]))
+
+    def test_bad_line(self):
+        """
+        A line with the wrong number of values must cause a ValueError.
+        """
+        self.write(HEADER + "0\t-10.5\n")
+        error = "^The trace log .* has a line without 3 values\\.$"
+        assertRaisesRegex(self, ValueError, error, TraceLog, self.path)
@@ -0,0 +1,238 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import ete3
+from six import assertRaisesRegex
+
+import numpy as np
+
+from beast2xml.treelog import (
+    TreeLog,
+    _last_tree_line,
+    graft_tips,
+    last_tree,
+    parse_array_tree,
+)
+
+TREES = """#NEXUS
+
+Begin taxa;
+	Dimensions ntax=3;
+		Taxlabels
+			A
+			B
+			C
+			;
+End;
+Begin trees;
+	Translate
+		   1 A,
+		   2 B,
+		   3 C
+;
+tree STATE_0 = ((1:1.0,2:1.0):1.0,3:2.0):0.0;
+tree STATE_1000 = ((1[&rate=1.0]:0.5,3[&rate=1.0]:0.5)[&rate=1.0]:1.5,2:2.0):0.0;
+End;
+"""
+
+
+class TestLastTree(TestCase):
+    """
+    Test reading the last tree of a tree log.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "run.trees")
+        with open(self.path, "w") as fp:
+            fp.write(TREES)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_last_tree(self):
+        """
+        The last tree must be returned, with its leaves named by taxon and its
+        metadata ignored.
+        """
+        tree = last_tree(self.path)
+        self.assertEqual(["A", "B", "C"], sorted(tree.get_leaf_names()))
+        self.assertAlmostEqual(1.0, tree.get_distance("A", "C"))
+
+    def test_small_blocks(self):
+        """
+        The last tree line must be found when the file is read backwards in
+        blocks smaller than a line.
+        """
+        with open(self.path, "rb") as fp:
+            line = _last_tree_line(fp, block_size=7)
+        self.assertTrue(line.startswith("tree STATE_1000 = "))
+
+    def test_no_trees(self):
+        """
+        A tree log with no trees must cause a ValueError.
+        """
+        with open(self.path, "w") as fp:
+            fp.write(TREES.split("tree STATE_0")[0])
+        error = "^No trees found in "
+        assertRaisesRegex(self, ValueError, error, last_tree, self.path)
+
+
+class TestGraftTips(TestCase):
+    """
+    Test grafting new tips onto a time tree.
+    """
+
+    def test_heights(self):
+        """
+        Grafted tips must be at their given heights, and the tips already in
+        the tree must keep theirs.
+        """
+        tree = graft_tips(
+            ete3.Tree("(A:1.0,B:2.0);"), {"A": 1.0, "B": 0.0, "C": 0.5, "D": 5.0}
+        )
+        root_height = tree.get_distance("B")
+        for name, height in (("A", 1.0), ("B", 0.0), ("C", 0.5), ("D", 5.0)):
+            self.assertAlmostEqual(height, root_height - tree.get_distance(name))
+
+    def test_binary(self):
+        """
+        The tree must stay binary, with positive branch lengths.
+        """
+        tree = graft_tips(
+            ete3.Tree("(A:1.0,B:1.0);"), {"A": 0.0, "B": 0.0, "C": 0.0, "D": 3.0}
+        )
+        for node in tree.traverse():
+            self.assertIn(len(node.children), (0, 2))
+            if not node.is_root():
+                self.assertGreater(node.dist, 0.0)
+
+    def test_missing_height(self):
+        """
+        A tip of the tree without a height must cause a ValueError.
+        """
+        error = "^No height was given for tree tip\\(s\\): B\\.$"
+        assertRaisesRegex(
+            self, ValueError, error, graft_tips, ete3.Tree("(A:1,B:1);"), {"A": 0.0}
+        )
+
+
+def root_height(tree):
+    """
+    Get the root height of an C{ArrayTree} (picklable, for C{TreeLog.map}).
+    """
+    return tree.root_height
+
+
+class TestTreeLog(TestCase):
+    """
+    Test reading tree logs lazily as array trees.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "run.trees")
+        with open(self.path, "w") as fp:
+            fp.write(TREES)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_iterate(self):
+        """
+        Iterating must give each tree, with its tips numbered in translate
+        table order and internal nodes numbered from the root.
+        """
+        log = TreeLog(self.path)
+        self.assertEqual(["A", "B", "C"], log.taxa)
+        first, second = list(log)
+        self.assertEqual((0, 1000), (first.state, second.state))
+        self.assertEqual([4, 4, 3, -1, 3], list(first.parent))
+        self.assertEqual([0.0, 0.0, 0.0, 2.0, 1.0], list(first.height))
+        self.assertEqual([4, 3, 4, -1, 3], list(second.parent))
+        self.assertEqual(2.0, second.root_height)
+        self.assertEqual([0.5, 2.0, 0.5, 0.0, 1.5], list(second.branch_lengths()))
+
+    def test_tree_at(self):
+        """
+        The tree for a state must be found, and a missing state must cause a
+        KeyError.
+        """
+        log = TreeLog(self.path)
+        self.assertEqual(2, len(log))
+        self.assertEqual([0, 1000], list(log.states))
+        self.assertEqual(1000, log.tree_at(1000).state)
+        self.assertRaises(KeyError, log.tree_at, 500)
+
+    def test_to_ete3(self):
+        """
+        An array tree must convert to an ete3 tree with the same topology and
+        branch lengths.
+        """
+        log = TreeLog(self.path)
+        tree = log.tree_at(1000).to_ete3(log.taxa)
+        self.assertEqual(["A", "B", "C"], sorted(tree.get_leaf_names()))
+        self.assertAlmostEqual(1.0, tree.get_distance("A", "C"))
+        self.assertAlmostEqual(4.0, tree.get_distance("A", "B"))
+
+    def test_map(self):
+        """
+        Parsing ranges of the file must give the results in file order,
+        however the file is divided.
+        """
+        with open(self.path, "w") as fp:
+            fp.write(TREES.replace("End;\n", "", 1).rsplit("End;", 1)[0])
+            for state in range(2000, 12000, 1000):
+                fp.write("tree STATE_%d = ((1:1,2:1):%d,3:2);\n" % (state, state))
+            fp.write("End;\n")
+        log = TreeLog(self.path)
+        expected = [2.0, 2.0] + [1.0 + state for state in range(2000, 12000, 1000)]
+        for chunks in (1, 3, 7, 50):
+            self.assertEqual(expected, log.map(root_height, workers=1, chunks=chunks))
+        self.assertEqual(
+            list(log.states), [tree.state for tree in log.map(workers=1, chunks=4)]
+        )
+
+    def test_taxlabels(self):
+        """
+        A log without a translate table must use the taxa block labels.
+        """
+        with open(self.path, "w") as fp:
+            fp.write(
+                "#NEXUS\nBegin taxa;\n\tTaxlabels\n\t\tX\n\t\tY\n\t\t;\n"
+                "End;\nBegin trees;\ntree STATE_0 = (Y:1.0,X:2.0):0.0;\nEnd;\n"
+            )
+        log = TreeLog(self.path)
+        self.assertEqual(["X", "Y"], log.taxa)
+        tree = next(iter(log))
+        self.assertEqual([0.0, 1.0, 2.0], list(tree.height))
+
+    def test_unknown_tip(self):
+        """
+        A tree with a tip not in the translate table must cause a ValueError.
+        """
+        error = "^Unknown tip '4' in the tree for state 7\\.$"
+        assertRaisesRegex(
+            self,
+            ValueError,
+            error,
+            parse_array_tree,
+            "tree STATE_7 = ((1:1,4:1):1,3:2);",
+            {"1": 0, "2": 1, "3": 2},
+        )
+
+    def test_not_binary(self):
+        """
+        A tree that is not binary must cause a ValueError.
+        """
+        error = "^The tree for state 7 is not binary with 3 tips\\.$"
+        assertRaisesRegex(
+            self,
+            ValueError,
+            error,
+            parse_array_tree,
+            "tree STATE_7 = (1:1,2:1,3:1);",
+            {"1": 0, "2": 1, "3": 2},
+        )